@@ -1,12 +1,12 @@
 from .riveter import (
   Riveter,
-  load_rashkin_lexicon,
-  load_sap_lexicon,
-  train,
-  get_score_totals,
-  get_scores_for_doc,
-  count_personas_for_doc,
-  count_scored_verbs_for_doc,
-  count_nsubj_for_doc,
-  count_dobj_for_doc
-)
\ No newline at end of file
+  RiveterStats,
+  RiveterStore,
+  Lexicon,
+  PersonaMatcher,
+  ParseCache,
+  load_pipeline,
+  read_corpus,
+  DEFAULT_MODEL,
+  DEFAULT_COREF_MODEL
+)
@@ -0,0 +1,527 @@
+# Benchmarks the extraction and scoring pipeline on the bundled data and writes the results to JSON.
+# Can run from the repository root with:
+# "python -m riveter.benchmark --output results.json"
+# "python -m riveter.benchmark --stub --output new.json --compare results.json"
+#
+# --stub replaces the spaCy models with a small rule-based pipeline, so that extraction, scoring,
+# saving and the queries can be benchmarked without downloading any models.
+
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import argparse
+import importlib.metadata
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import spacy
+from spacy.language import Language
+from spacy.tokens import Doc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+if __package__:
+    # python -m riveter.benchmark, from the repository root
+    from .riveter import (Riveter, BASEPATH, COREF_COMPONENTS, DEFAULT_COREF_MODEL, DEFAULT_MODEL, EXTRACTION_COMPONENTS,
+                          PIPELINES, REVERSE_PRONOUN_MAP, load_pipeline, read_corpus)
+else:
+    # python benchmark.py, from inside riveter/
+    from riveter import (Riveter, BASEPATH, COREF_COMPONENTS, DEFAULT_COREF_MODEL, DEFAULT_MODEL, EXTRACTION_COMPONENTS,
+                         PIPELINES, REVERSE_PRONOUN_MAP, load_pipeline, read_corpus)
+
+BENCHMARK_VERSION = 1
+
+CORPORA = ['fake_stories', 'pride_and_prejudice', 'synthetic']
+MODES = ['coref', 'pattern', 'windowed']
+
+# Persona patterns for pattern mode, covering the characters of the bundled texts
+PERSONA_PATTERNS = {'elizabeth': r'\belizabeth\b|\blizzy\b',
+                    'darcy': r'\bdarcy\b',
+                    'jane': r'\bjane\b',
+                    'bingley': r'\bbingley\b',
+                    'bennet': r'\bbennet\b',
+                    'doctor': r'\bdoctor\b',
+                    'friend': r'\bfriend\b',
+                    'she': r'\bshe\b|\bher\b',
+                    'he': r'\bhe\b|\bhim\b'}
+
+QUERIES = ['get_scores_for_doc', 'count_personas_for_doc', 'count_scored_verbs_for_doc', 'count_nsubj_for_doc',
+           'count_dobj_for_doc', 'get_documents_for_verb', 'get_documents_for_persona', 'get_persona_cluster']
+
+STUB_MODEL = 'riveter-stub'
+STUB_COREF_MODEL = 'riveter-stub-coref'
+
+CHAPTER_REGEX = re.compile(r'^chapter [ivxlc]+\.?\]?\s*$', flags=re.IGNORECASE | re.MULTILINE)
+SENTENCE_REGEX = re.compile(r'(?<=[.!?])\s+')
+
+# Differences smaller than these are timer noise, rather than regressions
+NOISE_FLOORS = {'seconds': 0.05, 'p50_ms': 0.1}
+
+
+def load_fake_stories():
+    texts, text_ids = zip(*read_corpus(os.path.join(BASEPATH, 'data/fakeStories.csv'), 'text', 'i'))
+    return list(texts), list(text_ids)
+
+
+def load_pride_and_prejudice():
+    """
+    One document per chapter.
+    """
+    with open(os.path.join(BASEPATH, 'data/pride_and_prejudice.txt'), encoding='utf-8') as f:
+        chapters = [_chapter.strip() for _chapter in CHAPTER_REGEX.split(f.read())]
+    texts = [_chapter for _chapter in chapters if _chapter]
+    return texts, [f'chapter_{i}' for i in range(1, len(texts) + 1)]
+
+
+def load_synthetic(n_docs, seed=0, min_sentences=5, max_sentences=30):
+    """
+    n_docs documents of sentences drawn at random from the bundled texts, for corpora of any size.
+    """
+
+    sentences = [' '.join(_sentence.split()) for _text in load_fake_stories()[0] + load_pride_and_prejudice()[0]
+                 for _sentence in SENTENCE_REGEX.split(_text)]
+    sentences = [_sentence for _sentence in sentences if _sentence]
+
+    rng = random.Random(seed)
+    texts = [' '.join(rng.choices(sentences, k=rng.randint(min_sentences, max_sentences))) for _ in range(n_docs)]
+    return texts, [f'synthetic_{i}' for i in range(n_docs)]
+
+
+def load_benchmark_corpus(name, synthetic_docs, seed):
+    if name == 'fake_stories':
+        return load_fake_stories()
+    if name == 'pride_and_prejudice':
+        return load_pride_and_prejudice()
+    if name == 'synthetic':
+        return load_synthetic(synthetic_docs, seed)
+    raise ValueError(f'Unknown corpus "{name}", expected one of {CORPORA}')
+
+
+class StubParser:
+    """
+    A rule-based stand-in for the tagger, parser and lemmatizer: verbs are the words that inflect a lexicon verb,
+    and each sentence's first verb is its root, with the nearest noun or pronoun before it as nsubj and after it as dobj.
+    A particle right after the root is its prt, and the first preposition after that is its prep, e.g. "gave up on".
+    The parses are crude, but they have the annotations extraction reads, in realistic numbers.
+    """
+
+    PRONOUNS = frozenset(REVERSE_PRONOUN_MAP) | frozenset(['who', 'that', 'which', 'what'])
+    DETERMINERS = frozenset(['the', 'a', 'an', 'this', 'these', 'those', 'some', 'any', 'every', 'no'])
+    PARTICLES = frozenset(['up', 'down', 'out', 'off', 'away', 'back'])
+    PREPOSITIONS = frozenset(['to', 'over', 'on', 'at', 'with', 'for', 'from', 'about', 'into', 'in', 'of'])
+    IRREGULAR_VERBS = {'was': 'be', 'were': 'be', 'had': 'have', 'said': 'say', 'made': 'make', 'took': 'take', 'saw': 'see',
+                       'went': 'go', 'came': 'come', 'gave': 'give', 'told': 'tell', 'thought': 'think', 'felt': 'feel',
+                       'left': 'leave', 'found': 'find', 'knew': 'know', 'broke': 'break', 'brought': 'bring'}
+    VERB_SUFFIXES = [('ies', 'y'), ('ied', 'y'), ('ing', ''), ('ing', 'e'), ('ed', ''), ('ed', 'e'), ('es', ''), ('s', ''), ('d', '')]
+    NOMINAL_POS = frozenset(['NOUN', 'PROPN', 'PRON'])
+
+    def __init__(self, verbs):
+        self.verbs = frozenset(verbs)
+
+
+    def get_verb_lemma(self, word):
+        if word in self.verbs:
+            return word
+        if self.IRREGULAR_VERBS.get(word) in self.verbs:
+            return self.IRREGULAR_VERBS[word]
+        for _suffix, _replacement in self.VERB_SUFFIXES:
+            if word.endswith(_suffix) and word[:-len(_suffix)] + _replacement in self.verbs:
+                return word[:-len(_suffix)] + _replacement
+        return None
+
+
+    def __call__(self, doc):
+
+        pos = []
+        lemmas = []
+        for _token in doc:
+            _lemma = _token.lower_
+            if not _token.is_alpha:
+                _pos = 'PUNCT'
+            elif _lemma in self.PRONOUNS:
+                _pos = 'PRON'
+            elif _lemma in self.DETERMINERS:
+                _pos = 'DET'
+            elif _lemma in self.PARTICLES or _lemma in self.PREPOSITIONS:
+                _pos = 'ADP'
+            elif (not pos or pos[-1] != 'DET') and self.get_verb_lemma(_lemma) is not None:
+                _pos = 'VERB'
+                _lemma = self.get_verb_lemma(_lemma)
+            elif _token.text[0].isupper() and _token.i > 0 and doc[_token.i - 1].text not in ('.', '!', '?', '“', '"'):
+                _pos = 'PROPN'
+            else:
+                _pos = 'NOUN'
+            pos.append(_pos)
+            lemmas.append(_lemma)
+
+        heads = list(range(len(doc)))
+        deps = ['dep'] * len(doc)
+        start = 0
+        for i, _token in enumerate(doc):
+            if _token.text in ('.', '!', '?') or i == len(doc) - 1:
+                self.__parse_sentence(start, i + 1, pos, lemmas, heads, deps)
+                start = i + 1
+
+        return Doc(doc.vocab, words=[_token.text for _token in doc], spaces=[bool(_token.whitespace_) for _token in doc],
+                   pos=pos, lemmas=lemmas, heads=heads, deps=deps)
+
+
+    def __parse_sentence(self, start, end, pos, lemmas, heads, deps):
+
+        root = next((i for i in range(start, end) if pos[i] == 'VERB'), start)
+        for i in range(start, end):
+            heads[i] = root
+        deps[root] = 'ROOT'
+
+        if pos[root] == 'VERB':
+            after_root = root + 1
+            if after_root < end and lemmas[after_root] in self.PARTICLES:
+                deps[after_root] = 'prt'
+                after_root += 1
+            prep = next((i for i in range(after_root, end) if lemmas[i] in self.PREPOSITIONS), None)
+            if prep is not None:
+                deps[prep] = 'prep'
+
+        subj = next((i for i in range(root - 1, start - 1, -1) if pos[i] in self.NOMINAL_POS), None)
+        obj = next((i for i in range(root + 1, end) if pos[i] in self.NOMINAL_POS), None)
+        for _i, _dep in [(subj, 'nsubj'), (obj, 'dobj')]:
+            if _i is None or _i == root:
+                continue
+            deps[_i] = _dep
+            if _i - 1 >= start and _i - 1 != root and pos[_i - 1] in ('DET', 'PRON') and pos[_i] != 'PRON':
+                heads[_i - 1] = _i
+                deps[_i - 1] = 'det' if pos[_i - 1] == 'DET' else 'poss'
+
+
+def get_stub_coref_clusters(doc):
+    """
+    Clusters the noun chunks with the same root word, or pronouns of the same persona.
+    """
+    mentions = defaultdict(list)
+    for _noun_chunk in doc.noun_chunks:
+        mentions[REVERSE_PRONOUN_MAP.get(_noun_chunk.root.lower_, _noun_chunk.root.lower_)].append(_noun_chunk)
+    for i, _cluster in enumerate((_spans for _spans in mentions.values() if len(_spans) > 1), start=1):
+        doc.spans[f'coref_clusters_{i}'] = _cluster
+    return doc
+
+
+@Language.factory('riveter_stub_parser')
+def create_stub_parser(nlp, name):
+    lexicon_df = pd.read_csv(os.path.join(BASEPATH, 'data/sap-lexicon/agency_power.csv'))
+    return StubParser(lexicon_df['verb'].str.strip().str.lower().tolist())
+
+
+@Language.component('riveter_stub_coref')
+def stub_coref(doc):
+    return get_stub_coref_clusters(doc)
+
+
+def register_stub_pipelines():
+    """
+    Registers the stub pipelines with load_pipeline(), under STUB_MODEL and (STUB_MODEL, STUB_COREF_MODEL).
+    """
+
+    nlp = spacy.blank('en')
+    nlp.add_pipe('riveter_stub_parser', name='parser')
+    PIPELINES[(STUB_MODEL, None)] = nlp
+
+    nlp_coref = spacy.blank('en')
+    nlp_coref.add_pipe('riveter_stub_parser', name='parser')
+    nlp_coref.add_pipe('riveter_stub_coref', name='coref')
+    PIPELINES[(STUB_MODEL, STUB_COREF_MODEL)] = nlp_coref
+
+
+def get_peak_rss_mb():
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak_rss / 2**20 if sys.platform == 'darwin' else peak_rss / 2**10
+
+
+def time_stage(stages, name, n_docs, function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    stages[name] = {'seconds': seconds,
+                    'docs_per_sec': n_docs / seconds if seconds > 0 else None,
+                    'peak_rss_mb': get_peak_rss_mb()}
+    return result
+
+
+def time_queries(riveter, doc_ids, verbs, personas, num_queries, rng):
+    """
+    Latency percentiles of each query method, in milliseconds, over num_queries calls with random arguments.
+    """
+
+    arguments = {'get_documents_for_verb': verbs,
+                 'get_documents_for_persona': personas,
+                 'get_persona_cluster': personas}
+
+    latencies = {}
+    for _query in QUERIES:
+        _candidates = arguments.get(_query, doc_ids)
+        if not _candidates:
+            continue
+        _method = getattr(riveter, _query)
+        _times = []
+        for _argument in rng.choices(_candidates, k=num_queries):
+            _start = time.perf_counter()
+            _method(_argument)
+            _times.append((time.perf_counter() - _start) * 1000)
+        latencies[_query] = {'calls': num_queries,
+                             'mean_ms': float(np.mean(_times)),
+                             'p50_ms': float(np.percentile(_times, 50)),
+                             'p90_ms': float(np.percentile(_times, 90)),
+                             'p99_ms': float(np.percentile(_times, 99)),
+                             'max_ms': float(np.max(_times))}
+    return latencies
+
+
+def parse_all(nlp, texts, batch_size, n_process, disable):
+    for _ in nlp.pipe(texts, batch_size=batch_size, n_process=n_process, disable=disable):
+        pass
+
+
+def load_tables(riveter):
+    return [getattr(riveter, _name) for _name in ['id_persona_score_dict', 'id_nsubj_verb_count_dict']]
+
+
+def time_saving(riveter, tmp_dir, stages, text_ids, verbs, personas, num_queries, rng):
+    """
+    Times saving and loading in both formats, and returns the query latencies of the Riveter opened from the store.
+    The loaded Riveters only live in this function, so their files are closed before tmp_dir is removed.
+    """
+
+    n_docs = len(text_ids)
+    store_path = os.path.join(tmp_dir, 'riveter')
+    pickle_path = os.path.join(tmp_dir, 'riveter.pkl')
+    time_stage(stages, 'save', n_docs, riveter.save, store_path)
+    time_stage(stages, 'save_pickle', n_docs, riveter.save, pickle_path)
+    loaded = time_stage(stages, 'load', n_docs, Riveter, filename=store_path)
+    time_stage(stages, 'load_tables', n_docs, load_tables, loaded)
+    time_stage(stages, 'load_pickle', n_docs, Riveter, filename=pickle_path)
+    opened = time_stage(stages, 'open', n_docs, Riveter.open, store_path)
+    return time_queries(opened, text_ids, verbs, personas, num_queries, rng)
+
+
+def run_case(corpus, mode, args):
+    """
+    Benchmarks one corpus in one mode; the stages are timed one after another on the same Riveter.
+    """
+
+    if args.stub:
+        register_stub_pipelines()
+        model_name, coref_model_name = STUB_MODEL, STUB_COREF_MODEL
+    else:
+        model_name, coref_model_name = args.model, args.coref_model
+
+    texts, text_ids = load_benchmark_corpus(corpus, args.synthetic_docs, args.seed)
+    n_docs = len(texts)
+    persona_patterns_dict = PERSONA_PATTERNS if mode == 'pattern' else None
+    coref_window_size = args.coref_window_size if mode == 'windowed' else None
+    stages = {}
+
+    # Parsing on its own, with the same components extract() runs
+    nlp = load_pipeline(model_name, None if mode == 'pattern' else coref_model_name)
+    components = EXTRACTION_COMPONENTS if mode != 'coref' else EXTRACTION_COMPONENTS + COREF_COMPONENTS
+    disable = [_name for _name in nlp.pipe_names if _name not in components]
+    time_stage(stages, 'parse', n_docs, parse_all, nlp, texts, args.batch_size, args.n_process, disable)
+    if args.compare_pipelines:
+        # The same parse with every component the pipeline enables, to measure what disabling the unused ones saves
+        time_stage(stages, 'parse_full', n_docs, parse_all, nlp, texts, args.batch_size, args.n_process, [])
+
+    riveter = Riveter(model_name=model_name, coref_model_name=coref_model_name)
+    riveter.load_sap_lexicon(args.lexicon)
+    if args.stats:
+        riveter.enable_stats()
+    time_stage(stages, 'extract', n_docs, riveter.extract, texts, text_ids, persona_patterns_dict,
+               batch_size=args.batch_size, n_process=args.n_process, coref_window_size=coref_window_size)
+    time_stage(stages, 'score', n_docs, riveter.rescore)
+    if args.num_bootstraps:
+        time_stage(stages, 'bootstrap', n_docs, riveter.rescore, num_bootstraps=args.num_bootstraps,
+                   random_seed=args.seed, n_jobs=args.n_jobs)
+
+    rng = random.Random(args.seed)
+    verbs = sorted(set(riveter.id_nsubj_verb_count_dict.matrix.verbs))
+    personas = sorted(riveter.persona_count_dict)
+    queries = {'trained': time_queries(riveter, text_ids, verbs, personas, args.num_queries, rng)}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queries['opened'] = time_saving(riveter, tmp_dir, stages, text_ids, verbs, personas, args.num_queries, rng)
+
+    return {'corpus': corpus,
+            'mode': mode,
+            'n_docs': n_docs,
+            'n_chars': sum(len(_text) for _text in texts),
+            'n_personas': len(personas),
+            'n_verbs': len(verbs),
+            'stages': stages,
+            'queries': queries,
+            'riveter_stats': riveter.stats.to_dict() if riveter.stats is not None else None}
+
+
+def get_median(values):
+    return float(np.median(values)) if None not in values else None
+
+
+def merge_repeats(cases):
+    """
+    One case with the median over the repeats of every stage and query metric.
+    """
+    case = dict(cases[0], repeats=len(cases))
+    case['stages'] = {_stage: {_name: get_median([_case['stages'][_stage][_name] for _case in cases]) for _name in _values}
+                      for _stage, _values in cases[0]['stages'].items()}
+    case['queries'] = {_source: {_query: {_name: get_median([_case['queries'][_source][_query][_name] for _case in cases]) for _name in _values}
+                                 for _query, _values in _latencies.items()}
+                       for _source, _latencies in cases[0]['queries'].items()}
+    return case
+
+
+def get_environment(args):
+
+    versions = {}
+    for _package in ['numpy', 'pandas', 'spacy', 'spacy-experimental', args.model, args.coref_model]:
+        try:
+            versions[_package] = importlib.metadata.version(_package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[_package] = None
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASEPATH, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {'benchmark_version': BENCHMARK_VERSION,
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'packages': versions,
+            'arguments': vars(args)}
+
+
+def flatten_metrics(results):
+    """
+    {(corpus, mode, name, unit): value} for the metrics that are compared between runs: stage times and median query latencies.
+    """
+    metrics = {}
+    for _case in results['cases']:
+        for _stage, _values in _case['stages'].items():
+            metrics[(_case['corpus'], _case['mode'], _stage, 'seconds')] = _values['seconds']
+        for _source, _latencies in _case['queries'].items():
+            for _query, _values in _latencies.items():
+                metrics[(_case['corpus'], _case['mode'], f'{_source} {_query}', 'p50_ms')] = _values['p50_ms']
+    return metrics
+
+
+def compare_results(baseline, results, threshold):
+    """
+    The metrics that are more than threshold (e.g. 0.2 for 20%) slower than in the baseline, and by more than their noise floor,
+    as (key, baseline, new) tuples.
+    """
+    baseline_metrics = flatten_metrics(baseline)
+    regressions = []
+    for _key, _value in flatten_metrics(results).items():
+        _baseline_value = baseline_metrics.get(_key)
+        if _baseline_value is None:
+            continue
+        if _value > _baseline_value * (1 + threshold) and _value - _baseline_value > NOISE_FLOORS[_key[-1]]:
+            regressions.append((_key, _baseline_value, _value))
+    return regressions
+
+
+def print_results(results):
+    for _case in results['cases']:
+        print(f"\n{_case['corpus']} ({_case['mode']}): {_case['n_docs']} documents, {_case['n_personas']} personas, {_case['n_verbs']} verbs")
+        for _stage, _values in _case['stages'].items():
+            _docs_per_sec = f"{_values['docs_per_sec']:.1f} docs/s" if _values['docs_per_sec'] is not None else ''
+            _peak_rss = f"peak RSS {_values['peak_rss_mb']:.0f} MB" if _values['peak_rss_mb'] is not None else ''
+            print(f"  {_stage:<14}{_values['seconds']:>10.3f} s  {_docs_per_sec:>16}  {_peak_rss}")
+        if 'parse_full' in _case['stages'] and _case['stages']['parse']['seconds'] > 0:
+            print(f"  the full pipeline parses {_case['stages']['parse_full']['seconds'] / _case['stages']['parse']['seconds']:.2f}x slower than the minimal one")
+        for _source, _latencies in _case['queries'].items():
+            for _query, _values in _latencies.items():
+                print(f"  {_source} {_query:<28} p50 {_values['p50_ms']:.3f} ms  p90 {_values['p90_ms']:.3f} ms  p99 {_values['p99_ms']:.3f} ms")
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Benchmark the riveter extraction and scoring pipeline.')
+    parser.add_argument('--corpora', nargs='+', choices=CORPORA, default=CORPORA)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=['coref', 'pattern'])
+    parser.add_argument('--synthetic-docs', type=int, default=1000, help='number of documents in the synthetic corpus')
+    parser.add_argument('--stub', action='store_true', help='use a rule-based stub pipeline instead of the spaCy models')
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--coref-model', default=DEFAULT_COREF_MODEL)
+    parser.add_argument('--lexicon', default='power', help='Sap et al. lexicon dimension to score with')
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--n-process', type=int, default=1)
+    parser.add_argument('--coref-window-size', type=int, default=512, help='coref window size of the windowed mode')
+    parser.add_argument('--num-bootstraps', type=int, default=100, help='0 to skip the bootstrap stage')
+    parser.add_argument('--n-jobs', type=int, default=1)
+    parser.add_argument('--num-queries', type=int, default=200, help='number of calls of each query method')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare-pipelines', action='store_true',
+                        help='also time parsing with every component of the pipeline, against the minimal set that extraction runs')
+    parser.add_argument('--stats', action='store_true', help="also record the Riveter's own stage timers and counters (see Riveter.enable_stats())")
+    parser.add_argument('--repeats', type=int, default=3, help='number of runs of each case; the median of each metric is reported and compared')
+    parser.add_argument('--in-process', action='store_true',
+                        help='run every case in this process, rather than each in a fresh one (peak RSS is then cumulative)')
+    parser.add_argument('--output', help='path of the JSON results')
+    parser.add_argument('--compare', help='JSON results of an earlier run to flag regressions against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown that counts as a regression')
+    args = parser.parse_args(argv)
+
+    results = {'environment': get_environment(args), 'cases': []}
+    for _corpus in args.corpora:
+        for _mode in args.modes:
+            _repeats = []
+            for _ in range(args.repeats):
+                if args.in_process:
+                    _repeats.append(run_case(_corpus, _mode, args))
+                else:
+                    # A fresh process per case, so that the peak RSS of one case doesn't carry over to the next
+                    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                        _repeats.append(executor.submit(run_case, _corpus, _mode, args).result())
+            results['cases'].append(merge_repeats(_repeats))
+
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        for _argument in ['stub', 'repeats', 'model', 'coref_model', 'synthetic_docs', 'batch_size', 'n_process', 'num_bootstraps', 'n_jobs', 'seed']:
+            _baseline_value = baseline['environment']['arguments'].get(_argument)
+            if _baseline_value != getattr(args, _argument):
+                print(f'Warning: {args.compare} was run with {_argument}={_baseline_value!r}, rather than {getattr(args, _argument)!r}')
+        regressions = compare_results(baseline, results, args.threshold)
+        for (_corpus, _mode, _name, _unit), _baseline_value, _value in regressions:
+            print(f'REGRESSION {_corpus} ({_mode}) {_name}: {_baseline_value:.4g} -> {_value:.4g} {_unit} ({_value / _baseline_value - 1:+.0%})')
+        if regressions:
+            return 1
+        print(f'\nNo regressions of more than {args.threshold:.0%} against {args.compare}')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
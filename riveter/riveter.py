@@ -1,10 +1,20 @@
-from collections import defaultdict
-from datetime import datetime
+from collections import defaultdict, deque
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor
+import array
+import bisect
+import contextlib
+import functools
+import hashlib
+import importlib.metadata
+import itertools
+import json
+import logging
 import re
 import os
 import pandas as pd
 import pickle
-import random
+import time
 
 import numpy as np
 import seaborn as sns
@@ -12,31 +22,114 @@ import matplotlib.pyplot as plt
 
 from tqdm import tqdm
 
-# import spacy
-# import spacy_experimental
-# # nlp = spacy.load('en_core_web_sm')
-# nlp = spacy.load('en_coreference_web_trf')
+logger = logging.getLogger(__name__)
 
-# SPACY & COREF IMPORTS
-import spacy
-import spacy_experimental
-nlp = spacy.load("en_core_web_sm")
-nlp_coref = spacy.load("en_coreference_web_trf")
+DEFAULT_MODEL = 'en_core_web_sm'
+DEFAULT_COREF_MODEL = 'en_coreference_web_trf'
 
-# use replace_listeners for the coref components
-nlp_coref.replace_listeners("transformer", "coref", ["model.tok2vec"])
-nlp_coref.replace_listeners("transformer", "span_resolver", ["model.tok2vec"])
+# spaCy pipelines are built on first use and shared by every Riveter object in the process,
+# keyed by (model_name, coref_model_name)
+PIPELINES = {}
 
-# we won't copy over the span cleaner
-nlp.add_pipe("coref", source=nlp_coref)
-nlp.add_pipe("span_resolver", source=nlp_coref)
+
+def load_pipeline(model_name=DEFAULT_MODEL, coref_model_name=None):
+    """
+    Returns the spaCy pipeline for model_name, loading it the first time it is requested.
+    If coref_model_name is given, the coref and span_resolver components from that model are added to the pipeline.
+    """
+
+    key = (model_name, coref_model_name)
+
+    if key not in PIPELINES:
+
+        import spacy
+
+        nlp = spacy.load(model_name)
+
+        if coref_model_name:
+
+            import spacy_experimental  # registers the coref factories
+            nlp_coref = spacy.load(coref_model_name)
+
+            # use replace_listeners for the coref components
+            nlp_coref.replace_listeners("transformer", "coref", ["model.tok2vec"])
+            nlp_coref.replace_listeners("transformer", "span_resolver", ["model.tok2vec"])
+
+            # we won't copy over the span cleaner
+            nlp.add_pipe("coref", source=nlp_coref)
+            nlp.add_pipe("span_resolver", source=nlp_coref)
+
+        PIPELINES[key] = nlp
+
+    return PIPELINES[key]
+
+
+# Components added by load_pipeline() that resolve coreference
+COREF_COMPONENTS = ['coref', 'span_resolver']
+
+# Components whose annotations extraction reads (sentences, dependency labels, noun chunks, POS tags and lemmas),
+# and the embedding layers they listen to. The rest of the pipeline, e.g. ner, is skipped when parsing.
+EXTRACTION_COMPONENTS = ['tok2vec', 'transformer', 'tagger', 'morphologizer', 'attribute_ruler', 'parser', 'senter', 'lemmatizer', 'trainable_lemmatizer']
+
+DEFAULT_COREF_WINDOW_OVERLAP = 64
 
 
 NER_TAGS = ["PERSON"]
 
 PRONOUNS = ['he', 'him', 'his', 'himself', 'she', 'her', 'hers', 'herself', 'they', 'them', 'their', 'themselves']
+
+# Pronoun forms by the persona name of the coreference clusters they make up
+PRONOUN_MAP = {
+    "i": ["me", "my", "mine", "i"],
+    "we": ["us", "ours", "our", "we"],
+    "you": ["yours", "you", "your"],
+    "he": ['he', 'him', 'himself', 'his'],
+    'she': ['she', 'her', 'herself', 'hers'],
+    'they': ['they', 'them', 'themselves', 'their', 'theirs']
+}
+REVERSE_PRONOUN_MAP = {_pronoun: _label for _label, _pronouns in PRONOUN_MAP.items() for _pronoun in _pronouns}
+
+# Mentions that are never personas
+RELATIVE_PRONOUNS = frozenset(['that', 'which', 'who', 'what'])
+
+DETERMINER_REGEX = re.compile(r'^(my|his|her|their|our|your|the|a|an) ')
+NOUN_CHUNK_STRIP_CHARACTERS = ',.!?\'"'
+CLUSTER_STRIP_CHARACTERS = '.,!?\'"-'
+PERSONA_NAME_CACHE_SIZE = 2**16
+
 BASEPATH = os.path.dirname(__file__)
 
+REGEX_SPECIAL_CHARACTERS = set('.^$*+?{}[]\\|()')
+BACKREFERENCE_REGEX = re.compile(r'\\[1-9]|\(\?P=|\\g<')
+
+# Dimensions of the bundled lexicons
+SAP_DIMENSIONS = ['power', 'agency']
+RASHKIN_DIMENSIONS = ['effect', 'state', 'value', 'writer_perspective', 'reader_perspective', 'agent_theme_perspective', 'theme_agent_perspective']
+
+# Roles of the persona in a (persona, verb) pair
+NSUBJ = 0
+DOBJ = 1
+ROLE_NAMES = ['nsubj', 'dobj']
+
+# Lowercased verb strings by spaCy lemma hash (or tuple of hashes for phrasal verbs), shared by all Riveters
+VERB_STRINGS = {}
+
+# Upper bound on the intermediate arrays of each chunk of bootstrap replicates
+DEFAULT_BOOTSTRAP_MEMORY_LIMIT = 256 * 1024**2
+
+# Number of bootstrap replicates drawn from each RNG stream; a block is also the unit of work of a bootstrap process
+BOOTSTRAP_BLOCK_SIZE = 64
+
+# Number of rows read at a time when streaming a corpus from a file
+DEFAULT_CHUNKSIZE = 10000
+
+# Bump this whenever a change to extraction changes what is stored in the parse cache
+CACHE_VERSION = 1
+DEFAULT_CACHE_SIZE = 2 * 1024**3
+
+# Bump this whenever the layout of a saved RiveterStore changes
+SCHEMA_VERSION = 2
+
 # PRONOUN_MAP = {
 #     "i": ["me", "my", "mine"],
 #     "we": ["us", "ours", "our"],
@@ -48,49 +141,1968 @@ BASEPATH = os.path.dirname(__file__)
 #         PRONOUN_SPECIAL_CASES[f] = p
 
 
-def default_dict_int():
-        return defaultdict(int)
+@functools.lru_cache(maxsize=PERSONA_NAME_CACHE_SIZE)
+def get_persona_name(text, strip_characters=NOUN_CHUNK_STRIP_CHARACTERS):
+    """
+    The persona name of a mention: lowercased, without surrounding punctuation or a leading determiner, e.g. "The doctor," -> "doctor".
+    """
+    return DETERMINER_REGEX.sub('', text.lower().strip(strip_characters))
+
+
+def get_package_version(package_name):
+    """
+    Returns the installed version of a package (spaCy models are installed as packages),
+    or the name itself if it isn't an installed package, e.g. a path to a model directory.
+    """
+    try:
+        return package_name + '==' + importlib.metadata.version(package_name)
+    except (ValueError, importlib.metadata.PackageNotFoundError):
+        return package_name
+
+
+class ParseCache:
+    """
+    Content-addressed on-disk cache of the (nsubj, dobj, entity match) counts extracted from each document.
+    Entries are keyed by a hash of the text, the spaCy version, and the models and persona patterns used,
+    so changing the lexicon does not require parsing the texts again.
+    When the cache grows past max_size bytes, the least recently used entries are deleted.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+        self.size = sum(os.path.getsize(_path) for _path in self.__get_paths())
+        if self.size > self.max_size:
+            self.__evict()
+
+
+    def get_key(self, text, settings):
+        _hash = hashlib.sha256()
+        _hash.update(repr([CACHE_VERSION, get_package_version('spacy'), settings]).encode('utf-8'))
+        _hash.update(text.encode('utf-8'))
+        return _hash.hexdigest()
+
+
+    def get(self, key):
+        _path = self.__get_path(key)
+        try:
+            with open(_path, 'rb') as f:
+                nsubj_verb_count_dict, dobj_verb_count_dict, entity_match_count_dict = pickle.load(f)
+            os.utime(_path) # mark as recently used
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        return defaultdict(int, nsubj_verb_count_dict), \
+            defaultdict(int, dobj_verb_count_dict), \
+            defaultdict(default_dict_int, {p: defaultdict(int, d) for p, d in entity_match_count_dict.items()})
+
+
+    def put(self, key, extraction):
+        nsubj_verb_count_dict, dobj_verb_count_dict, entity_match_count_dict = extraction
+
+        _path = self.__get_path(key)
+        os.makedirs(os.path.dirname(_path), exist_ok=True)
+
+        # write to a temporary file first so that readers never see a partial entry
+        _tmp_path = _path + '.' + str(os.getpid()) + '.tmp'
+        with open(_tmp_path, 'wb') as f:
+            pickle.dump((dict(nsubj_verb_count_dict),
+                         dict(dobj_verb_count_dict),
+                         {p: dict(d) for p, d in entity_match_count_dict.items()}),
+                        f, pickle.HIGHEST_PROTOCOL)
+        os.replace(_tmp_path, _path)
+
+        self.size += os.path.getsize(_path)
+        if self.size > self.max_size:
+            self.__evict()
+
+
+    def clear(self):
+        for _path in self.__get_paths():
+            os.remove(_path)
+        self.size = 0
+
+
+    def __get_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.pkl')
+
+
+    def __get_paths(self):
+        for _entry in os.scandir(self.cache_dir):
+            if _entry.is_dir():
+                for _file_entry in os.scandir(_entry.path):
+                    if _file_entry.name.endswith('.pkl'):
+                        yield _file_entry.path
+
+
+    def __evict(self):
+        """
+        Delete the least recently used entries until the cache is back under 90% of max_size,
+        so that we don't have to evict again on the very next put().
+        """
+
+        _entries = []
+        for _path in self.__get_paths():
+            _stat = os.stat(_path)
+            _entries.append((_stat.st_mtime, _stat.st_size, _path))
+        _entries.sort()
+
+        self.size = sum(_size for _mtime, _size, _path in _entries)
+        for _mtime, _size, _path in _entries:
+            if self.size <= 0.9 * self.max_size:
+                break
+            try:
+                os.remove(_path)
+            except FileNotFoundError:
+                pass
+            self.size -= _size
+
+
+def sum_by_key(keys, *weights):
+    """
+    Groups equal keys, in order of first occurrence.
+    Returns the distinct keys, how often each one occurs, and the sum of each weights array for each key.
+    Weights are added up in input order, so the sums are identical to accumulating them one at a time.
+    """
+
+    unique_keys, first_indices, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first_indices, kind='stable')
+
+    counts = np.bincount(inverse, minlength=len(unique_keys))[order]
+    sums = [np.bincount(inverse, weights=_weights, minlength=len(unique_keys))[order] for _weights in weights]
+
+    return (unique_keys[order], counts, *sums)
+
+
+class KeywordTrie:
+    """
+    Aho-Corasick automaton that finds which of a list of keywords occur anywhere in a text, in a single pass over the text.
+    """
+
+    def __init__(self, keywords):
+
+        # Build the trie of keywords
+        self.transitions = [{}]
+        self.outputs = [[]]
+        for i, _keyword in enumerate(keywords):
+            _state = 0
+            for _char in _keyword:
+                if _char not in self.transitions[_state]:
+                    self.transitions[_state][_char] = len(self.transitions)
+                    self.transitions.append({})
+                    self.outputs.append([])
+                _state = self.transitions[_state][_char]
+            self.outputs[_state].append(i)
+
+        # Add the failure links breadth first, so every state also outputs the keywords that end in its longest proper suffix
+        self.failures = [0] * len(self.transitions)
+        queue = deque(self.transitions[0].values())
+        while queue:
+            _state = queue.popleft()
+            for _char, _next_state in self.transitions[_state].items():
+                queue.append(_next_state)
+                _failure = self.failures[_state]
+                while _failure and _char not in self.transitions[_failure]:
+                    _failure = self.failures[_failure]
+                self.failures[_next_state] = self.transitions[_failure].get(_char, 0)
+                self.outputs[_next_state] = self.outputs[_next_state] + self.outputs[self.failures[_next_state]]
+
+
+    def find(self, text):
+        """
+        Returns the set of indices of the keywords found in the text.
+        """
+
+        found = set()
+        _state = 0
+        for _char in text:
+            while _state and _char not in self.transitions[_state]:
+                _state = self.failures[_state]
+            _state = self.transitions[_state].get(_char, 0)
+            if self.outputs[_state]:
+                found.update(self.outputs[_state])
+
+        return found
+
+
+class PersonaMatcher:
+    """
+    Finds every persona whose pattern (as in re.findall(pattern, text)) matches a text, compiled once per persona_patterns_dict.
+    Literal patterns are found together with a KeywordTrie and the other patterns are precompiled.
+    When possible, all the patterns are also combined into one regex, which quickly rules out texts that match no persona.
+    """
+
+    def __init__(self, persona_patterns_dict):
+
+        self.personas = list(persona_patterns_dict.keys())
+        self.literal_indices = []
+        self.regexes = []
+
+        _literals = []
+        for i, _pattern in enumerate(persona_patterns_dict.values()):
+            if isinstance(_pattern, str) and _pattern and not REGEX_SPECIAL_CHARACTERS.intersection(_pattern):
+                self.literal_indices.append(i)
+                _literals.append(_pattern)
+            else:
+                self.regexes.append((i, re.compile(_pattern)))
+
+        self.keyword_trie = KeywordTrie(_literals) if _literals else None
+        self.combined_regex = self.__combine(list(persona_patterns_dict.values()))
+
+
+    def match(self, text):
+        """
+        Returns the personas whose patterns match the text, in the order of persona_patterns_dict.
+        """
+
+        if self.combined_regex is not None and not self.combined_regex.search(text):
+            return []
+
+        matched_indices = set()
+        if self.keyword_trie is not None:
+            matched_indices.update(self.literal_indices[i] for i in self.keyword_trie.find(text))
+        for i, _regex in self.regexes:
+            if _regex.search(text):
+                matched_indices.add(i)
+
+        return [self.personas[i] for i in sorted(matched_indices)]
+
+
+    def __combine(self, patterns):
+        """
+        Patterns with backreferences, inline flags or their own compile flags can't safely be joined into one regex.
+        """
+
+        if not all(isinstance(_pattern, str) for _pattern in patterns):
+            return None
+        if any(BACKREFERENCE_REGEX.search(_pattern) for _pattern in patterns):
+            return None
+
+        try:
+            return re.compile('|'.join('(?:' + _pattern + ')' for _pattern in patterns))
+        except re.error:
+            return None
+
+
+class Lexicon(Mapping):
+    """
+    A verb lexicon with one or more dimensions (e.g. power and agency), stored as a verb -> index map and
+    contiguous (verbs x dimensions) arrays of agent and theme scores. Scores are NaN for verbs a dimension doesn't have.
+    It can be used like the verb_score_dict it replaces: lexicon[verb] is {'agent': score, 'theme': score} (0 for unknown verbs),
+    or {dimension: {'agent': score, 'theme': score}} for the dimensions that have the verb if there are several.
+    """
+
+    def __init__(self, verbs, agent_scores, theme_scores, dimensions=None, in_dimension=None):
+        """
+        agent_scores and theme_scores have a score per verb, or per verb and dimension.
+        in_dimension: whether each verb is in each dimension, by default all of them.
+        A verb that occurs more than once keeps the scores of its last occurrence, like assigning to a dict.
+        """
+
+        self.dimensions = list(dimensions) if dimensions is not None else [None]
+        self.verb_index = {}
+        idx = np.array([self.verb_index.setdefault(_verb, len(self.verb_index)) for _verb in verbs], dtype=np.int64)
+        self.verbs = list(self.verb_index.keys())
+
+        shape = (len(self.verbs), len(self.dimensions))
+        self.agent_scores = np.full(shape, np.nan)
+        self.theme_scores = np.full(shape, np.nan)
+        self.in_dimension = np.zeros(shape, dtype=bool)
+        self.agent_scores[idx] = self.__get_rows(agent_scores, len(idx))
+        self.theme_scores[idx] = self.__get_rows(theme_scores, len(idx))
+        self.in_dimension[idx] = self.__get_rows(in_dimension if in_dimension is not None else True, len(idx))
+
+
+    def __get_rows(self, values, n_rows):
+        # A scalar, a value per row, or a row of values per dimension
+        values = np.asarray(values)
+        if values.ndim == 1:
+            values = values.reshape(n_rows, -1)
+        return np.broadcast_to(values, (n_rows, len(self.dimensions)))
+
+
+    @classmethod
+    def from_dict(cls, verb_score_dict):
+        verbs = list(verb_score_dict.keys())
+        return cls(verbs,
+                   [verb_score_dict[_verb]['agent'] for _verb in verbs],
+                   [verb_score_dict[_verb]['theme'] for _verb in verbs])
+
+
+    @classmethod
+    def from_dataframe(cls, lexicon_df, verb_column, agent_column, theme_column, dimension=None):
+        """
+        Missing score columns count as scores of 0.
+        """
+        return cls(lexicon_df[verb_column].str.strip().tolist(),
+                   lexicon_df[agent_column].to_numpy(dtype=float) if agent_column in lexicon_df else 0,
+                   lexicon_df[theme_column].to_numpy(dtype=float) if theme_column in lexicon_df else 0,
+                   dimensions=[dimension])
+
+
+    @classmethod
+    def combine(cls, lexicons):
+        """
+        Combines lexicons into one with all of their dimensions, in order. The verbs are the union of theirs.
+        """
+
+        verb_index = {}
+        for _lexicon in lexicons:
+            for _verb in _lexicon.verbs:
+                verb_index.setdefault(_verb, len(verb_index))
+
+        dimensions = [_dimension for _lexicon in lexicons for _dimension in _lexicon.dimensions]
+        if None in dimensions or len(set(dimensions)) < len(dimensions):
+            raise ValueError('The combined lexicons must have distinct, named dimensions')
+
+        shape = (len(verb_index), len(dimensions))
+        agent_scores = np.full(shape, np.nan)
+        theme_scores = np.full(shape, np.nan)
+        in_dimension = np.zeros(shape, dtype=bool)
+        d = 0
+        for _lexicon in lexicons:
+            _idx = [verb_index[_verb] for _verb in _lexicon.verbs]
+            _columns = slice(d, d + len(_lexicon.dimensions))
+            agent_scores[_idx, _columns] = _lexicon.agent_scores
+            theme_scores[_idx, _columns] = _lexicon.theme_scores
+            in_dimension[_idx, _columns] = _lexicon.in_dimension
+            d += len(_lexicon.dimensions)
+
+        return cls(list(verb_index.keys()), agent_scores, theme_scores, dimensions=dimensions, in_dimension=in_dimension)
+
+
+    @classmethod
+    def read_table(cls, path, verb_column, agent_column, theme_column, sep='\t', cache_path=None):
+        """
+        Reads a lexicon from a CSV or TSV file. With cache_path, the lexicon is also saved there in binary form,
+        and read from it instead as long as the cache is newer than the file and was read with the same separator and columns.
+        """
+
+        cache_key = [sep, verb_column, agent_column, theme_column]
+
+        if cache_path is not None and os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+            with np.load(cache_path, allow_pickle=False) as f:
+                # Caches saved by older versions only have the columns
+                is_valid = 'key' in f and f['key'].tolist() == cache_key
+            if is_valid:
+                return cls.load(cache_path)
+
+        lexicon = cls.from_dataframe(pd.read_csv(path, sep=sep), verb_column, agent_column, theme_column)
+        if cache_path is not None:
+            lexicon.save(cache_path, cache_key=cache_key)
+
+        return lexicon
+
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            dimensions = f['dimensions'].tolist() if 'dimensions' in f else None
+            return cls(f['verbs'].tolist(), f['agent_scores'], f['theme_scores'],
+                       dimensions=[_dimension or None for _dimension in dimensions] if dimensions else None,
+                       in_dimension=f['in_dimension'] if 'in_dimension' in f else None)
+
+
+    def save(self, path, cache_key=None):
+        """
+        Saves the lexicon to a .npz file; cache_key records how read_table() read the file it came from.
+        """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f,
+                     verbs=np.array(self.verbs, dtype=str),
+                     agent_scores=self.agent_scores,
+                     theme_scores=self.theme_scores,
+                     in_dimension=self.in_dimension,
+                     dimensions=np.array([_dimension or '' for _dimension in self.dimensions], dtype=str),
+                     key=np.array(cache_key or [], dtype=str))
+        os.replace(tmp_path, path)
+
+
+    def normalize(self, nlp, cache_path=None, cache_key=None):
+        """
+        Returns a copy of the lexicon with its verbs lemmatized and lowercased by a spaCy pipeline, the same way extraction
+        lemmatizes verbs, e.g. "abandoned" -> "abandon" and "agonized over" -> "agonize over". In each dimension, an entry
+        that was already in that form keeps its scores when other entries are normalized to the same verb.
+        cache_path: a .npz file to save the verb -> lemma table in, which is reused for the same verbs and cache_key (e.g. the model version).
+        """
+
+        lemmas = None
+        if cache_path is not None and os.path.exists(cache_path):
+            with np.load(cache_path, allow_pickle=False) as f:
+                if f['key'].item() == (cache_key or '') and f['verbs'].tolist() == self.verbs:
+                    lemmas = f['lemmas'].tolist()
+
+        if lemmas is None:
+            lemmas = [' '.join(_token.lemma_.lower() for _token in _doc) for _doc in nlp.pipe(self.verbs)]
+            if cache_path is not None:
+                tmp_path = cache_path + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    np.savez(f, key=np.array(cache_key or ''), verbs=np.array(self.verbs, dtype=str), lemmas=np.array(lemmas, dtype=str))
+                os.replace(tmp_path, cache_path)
+
+        lemma_index = {}
+        rows = [lemma_index.setdefault(_lemma, len(lemma_index)) for _lemma in lemmas]
+        shape = (len(lemma_index), len(self.dimensions))
+        agent_scores = np.full(shape, np.nan)
+        theme_scores = np.full(shape, np.nan)
+        in_dimension = np.zeros(shape, dtype=bool)
+
+        # The entries that were already normalized go last, so their scores are the ones that are kept
+        for i in sorted(range(len(lemmas)), key=lambda i: lemmas[i] == self.verbs[i]):
+            _mask = self.in_dimension[i]
+            agent_scores[rows[i], _mask] = self.agent_scores[i, _mask]
+            theme_scores[rows[i], _mask] = self.theme_scores[i, _mask]
+            in_dimension[rows[i], _mask] = True
+
+        return Lexicon(list(lemma_index.keys()), agent_scores, theme_scores, dimensions=self.dimensions, in_dimension=in_dimension)
+
+
+    def get_verb_idx(self, verb):
+        """
+        The index of a verb, or -1 if it isn't in the lexicon. Phrasal verbs that aren't in the lexicon
+        back off to their head verb, e.g. "give up" to "give".
+        """
+        i = self.verb_index.get(verb, -1)
+        if i < 0 and ' ' in verb:
+            i = self.verb_index.get(verb.split(' ', 1)[0], -1)
+        return i
+
+
+    def get_dimension_idx(self, dimension):
+        if dimension not in self.dimensions:
+            raise ValueError(f'The lexicon has no "{dimension}" dimension, it has {self.dimensions}')
+        return self.dimensions.index(dimension)
+
+
+    def get_scores(self, verbs, dimension_idx=0):
+        """
+        Returns whether each verb is in one dimension of the lexicon, and its agent and theme scores (0 if it isn't).
+        """
+        in_lexicon, agent_scores, theme_scores = self.get_score_matrices(verbs)
+        return in_lexicon[:, dimension_idx], agent_scores[:, dimension_idx], theme_scores[:, dimension_idx]
+
+
+    def get_score_matrices(self, verbs):
+        """
+        Returns (verbs x dimensions) arrays of whether each verb is in each dimension, and its agent and theme scores (0 if it isn't).
+        """
+        idx = np.array([self.get_verb_idx(_verb) for _verb in verbs], dtype=np.int64)
+        # Index -1 picks the row appended to each array, for verbs that aren't in the lexicon
+        in_lexicon = np.vstack([self.in_dimension, np.zeros((1, len(self.dimensions)), dtype=bool)])[idx]
+        agent_scores = np.where(in_lexicon, np.vstack([self.agent_scores, np.zeros((1, len(self.dimensions)))])[idx], 0.0)
+        theme_scores = np.where(in_lexicon, np.vstack([self.theme_scores, np.zeros((1, len(self.dimensions)))])[idx], 0.0)
+        return in_lexicon, agent_scores, theme_scores
+
+
+    def __getitem__(self, verb):
+        # Verbs that aren't in the lexicon score 0, like the defaultdict verb_score_dict this replaces
+        i = self.verb_index.get(verb)
+        scores = {_dimension: {'agent': float(self.agent_scores[i, d]), 'theme': float(self.theme_scores[i, d])}
+                  for d, _dimension in enumerate(self.dimensions) if i is not None and self.in_dimension[i, d]}
+        if len(self.dimensions) == 1:
+            return scores.get(self.dimensions[0], {'agent': 0.0, 'theme': 0.0})
+        return scores
+
+
+    def __contains__(self, verb):
+        return verb in self.verb_index
+
+
+    def __iter__(self):
+        return iter(self.verbs)
+
+
+    def __len__(self):
+        return len(self.verbs)
+
+
+    def __eq__(self, other):
+        if not isinstance(other, Lexicon):
+            return super().__eq__(other)
+        if self.dimensions != other.dimensions or self.verb_index.keys() != other.verb_index.keys():
+            return False
+        other_idx = [other.verb_index[_verb] for _verb in self.verbs]
+        return np.array_equal(self.in_dimension, other.in_dimension[other_idx]) \
+            and np.array_equal(self.agent_scores, other.agent_scores[other_idx], equal_nan=True) \
+            and np.array_equal(self.theme_scores, other.theme_scores[other_idx], equal_nan=True)
+
+
+    def __repr__(self):
+        if len(self.dimensions) == 1:
+            return f'Lexicon({len(self)} verbs)'
+        return f'Lexicon({len(self)} verbs, dimensions={self.dimensions})'
+
+
+def get_vocabulary_ids(strings, vocabulary_index):
+    """
+    The ids of strings in a {string: id} vocabulary index, adding the strings it doesn't have yet.
+    """
+    return np.array([vocabulary_index.setdefault(_string, len(vocabulary_index)) for _string in strings], dtype=np.int64)
+
+
+class DocumentTable(Mapping):
+    """
+    Per-document rows in CSR format: the rows of the i-th document are [doc_ptr[i]:doc_ptr[i+1]] of every column,
+    with strings (personas, verbs, entity matches) interned into vocabularies and stored as their integer ids.
+    It can be used like the {doc_id: {...}} dict it replaces; a document's dict is decoded when it is looked up.
+    """
+
+    # (column, vocabulary or None, dtype) for each field of the rows that encode_doc() yields
+    COLUMNS = []
+
+    def __init__(self, doc_ids, doc_ptr, vocabularies, columns):
+        self.doc_ids = doc_ids
+        self.doc_ptr = doc_ptr
+        for _name, _vocabulary in vocabularies.items():
+            setattr(self, _name, _vocabulary)
+        for _name, _column in columns.items():
+            setattr(self, _name, _column)
+        self.__doc_index = None
+
+
+    @classmethod
+    def from_dicts(cls, *id_dicts):
+        """
+        Encodes {doc_id: {...}} dicts, e.g. those of Riveters pickled by older versions.
+        """
+        builder = DocumentTableBuilder(cls)
+        for _id in id_dicts[0]:
+            builder.add(_id, *(_id_dict[_id] for _id_dict in id_dicts))
+        return builder.build()
+
+
+    @classmethod
+    def from_sorted_rows(cls, doc_ids, doc_idx, vocabularies, columns):
+        """
+        A table from rows that are sorted by their document index.
+        """
+        doc_ptr = np.searchsorted(doc_idx, np.arange(len(doc_ids) + 1)).astype(np.int64)
+        return cls(doc_ids, doc_ptr, vocabularies, columns)
+
+
+    @classmethod
+    def concatenate(cls, tables):
+        """
+        The documents of the tables, in order. The vocabularies are those of the first table, followed by the new strings of the others.
+        """
+
+        vocabulary_indexes = {_vocabulary: {} for _vocabulary in cls.get_vocabularies()}
+        columns = {_name: [] for _name, _, _ in cls.COLUMNS}
+        doc_ptrs = [np.zeros(1, dtype=np.int64)]
+        n_rows = 0
+        for _table in tables:
+            for _name, _vocabulary, _ in cls.COLUMNS:
+                _column = getattr(_table, _name)
+                if _vocabulary is not None:
+                    _column = get_vocabulary_ids(getattr(_table, _vocabulary), vocabulary_indexes[_vocabulary])[_column]
+                columns[_name].append(_column)
+            doc_ptrs.append(np.asarray(_table.doc_ptr[1:]) + n_rows)
+            n_rows += int(_table.doc_ptr[-1])
+
+        return cls([_id for _table in tables for _id in _table.doc_ids],
+                   np.concatenate(doc_ptrs),
+                   {_vocabulary: list(_index.keys()) for _vocabulary, _index in vocabulary_indexes.items()},
+                   {_name: np.concatenate(_columns).astype(_dtype) for (_name, _, _dtype), _columns in zip(cls.COLUMNS, columns.values())})
+
+
+    @classmethod
+    def get_vocabularies(cls):
+        return list(dict.fromkeys(_vocabulary for _, _vocabulary, _ in cls.COLUMNS if _vocabulary is not None))
+
+
+    def take(self, positions):
+        """
+        A table of the documents at these positions, in that order. The vocabularies are shared with this table.
+        """
+
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = np.asarray(self.doc_ptr[:-1])[positions]
+        lengths = np.asarray(self.doc_ptr[1:])[positions] - starts
+        doc_ptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        rows = np.repeat(starts - doc_ptr[:-1], lengths) + np.arange(doc_ptr[-1])
+
+        return type(self)([self.doc_ids[_i] for _i in positions.tolist()],
+                          doc_ptr,
+                          {_vocabulary: getattr(self, _vocabulary) for _vocabulary in self.get_vocabularies()},
+                          {_name: np.asarray(getattr(self, _name))[rows] for _name, _, _ in self.COLUMNS})
+
+
+    def get_doc_idx(self):
+        """
+        The document index of every row (the row indices of the matrix in COO format).
+        """
+        return np.repeat(np.arange(len(self.doc_ids)), np.diff(self.doc_ptr))
+
+
+    def get_doc_position(self, doc_id):
+        if self.__doc_index is None:
+            self.__doc_index = {_id: i for i, _id in enumerate(self.doc_ids)}
+        return self.__doc_index[doc_id]
+
+
+    def get_doc_at(self, i):
+        return self.decode_doc(int(self.doc_ptr[i]), int(self.doc_ptr[i + 1]))
+
+
+    def __getitem__(self, doc_id):
+        return self.get_doc_at(self.get_doc_position(doc_id))
+
+
+    def __contains__(self, doc_id):
+        try:
+            self.get_doc_position(doc_id)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+
+    def __iter__(self):
+        return iter(self.doc_ids)
+
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_DocumentTable__doc_index'] = None
+        return state
+
+
+    def __repr__(self):
+        return f'{type(self).__name__}({len(self)} documents, {int(self.doc_ptr[-1])} rows)'
+
+
+class DocumentTableBuilder:
+    """
+    Encodes documents into a DocumentTable one at a time, appending to typed arrays rather than keeping their dicts.
+    If a document ID is added more than once, the table has the last document for it, at the position of the first.
+    """
+
+    def __init__(self, table_class):
+        self.table_class = table_class
+        self.doc_ids = []
+        self.doc_ptr = array.array('q', [0])
+        self.vocabulary_indexes = {_vocabulary: {} for _vocabulary in table_class.get_vocabularies()}
+        self.columns = {_name: array.array(np.dtype(_dtype).char) for _name, _, _dtype in table_class.COLUMNS}
+
+
+    def add(self, doc_id, *doc):
+        fields = [(self.columns[_name], self.vocabulary_indexes[_vocabulary] if _vocabulary is not None else None)
+                  for _name, _vocabulary, _ in self.table_class.COLUMNS]
+        for _row in self.table_class.encode_doc(*doc):
+            for (_column, _vocabulary_index), _value in zip(fields, _row):
+                if _vocabulary_index is not None:
+                    _value = _vocabulary_index.setdefault(_value, len(_vocabulary_index))
+                _column.append(_value)
+        self.doc_ids.append(doc_id)
+        self.doc_ptr.append(len(fields[0][0]))
+
+
+    def build(self):
+        table = self.table_class(self.doc_ids,
+                                 np.frombuffer(self.doc_ptr, dtype=np.int64),
+                                 {_vocabulary: list(_index.keys()) for _vocabulary, _index in self.vocabulary_indexes.items()},
+                                 {_name: np.frombuffer(self.columns[_name], dtype=_dtype) for _name, _, _dtype in self.table_class.COLUMNS})
+
+        last_positions = {_id: i for i, _id in enumerate(self.doc_ids)}
+        if len(last_positions) < len(self.doc_ids):
+            table = table.take(list(last_positions.values()))
+
+        return table
+
+
+class CountMatrix(DocumentTable):
+    """
+    Sparse document x (persona, verb, role) matrix of the nsubj and dobj counts, in CSR format:
+    the entries of the i-th document are persona_idx, verb_idx, role and count[doc_ptr[i]:doc_ptr[i+1]].
+    Personas and verbs are integer-encoded in order of first appearance.
+    Looking up a document returns its (nsubj, dobj) dicts of {(persona, verb): count};
+    Riveter.id_nsubj_verb_count_dict and id_dobj_verb_count_dict are views of one of them.
+    """
+
+    COLUMNS = [('persona_idx', 'personas', np.int64),
+               ('verb_idx', 'verbs', np.int64),
+               ('role', None, np.int8),
+               ('count', None, np.int64)]
+
+    @staticmethod
+    def encode_doc(nsubj_verb_count_dict, dobj_verb_count_dict):
+        for _role, _verb_count_dict in ((NSUBJ, nsubj_verb_count_dict), (DOBJ, dobj_verb_count_dict)):
+            for (_persona, _verb), _count in _verb_count_dict.items():
+                yield _persona, _verb, _role, _count
+
+
+    def decode_doc(self, start, end):
+        verb_count_dicts = (defaultdict(int), defaultdict(int))
+        for _persona_i, _verb_i, _role, _count in zip(self.persona_idx[start:end].tolist(),
+                                                      self.verb_idx[start:end].tolist(),
+                                                      self.role[start:end].tolist(),
+                                                      self.count[start:end].tolist()):
+            verb_count_dicts[_role][(self.personas[_persona_i], self.verbs[_verb_i])] = _count
+        return verb_count_dicts
+
+
+    def get_role_view(self, role):
+        return CountMatrixView(self, role)
+
+
+    def get_entry_scores(self, verb_score_dict):
+        """
+        Multiplies the matrix with the lexicon's agent (for nsubj) and theme (for dobj) vectors.
+        Returns the score of every entry and whether its verb is in the lexicon.
+        """
+
+        lexicon = verb_score_dict if isinstance(verb_score_dict, Lexicon) else Lexicon.from_dict(verb_score_dict)
+        in_lexicon, agent_scores, theme_scores = lexicon.get_scores(self.verbs)
+
+        entry_scores = np.where(self.role == NSUBJ, agent_scores[self.verb_idx], theme_scores[self.verb_idx])
+
+        return entry_scores, in_lexicon[self.verb_idx]
+
+
+class CountMatrixView(Mapping):
+    """
+    The nsubj or dobj entries of a CountMatrix as {doc_id: {(persona, verb): count}}.
+    """
+
+    def __init__(self, matrix, role):
+        self.matrix = matrix
+        self.role = role
+
+
+    def __getitem__(self, doc_id):
+        return self.matrix[doc_id][self.role]
+
+
+    def __contains__(self, doc_id):
+        return doc_id in self.matrix
+
+
+    def __iter__(self):
+        return iter(self.matrix)
+
+
+    def __len__(self):
+        return len(self.matrix)
+
+
+    def __repr__(self):
+        return f'CountMatrixView({ROLE_NAMES[self.role]}, {len(self)} documents)'
+
+
+class PersonaTable(DocumentTable):
+    """
+    {doc_id: {persona: value}}, e.g. the number of nsubj and dobj occurrences of each persona in each document.
+    """
+
+    COLUMNS = [('persona_idx', 'personas', np.int64),
+               ('value', None, np.int64)]
+    default_factory = int
+
+    @staticmethod
+    def encode_doc(persona_value_dict):
+        return persona_value_dict.items()
+
+
+    def decode_doc(self, start, end):
+        persona_value_dict = defaultdict(self.default_factory)
+        for _persona_i, _value in zip(self.persona_idx[start:end].tolist(), self.value[start:end].tolist()):
+            persona_value_dict[self.personas[_persona_i]] = _value
+        return persona_value_dict
+
+
+class PersonaScoreTable(PersonaTable):
+    """
+    {doc_id: {persona: score}}
+    """
+
+    COLUMNS = [('persona_idx', 'personas', np.int64),
+               ('value', None, np.float64)]
+    default_factory = float
+
+
+class EntityTable(DocumentTable):
+    """
+    {doc_id: {persona: {entity match: count}}}
+    """
+
+    COLUMNS = [('persona_idx', 'personas', np.int64),
+               ('match_idx', 'matches', np.int64),
+               ('count', None, np.int64)]
+
+    @staticmethod
+    def encode_doc(entity_match_count_dict):
+        for _persona, _match_count_dict in entity_match_count_dict.items():
+            for _match, _count in _match_count_dict.items():
+                yield _persona, _match, _count
+
+
+    def decode_doc(self, start, end):
+        entity_match_count_dict = defaultdict(default_dict_int)
+        for _persona_i, _match_i, _count in zip(self.persona_idx[start:end].tolist(),
+                                                self.match_idx[start:end].tolist(),
+                                                self.count[start:end].tolist()):
+            entity_match_count_dict[self.personas[_persona_i]][self.matches[_match_i]] = _count
+        return entity_match_count_dict
+
+
+class NestedCounter(Mapping):
+    """
+    Counts of key tuples, e.g. (persona, polarity, verb), that can be used like the nested {key: ... {key: count}} defaultdict
+    it replaces. The keys are interned into a vocabulary for each level, and each count is stored under the id of its first key
+    and the ids of the rest of its keys packed into a single int, rather than in a dict for every key but the last.
+    """
+
+    __slots__ = ['depth', 'vocabularies', 'vocabulary_indexes', 'counts']
+
+    # the number of bits of each packed id
+    ID_BITS = 32
+
+    def __init__(self, depth):
+        self.depth = depth
+        self.vocabularies = [[] for _ in range(depth)]
+        self.vocabulary_indexes = [{} for _ in range(depth)]
+        self.counts = {} # first key id -> packed ids of the rest of the keys -> count
+
+
+    @classmethod
+    def from_dict(cls, nested_dict, depth):
+        """
+        Counts from a nested {key: ... {key: count}} dict, e.g. those of Riveters pickled by older versions.
+        """
+        counter = cls(depth)
+        for _keys_count in cls.__flatten(nested_dict, depth):
+            counter.add(_keys_count[:-1], _keys_count[-1])
+        return counter
+
+
+    @classmethod
+    def from_arrays(cls, vocabularies, ids, counts):
+        """
+        Counts from the vocabularies, (counts x depth) key ids and counts of get_arrays().
+        """
+        counter = cls(len(vocabularies))
+        counter.vocabularies = [list(_vocabulary) for _vocabulary in vocabularies]
+        counter.vocabulary_indexes = [{_key: _i for _i, _key in enumerate(_vocabulary)} for _vocabulary in counter.vocabularies]
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1, counter.depth).tolist()
+        for _ids, _count in zip(ids, np.asarray(counts).tolist()):
+            counter.counts.setdefault(_ids[0], {})[counter.__pack(_ids[1:])] = _count
+        return counter
+
+
+    @staticmethod
+    def __flatten(nested_dict, depth):
+        for _key, _value in nested_dict.items():
+            if depth == 1:
+                yield _key, _value
+            else:
+                for _keys_count in NestedCounter.__flatten(_value, depth - 1):
+                    yield (_key,) + _keys_count
+
+
+    def __pack(self, ids):
+        packed = 0
+        for _i, _id in enumerate(ids):
+            packed |= _id << (self.ID_BITS * _i)
+        return packed
+
+
+    def __unpack(self, packed):
+        mask = (1 << self.ID_BITS) - 1
+        return [(packed >> (self.ID_BITS * _i)) & mask for _i in range(self.depth - 1)]
+
+
+    def add(self, keys, count):
+        """
+        Add count (which may be negative) to the count of the key tuple, dropping it if it falls to zero.
+        """
+
+        ids = []
+        for _key, _vocabulary, _vocabulary_index in zip(keys, self.vocabularies, self.vocabulary_indexes):
+            _id = _vocabulary_index.get(_key)
+            if _id is None:
+                _id = _vocabulary_index[_key] = len(_vocabulary)
+                _vocabulary.append(_key)
+            ids.append(_id)
+
+        rest_counts = self.counts.setdefault(ids[0], {})
+        packed = self.__pack(ids[1:])
+        count += rest_counts.get(packed, 0)
+        if count == 0:
+            rest_counts.pop(packed, None)
+            if not rest_counts:
+                del self.counts[ids[0]]
+        else:
+            rest_counts[packed] = count
+
+
+    def iter_counts(self):
+        """
+        Yields (key, ..., key, count) for every count.
+        """
+        for _first_id, _rest_counts in self.counts.items():
+            first_key = self.vocabularies[0][_first_id]
+            for _packed, _count in _rest_counts.items():
+                yield (first_key,
+                       *(self.vocabularies[_level][_id] for _level, _id in enumerate(self.__unpack(_packed), start=1)),
+                       _count)
+
+
+    def get_arrays(self):
+        """
+        The vocabularies, the (counts x depth) key ids and the counts, e.g. to save them as columns.
+        """
+        ids = [(_first_id, *self.__unpack(_packed)) for _first_id, _rest_counts in self.counts.items() for _packed in _rest_counts]
+        counts = [_count for _rest_counts in self.counts.values() for _count in _rest_counts.values()]
+        return (self.vocabularies,
+                np.array(ids, dtype=np.int64).reshape(-1, self.depth),
+                np.array(counts, dtype=np.int64))
+
+
+    def to_dict(self):
+        return {_key: self[_key] for _key in self}
+
+
+    def __getitem__(self, key):
+        """
+        The nested defaultdict of the counts under key, which is empty if there are none.
+        """
+
+        nested_dict = defaultdict(int) if self.depth == 2 else defaultdict(default_dict_int)
+        first_id = self.vocabulary_indexes[0].get(key)
+        for _packed, _count in self.counts.get(first_id, {}).items():
+            _ids = self.__unpack(_packed)
+            _dict = nested_dict
+            for _level, _id in enumerate(_ids[:-1], start=1):
+                _dict = _dict[self.vocabularies[_level][_id]]
+            _dict[self.vocabularies[-1][_ids[-1]]] = _count
+        return nested_dict
+
+
+    def __contains__(self, key):
+        return self.vocabulary_indexes[0].get(key) in self.counts
+
+
+    def __iter__(self):
+        return (self.vocabularies[0][_first_id] for _first_id in self.counts)
+
+
+    def __len__(self):
+        return len(self.counts)
+
+
+    def __reduce__(self):
+        # pickled as arrays, which is much smaller and faster than pickling the dicts
+        return NestedCounter.from_arrays, self.get_arrays()
+
+
+    def __repr__(self):
+        return f'NestedCounter(depth={self.depth}, {len(self)} keys)'
+
+
+class InvertedIndex:
+    """
+    Maps lowercased names (verbs or personas) to the positions of the documents they appear in, in CSR format:
+    the document positions of keys[i] are docs[key_ptr[i]:key_ptr[i+1]], in corpus order.
+    keys is sorted, so a lookup is a binary search followed by a slice.
+    """
+
+    def __init__(self, keys, key_ptr, docs):
+        self.keys = keys
+        self.key_ptr = key_ptr
+        self.docs = docs
+
+
+    @classmethod
+    def from_pairs(cls, names, name_idx, doc_idx):
+        """
+        Builds the index from (name, document position) pairs, with the names integer-encoded into the names list.
+        """
+
+        lower_names = [_name.lower() for _name in names]
+        keys = sorted(set(lower_names))
+        key_rank = {_key: i for i, _key in enumerate(keys)}
+        name_keys = np.array([key_rank[_name] for _name in lower_names], dtype=np.int64)
+
+        n_docs = int(doc_idx.max()) + 1 if len(doc_idx) else 1
+        pairs = np.unique(name_keys[name_idx] * n_docs + doc_idx)
+        pair_keys, docs = np.divmod(pairs, n_docs)
+
+        counts = np.bincount(pair_keys, minlength=len(keys))
+        is_present = counts > 0
+        keys = [_key for _key, _is_present in zip(keys, is_present.tolist()) if _is_present]
+        key_ptr = np.concatenate([[0], np.cumsum(counts[is_present])]).astype(np.int64)
+
+        return cls(keys, key_ptr, docs.astype(np.int64))
+
+
+    @classmethod
+    def concatenate(cls, indexes, doc_offsets):
+        """
+        Combines the indexes of consecutive sets of documents, shifting each one's document positions by its offset.
+        """
+
+        names = []
+        name_idx = []
+        doc_idx = []
+        for _index, _doc_offset in zip(indexes, doc_offsets):
+            name_idx.append(np.repeat(np.arange(len(_index.keys)), np.diff(_index.key_ptr)) + len(names))
+            doc_idx.append(np.asarray(_index.docs) + _doc_offset)
+            names.extend(_index.keys)
+
+        return cls.from_pairs(names, np.concatenate(name_idx + [np.zeros(0, dtype=np.int64)]), np.concatenate(doc_idx + [np.zeros(0, dtype=np.int64)]))
+
+
+    def remove_docs(self, is_removed):
+        """
+        Returns the index without the documents where is_removed (a boolean array over the document positions) is True,
+        with the remaining documents renumbered.
+        """
+
+        new_positions = np.cumsum(~is_removed) - 1
+        is_kept = ~is_removed[self.docs]
+        name_idx = np.repeat(np.arange(len(self.keys)), np.diff(self.key_ptr))[is_kept]
+
+        return InvertedIndex.from_pairs(self.keys, name_idx, new_positions[self.docs[is_kept]])
+
+
+    def get_docs(self, key, offset=0, limit=None):
+        """
+        The positions of the documents for a (lowercased) key, optionally only the limit documents after the first offset.
+        """
+
+        i = bisect.bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return np.zeros(0, dtype=np.int64)
+
+        start = int(self.key_ptr[i]) + offset
+        end = int(self.key_ptr[i + 1])
+        if limit is not None:
+            end = min(end, start + limit)
+
+        return np.asarray(self.docs[start:end])
+
+
+class StringColumn(Sequence):
+    """
+    A read-only list of strings stored as their concatenated UTF-8 bytes and the offset of each one, like the texts of a RiveterStore:
+    the i-th string is data[ptr[i]:ptr[i+1]]. The strings are decoded when they are read, so a memory-mapped StringColumn
+    is shared between processes rather than copied into each one.
+    """
+
+    def __init__(self, ptr, data):
+        self.ptr = ptr
+        self.data = data
+
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded_strings = [_string.encode('utf-8') for _string in strings]
+        ptr = np.concatenate([[0], np.cumsum([len(_string) for _string in encoded_strings], dtype=np.int64)]).astype(np.int64)
+        return cls(ptr, np.frombuffer(b''.join(encoded_strings), dtype=np.uint8))
+
+
+    def tolist(self):
+        ptr = self.ptr.tolist()
+        data = self.data.tobytes()
+        return [data[_start:_end].decode('utf-8') for _start, _end in zip(ptr[:-1], ptr[1:])]
+
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[_i] for _i in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('StringColumn index out of range')
+        return self.data[self.ptr[i]:self.ptr[i + 1]].tobytes().decode('utf-8')
+
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+
+    def __len__(self):
+        return len(self.ptr) - 1
+
+
+class BootstrapSampler:
+    """
+    Bootstrap resampling of per-persona scores over sparse per-document score and count arrays.
+    Each replicate is a row of multinomial document counts, so the persona score and count sums of
+    many replicates are the product of that (replicates x documents) matrix with the per-document arrays.
+    """
+
+    def __init__(self, n_docs, n_personas, score_doc, score_persona, score_value, count_doc, count_persona, count_value):
+        self.n_docs = n_docs
+        self.n_personas = n_personas
+        self.score_product = self.__prepare_product(score_doc, score_persona, score_value)
+        self.presence_product = self.__prepare_product(score_doc, score_persona, np.ones(len(score_value)))
+        self.count_product = self.__prepare_product(count_doc, count_persona, count_value)
+
+
+    def sample(self, num_bootstraps, rng):
+        """
+        Returns a num_bootstraps x n_personas array of persona scores,
+        which is NaN wherever a persona has no scored verbs in the resampled documents.
+        """
+
+        sample_counts = rng.multinomial(self.n_docs, np.full(self.n_docs, 1.0 / self.n_docs), size=num_bootstraps)
+
+        score_sums = self.__multiply(sample_counts, *self.score_product)
+        presence = self.__multiply(sample_counts, *self.presence_product)
+        count_sums = self.__multiply(sample_counts, *self.count_product)
+
+        scores = np.full(score_sums.shape, np.nan)
+        scored = (presence > 0) & (count_sums > 0)
+        scores[scored] = score_sums[scored] / count_sums[scored]
+
+        return scores
+
+
+    def sample_statistics(self, num_bootstraps, seed, keep_scores=False, chunk_size=None):
+        """
+        Draw num_bootstraps replicates with their own RNG stream (seed may be a numpy SeedSequence)
+        and return the number of replicates in which each persona is scored, the mean and the sum of squared
+        deviations of its scores, plus the scores themselves if keep_scores is set.
+        chunk_size: draw at most this many replicates at a time. The rows are drawn from the stream one after
+                    another, so the replicates are the same whatever the chunk size.
+        """
+
+        rng = np.random.default_rng(seed)
+        chunk_size = chunk_size or num_bootstraps
+        scores = np.vstack([self.sample(min(chunk_size, num_bootstraps - i), rng) for i in range(0, num_bootstraps, chunk_size)])
+
+        is_scored = ~np.isnan(scores)
+        n = is_scored.sum(axis=0)
+        means = np.divide(np.nansum(scores, axis=0), n, out=np.zeros(self.n_personas), where=n > 0)
+        m2 = np.nansum((scores - means) ** 2, axis=0)
+
+        return n, means, m2, (scores if keep_scores else None)
+
+
+    def get_chunk_size(self, memory_limit):
+        """
+        The number of replicates whose intermediate arrays fit in about memory_limit bytes.
+        """
+
+        max_entries = max(len(self.score_product[0]), len(self.count_product[0]))
+        replicate_size = 8 * (self.n_docs + 2 * max_entries + 6 * self.n_personas)
+
+        return max(1, int(memory_limit // replicate_size))
+
+
+    @staticmethod
+    def merge_statistics(statistics, other_statistics):
+        """
+        Combine the (n, mean, m2) statistics of two sets of replicates (Chan et al.'s parallel variance algorithm).
+        """
+
+        n_a, means_a, m2_a = statistics
+        n_b, means_b, m2_b = other_statistics
+
+        n = n_a + n_b
+        deltas = means_b - means_a
+        weights = np.divide(n_b, n, out=np.zeros(len(n)), where=n > 0)
+        means = means_a + deltas * weights
+        m2 = m2_a + m2_b + deltas ** 2 * n_a * weights
+
+        return n, means, m2
+
+
+    def __prepare_product(self, docs, personas, values):
+        """
+        Sort the nonzero entries by persona so that products can be reduced with np.add.reduceat.
+        """
+
+        order = np.argsort(personas, kind='stable')
+        docs = docs[order]
+        personas = personas[order]
+        values = values[order]
+
+        group_starts = np.flatnonzero(np.r_[True, personas[1:] != personas[:-1]]) if len(personas) else np.array([], dtype=np.int64)
+
+        return docs, values, group_starts, personas[group_starts]
+
+
+    def __multiply(self, sample_counts, docs, values, group_starts, group_personas):
+
+        product = np.zeros((sample_counts.shape[0], self.n_personas))
+        if len(group_starts):
+            product[:, group_personas] = np.add.reduceat(sample_counts[:, docs] * values, group_starts, axis=1)
+
+        return product
+
+
+# Each bootstrap worker process gets the sampler once, when it starts, instead of with every chunk
+_bootstrap_worker_sampler = None
+
+
+def _init_bootstrap_worker(sampler):
+    global _bootstrap_worker_sampler
+    _bootstrap_worker_sampler = sampler
+
+
+def _sample_bootstrap_block(num_bootstraps, seed, keep_scores, chunk_size):
+    return _bootstrap_worker_sampler.sample_statistics(num_bootstraps, seed, keep_scores, chunk_size)
+
+
+def read_corpus(path, text_column, id_column, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Streams (text, id) pairs from a CSV, TSV, JSONL or Parquet file, reading chunksize rows at a time.
+    Missing texts are read as empty strings. Parquet files need pyarrow.
+    """
+
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == '.parquet':
+        import pyarrow.parquet as pq
+        for _batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=[text_column, id_column]):
+            yield from _read_corpus_chunk(_batch.to_pandas(), text_column, id_column)
+
+    elif extension in ('.jsonl', '.ndjson'):
+        with pd.read_json(path, lines=True, chunksize=chunksize) as reader:
+            for _chunk in reader:
+                yield from _read_corpus_chunk(_chunk, text_column, id_column)
+
+    elif extension in ('.csv', '.tsv'):
+        with pd.read_csv(path, sep=('\t' if extension == '.tsv' else ','), usecols=[text_column, id_column], chunksize=chunksize) as reader:
+            for _chunk in reader:
+                yield from _read_corpus_chunk(_chunk, text_column, id_column)
+
+    else:
+        raise ValueError(f'Unsupported corpus file type "{extension}", expected .csv, .tsv, .jsonl or .parquet')
+
+
+def _read_corpus_chunk(chunk, text_column, id_column):
+    return zip(chunk[text_column].fillna('').astype(str).tolist(), chunk[id_column].tolist())
+
+
+class RiveterStore:
+    """
+    Columnar on-disk format of a trained Riveter: a directory with meta.json, holding the schema version, the settings
+    and the persona-level results, and a .npy file for each column of the per-document tables.
+    The per-document tables are in CSR format like CountMatrix: the rows of the i-th document are [doc_ptr[i]:doc_ptr[i+1]],
+    with the personas, verbs and entity matches integer-encoded into vocabularies that are stored as StringColumns.
+    The per-document tables and the persona-level NestedCounters are read when they are first needed. With mmap=True,
+    the columns and vocabularies are memory-mapped, so processes that open the same store share them through the OS page cache,
+    and single documents are looked up with a binary search of the sorted document IDs (in sorted_doc_ids and doc_id_order)
+    without decoding the tables.
+    """
+
+    # Riveter attributes that are stored in the per-document tables, rather than in meta.json
+    PER_DOCUMENT_ATTRIBUTES = ['text_ids', 'texts', 'id_persona_count_dict', 'id_nsubj_verb_count_dict', 'id_dobj_verb_count_dict',
+                               'id_persona_score_dict', 'id_persona_scored_verb_dict', 'id_entity_match_count_dict',
+                               'verb_doc_index', 'persona_doc_index']
+
+    # Inverted indexes: (Riveter attribute, column prefix)
+    INDEXES = [('verb_doc_index', 'verb_index'), ('persona_doc_index', 'persona_index')]
+
+    # Per-document {persona: value} tables: (Riveter attribute, column prefix, table class)
+    PERSONA_TABLES = [('id_persona_count_dict', 'persona_count', PersonaTable),
+                      ('id_persona_score_dict', 'persona_score', PersonaScoreTable),
+                      ('id_persona_scored_verb_dict', 'persona_scored_verb', PersonaTable)]
+
+    # Persona-level NestedCounters: (Riveter attribute, column prefix, depth)
+    COUNTERS = [('entity_match_count_dict', 'entity_match_counts', 2),
+                ('persona_polarity_verb_count_dict', 'polarity_verb_counts', 3)]
+
+    # Riveter attributes that are read from the store the first time they are used
+    LAZY_ATTRIBUTES = PER_DOCUMENT_ATTRIBUTES + [_attribute for _attribute, _, _ in COUNTERS]
+
+    def __init__(self, path, mmap=False, read_only=False):
+        self.path = path
+        self.mmap = mmap
+        self.read_only = read_only
+        self.lists = {}
+        self.columns = {}
+
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+
+        if self.meta['schema_version'] > SCHEMA_VERSION:
+            raise ValueError(f'"{path}" was saved with a newer version of riveter (schema version {self.meta["schema_version"]}), upgrade riveter to load it')
+
+
+    @classmethod
+    def write(cls, path, riveter, keep_texts=True):
+
+        if riveter.id_nsubj_verb_count_dict is None:
+            raise ValueError('Only trained Riveters can be saved in this format, save to a .pkl file instead')
+
+        columns = {}
+        lists = {}
+        doc_ids = riveter.id_nsubj_verb_count_dict.matrix.doc_ids
+        columns['text_ids'] = cls.encode_ids(riveter.text_ids)
+        columns['doc_ids'] = cls.encode_ids(doc_ids)
+        columns['doc_id_order'] = np.argsort(columns['doc_ids'], kind='stable')
+        columns['sorted_doc_ids'] = columns['doc_ids'][columns['doc_id_order']]
+
+        # The tables share one persona vocabulary in the store
+        matrix = riveter.id_nsubj_verb_count_dict.matrix
+        persona_index = {_persona: i for i, _persona in enumerate(matrix.personas)}
+        columns['count_doc_ptr'] = matrix.doc_ptr
+        columns['count_persona'] = matrix.persona_idx
+        columns['count_verb'] = matrix.verb_idx
+        columns['count_role'] = matrix.role
+        columns['count_value'] = matrix.count
+        lists['verbs'] = matrix.verbs
+
+        for _attribute, _prefix, _ in cls.PERSONA_TABLES:
+            _table = getattr(riveter, _attribute)
+            if _table is None:
+                continue
+            columns[_prefix + '_doc_ptr'] = _table.doc_ptr
+            columns[_prefix + '_persona'] = get_vocabulary_ids(_table.personas, persona_index)[_table.persona_idx]
+            columns[_prefix + '_value'] = _table.value
+
+        if riveter.id_entity_match_count_dict is not None:
+            _table = riveter.id_entity_match_count_dict
+            columns['entity_doc_ptr'] = _table.doc_ptr
+            columns['entity_persona'] = get_vocabulary_ids(_table.personas, persona_index)[_table.persona_idx]
+            columns['entity_match'] = _table.match_idx
+            columns['entity_value'] = _table.count
+            lists['matches'] = _table.matches
+
+        if keep_texts and riveter.texts is not None:
+            texts = StringColumn.from_strings(riveter.texts)
+            columns['text_ptr'] = texts.ptr
+            columns['text_data'] = texts.data
+
+        lists['personas'] = list(persona_index.keys())
+
+        if riveter.verb_score_dict is not None:
+            lexicon = riveter.verb_score_dict if isinstance(riveter.verb_score_dict, Lexicon) else Lexicon.from_dict(riveter.verb_score_dict)
+            columns['lexicon_agent'] = lexicon.agent_scores
+            columns['lexicon_theme'] = lexicon.theme_scores
+            columns['lexicon_in_dimension'] = lexicon.in_dimension
+            lists['lexicon_verbs'] = lexicon.verbs
+            lists['lexicon_dimensions'] = [_dimension or '' for _dimension in lexicon.dimensions]
+
+        if riveter.persona_dimension_score_sums is not None:
+            columns['dimension_score_sums'] = riveter.persona_dimension_score_sums
+            columns['dimension_match_counts'] = riveter.persona_dimension_match_counts
+            lists['dimension_personas'] = riveter.dimension_personas
+
+        for _attribute, _prefix in cls.INDEXES:
+            _index = getattr(riveter, _attribute)
+            if _index is not None:
+                columns[_prefix + '_ptr'] = np.asarray(_index.key_ptr)
+                columns[_prefix + '_docs'] = np.asarray(_index.docs)
+                lists[_prefix + '_keys'] = list(_index.keys)
+
+        for _attribute, _prefix, _ in cls.COUNTERS:
+            _vocabularies, columns[_prefix + '_ids'], columns[_prefix + '_counts'] = getattr(riveter, _attribute).get_arrays()
+            for _level, _vocabulary in enumerate(_vocabularies):
+                lists[f'{_prefix}_vocabulary_{_level}'] = _vocabulary
+
+        # The lists are stored as StringColumns, so they can be memory-mapped like the other columns
+        for _name, _list in lists.items():
+            _column = StringColumn.from_strings(_list)
+            columns[_name + '_ptr'] = _column.ptr
+            columns[_name + '_data'] = _column.data
+
+        meta = {'schema_version': SCHEMA_VERSION,
+                'columns': sorted(columns.keys()),
+                'lists': sorted(lists.keys()),
+                'model_name': riveter.model_name,
+                'coref_model_name': riveter.coref_model_name,
+                'coref_window_size': riveter.coref_window_size,
+                'coref_window_overlap': riveter.coref_window_overlap,
+                'phrasal_verbs': riveter.phrasal_verbs,
+                'pipeline_components': riveter.pipeline_components,
+                'corpus_source': riveter.corpus_source,
+                'persona_patterns_dict': cls.encode_persona_patterns(riveter.persona_patterns_dict),
+                'scored_dimensions': riveter.scored_dimensions,
+                'people_words': riveter.people_words,
+                'persona_score_dict': riveter.persona_score_dict,
+                'persona_sd_dict': riveter.persona_sd_dict,
+                'persona_ci_dict': riveter.persona_ci_dict,
+                'persona_score_sum_dict': riveter.persona_score_sum_dict,
+                'persona_count_dict': riveter.persona_count_dict,
+                'persona_match_count_dict': riveter.persona_match_count_dict}
+        # Serialized before any column is written, so a meta.json that can't be written doesn't leave a half-written store
+        meta_json = json.dumps(meta, default=_json_default)
+
+        os.makedirs(path, exist_ok=True)
+        for _name, _column in columns.items():
+            np.save(os.path.join(path, _name + '.npy'), _column, allow_pickle=False)
+
+        # meta.json is written last, so a directory is only loadable once all of its columns are written
+        tmp_path = os.path.join(path, 'meta.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(meta_json)
+        os.replace(tmp_path, os.path.join(path, 'meta.json'))
+
+
+    @staticmethod
+    def encode_persona_patterns(persona_patterns_dict):
+        # Compiled patterns are stored with their flags and recompiled by decode_persona_patterns()
+        if persona_patterns_dict is None:
+            return None
+        return {_persona: {'pattern': _pattern.pattern, 'flags': _pattern.flags} if isinstance(_pattern, re.Pattern) else _pattern
+                for _persona, _pattern in persona_patterns_dict.items()}
+
+
+    @staticmethod
+    def decode_persona_patterns(persona_patterns_dict):
+        if persona_patterns_dict is None:
+            return None
+        return {_persona: re.compile(_pattern['pattern'], _pattern['flags']) if isinstance(_pattern, dict) else _pattern
+                for _persona, _pattern in persona_patterns_dict.items()}
+
+
+    @staticmethod
+    def encode_ids(ids):
+        if all(isinstance(_id, (int, np.integer)) and not isinstance(_id, bool) for _id in ids):
+            return np.array(ids, dtype=np.int64)
+        if all(isinstance(_id, str) for _id in ids):
+            return np.array(ids, dtype=str)
+        raise ValueError('The document IDs must all be integers or all be strings to save in this format, save to a .pkl file instead')
+
+
+    def has_column(self, name):
+        return name in self.meta['columns']
+
+
+    def get_column(self, name):
+        return np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r' if self.mmap else None, allow_pickle=False)
+
+
+    def get_cached_column(self, name):
+        if name not in self.columns:
+            self.columns[name] = self.get_column(name)
+        return self.columns[name]
+
+
+    def get_list(self, name):
+        """
+        A list of strings, as a StringColumn over the memory-mapped columns with mmap=True.
+        """
+        if name not in self.lists:
+            if name in self.meta.get('lists', []):
+                column = StringColumn(self.get_column(name + '_ptr'), self.get_column(name + '_data'))
+                self.lists[name] = column if self.mmap else column.tolist()
+            else:
+                # Stores of schema version 1 have their lists in .json files
+                with open(os.path.join(self.path, name + '.json'), encoding='utf-8') as f:
+                    self.lists[name] = json.load(f)
+        return self.lists[name]
+
+
+    def get_counter(self, attribute):
+        for _attribute, _prefix, _depth in self.COUNTERS:
+            if attribute != _attribute:
+                continue
+            if not self.has_column(_prefix + '_ids'):
+                return NestedCounter.from_dict(self.meta[_attribute], _depth)
+            if self.meta['schema_version'] == 1:
+                vocabularies = self.get_list(_prefix + '_vocabularies')
+            else:
+                vocabularies = [self.get_list(f'{_prefix}_vocabulary_{_level}') for _level in range(_depth)]
+            return NestedCounter.from_arrays(vocabularies, self.get_column(_prefix + '_ids'), self.get_column(_prefix + '_counts'))
+        raise KeyError(attribute)
+
+
+    def get_meta_attributes(self):
+        """
+        The settings and persona-level results in meta.json, as Riveter attributes with their usual types.
+        """
+
+        meta = self.meta
+        attributes = {_name: meta[_name] for _name in ['model_name', 'coref_model_name', 'coref_window_size', 'coref_window_overlap',
+                                                       'people_words', 'persona_score_dict', 'persona_sd_dict']}
+        attributes['persona_patterns_dict'] = self.decode_persona_patterns(meta['persona_patterns_dict'])
+        attributes['corpus_source'] = tuple(meta['corpus_source']) if meta['corpus_source'] is not None else None
+        attributes['phrasal_verbs'] = meta.get('phrasal_verbs', False)
+        attributes['pipeline_components'] = meta.get('pipeline_components')
+        if self.has_column('lexicon_agent'):
+            attributes['verb_score_dict'] = Lexicon(self.get_list('lexicon_verbs'), self.get_column('lexicon_agent'), self.get_column('lexicon_theme'),
+                                                    dimensions=[_dimension or None for _dimension in self.get_list('lexicon_dimensions')] if self.has_column('lexicon_in_dimension') else None,
+                                                    in_dimension=self.get_column('lexicon_in_dimension') if self.has_column('lexicon_in_dimension') else None)
+        else:
+            attributes['verb_score_dict'] = defaultdict(default_dict_int, meta['verb_score_dict']) if meta.get('verb_score_dict') is not None else None
+        attributes['persona_ci_dict'] = {_persona: tuple(_ci) for _persona, _ci in meta['persona_ci_dict'].items()} if meta['persona_ci_dict'] is not None else None
+        attributes['persona_score_sum_dict'] = defaultdict(float, meta['persona_score_sum_dict']) if meta['persona_score_sum_dict'] is not None else None
+        if self.has_column('dimension_score_sums'):
+            attributes['scored_dimensions'] = meta['scored_dimensions']
+            attributes['dimension_personas'] = self.get_list('dimension_personas')
+            attributes['persona_dimension_score_sums'] = self.get_column('dimension_score_sums')
+            attributes['persona_dimension_match_counts'] = self.get_column('dimension_match_counts')
+        attributes['persona_count_dict'] = defaultdict(int, meta['persona_count_dict'])
+        attributes['persona_match_count_dict'] = defaultdict(int, meta['persona_match_count_dict'])
+        return attributes
+
+
+    def get_ids(self, name):
+        return self.get_column(name).tolist()
+
+
+    def get_texts(self):
+        if not self.has_column('text_data'):
+            return None
+        return StringColumn(self.get_column('text_ptr'), self.get_column('text_data')).tolist()
+
+
+    def get_docs_at(self, positions):
+        """
+        The IDs and texts (or None if the texts weren't saved) of the documents at these positions in the per-document tables.
+        """
+
+        doc_ids = self.get_cached_column('doc_ids')
+        target_ids = doc_ids[positions].tolist()
+
+        # The texts are in the order of text_ids, which is the same as the tables' unless text_ids has duplicates
+        if not self.has_column('text_data') or len(self.get_cached_column('text_ids')) != len(doc_ids):
+            return target_ids, None
+
+        text_ptr = self.get_cached_column('text_ptr')
+        text_data = self.get_cached_column('text_data')
+        texts = [text_data[text_ptr[_i]:text_ptr[_i + 1]].tobytes().decode('utf-8') for _i in positions.tolist()]
+
+        return target_ids, texts
+
+
+    def get_index(self, prefix):
+        if not self.has_column(prefix + '_ptr'):
+            return None
+        return InvertedIndex(self.get_list(prefix + '_keys'), self.get_column(prefix + '_ptr'), self.get_column(prefix + '_docs'))
+
+
+    def get_doc_ids(self):
+        if 'doc_ids' not in self.lists:
+            self.lists['doc_ids'] = self.get_ids('doc_ids')
+        return self.lists['doc_ids']
+
+
+    def get_count_matrix(self):
+        return CountMatrix(self.get_doc_ids(),
+                           self.get_column('count_doc_ptr'),
+                           {'personas': self.get_list('personas'), 'verbs': self.get_list('verbs')},
+                           {'persona_idx': self.get_column('count_persona'),
+                            'verb_idx': self.get_column('count_verb'),
+                            'role': self.get_column('count_role'),
+                            'count': self.get_column('count_value')})
+
+
+    def get_persona_table(self, prefix, table_class):
+
+        if not self.has_column(prefix + '_doc_ptr'):
+            return None
+
+        return table_class(self.get_doc_ids(),
+                           self.get_column(prefix + '_doc_ptr'),
+                           {'personas': self.get_list('personas')},
+                           {'persona_idx': self.get_column(prefix + '_persona'), 'value': self.get_column(prefix + '_value')})
+
+
+    def get_entity_table(self):
+
+        if not self.has_column('entity_doc_ptr'):
+            return None
+
+        return EntityTable(self.get_doc_ids(),
+                           self.get_column('entity_doc_ptr'),
+                           {'personas': self.get_list('personas'), 'matches': self.get_list('matches')},
+                           {'persona_idx': self.get_column('entity_persona'),
+                            'match_idx': self.get_column('entity_match'),
+                            'count': self.get_column('entity_value')})
+
+
+    def has_table(self, attribute):
+        if attribute in ('id_nsubj_verb_count_dict', 'id_dobj_verb_count_dict'):
+            return self.has_column('count_doc_ptr')
+        if attribute == 'id_entity_match_count_dict':
+            return self.has_column('entity_doc_ptr')
+        return any(self.has_column(_prefix + '_doc_ptr') for _attribute, _prefix, _ in self.PERSONA_TABLES if _attribute == attribute)
+
+
+    def get_doc_index(self, doc_id):
+        """
+        The row of a document in the per-document tables, found by binary search; raises KeyError for unknown IDs.
+        """
+
+        if not self.has_column('sorted_doc_ids'):
+            doc_ids = self.get_cached_column('doc_ids')
+            self.columns['doc_id_order'] = np.argsort(doc_ids, kind='stable')
+            self.columns['sorted_doc_ids'] = doc_ids[self.columns['doc_id_order']]
+        sorted_doc_ids = self.get_cached_column('sorted_doc_ids')
+
+        if (sorted_doc_ids.dtype.kind == 'U') != isinstance(doc_id, str):
+            raise KeyError(doc_id)
+        i = int(np.searchsorted(sorted_doc_ids, doc_id))
+        if i == len(sorted_doc_ids) or sorted_doc_ids[i] != doc_id:
+            raise KeyError(doc_id)
+
+        return int(self.get_cached_column('doc_id_order')[i])
+
+
+    def get_doc(self, attribute, doc_id):
+        """
+        One document's entry of the per-document table that holds a Riveter attribute, without decoding the rest of the table.
+        """
+
+        i = self.get_doc_index(doc_id)
+        personas = self.get_list('personas')
+
+        if attribute in ('id_nsubj_verb_count_dict', 'id_dobj_verb_count_dict'):
+            verbs = self.get_list('verbs')
+            doc_ptr = self.get_cached_column('count_doc_ptr')
+            rows = slice(doc_ptr[i], doc_ptr[i + 1])
+            role = NSUBJ if attribute == 'id_nsubj_verb_count_dict' else DOBJ
+            verb_count_dict = defaultdict(int)
+            for _persona_i, _verb_i, _role, _count in zip(self.get_cached_column('count_persona')[rows].tolist(),
+                                                          self.get_cached_column('count_verb')[rows].tolist(),
+                                                          self.get_cached_column('count_role')[rows].tolist(),
+                                                          self.get_cached_column('count_value')[rows].tolist()):
+                if _role == role:
+                    verb_count_dict[(personas[_persona_i], verbs[_verb_i])] = _count
+            return verb_count_dict
+
+        if attribute == 'id_entity_match_count_dict':
+            matches = self.get_list('matches')
+            doc_ptr = self.get_cached_column('entity_doc_ptr')
+            rows = slice(doc_ptr[i], doc_ptr[i + 1])
+            entity_match_count_dict = defaultdict(default_dict_int)
+            for _persona_i, _match_i, _count in zip(self.get_cached_column('entity_persona')[rows].tolist(),
+                                                    self.get_cached_column('entity_match')[rows].tolist(),
+                                                    self.get_cached_column('entity_value')[rows].tolist()):
+                entity_match_count_dict[personas[_persona_i]][matches[_match_i]] = _count
+            return entity_match_count_dict
+
+        for _attribute, _prefix, _table_class in self.PERSONA_TABLES:
+            if attribute == _attribute:
+                doc_ptr = self.get_cached_column(_prefix + '_doc_ptr')
+                rows = slice(doc_ptr[i], doc_ptr[i + 1])
+                persona_value_dict = defaultdict(_table_class.default_factory)
+                for _persona_i, _value in zip(self.get_cached_column(_prefix + '_persona')[rows].tolist(),
+                                              self.get_cached_column(_prefix + '_value')[rows].tolist()):
+                    persona_value_dict[personas[_persona_i]] = _value
+                return persona_value_dict
+
+        raise KeyError(attribute)
+
+
+    def load(self, attribute):
+        """
+        Reads the per-document table or NestedCounter that holds a Riveter attribute.
+        Returns {attribute: value}, with the nsubj and dobj counts always read together.
+        """
+
+        if attribute == 'text_ids':
+            return {'text_ids': self.get_ids('text_ids')}
+        if attribute == 'texts':
+            return {'texts': self.get_texts()}
+        if attribute in ('id_nsubj_verb_count_dict', 'id_dobj_verb_count_dict'):
+            matrix = self.get_count_matrix()
+            return {'id_nsubj_verb_count_dict': matrix.get_role_view(NSUBJ), 'id_dobj_verb_count_dict': matrix.get_role_view(DOBJ)}
+        if attribute == 'id_entity_match_count_dict':
+            return {'id_entity_match_count_dict': self.get_entity_table()}
+        for _attribute, _prefix, _table_class in self.PERSONA_TABLES:
+            if attribute == _attribute:
+                return {_attribute: self.get_persona_table(_prefix, _table_class)}
+        for _attribute, _prefix in self.INDEXES:
+            if attribute == _attribute:
+                return {_attribute: self.get_index(_prefix)}
+        return {attribute: self.get_counter(attribute)}
+
+
+def _json_default(value):
+    # numpy scalars, e.g. lexicon scores read with pandas
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def default_dict_int():
+        return defaultdict(int)
+
+
+def default_dict_int_2():
+        return defaultdict(default_dict_int)
+
+
+class RiveterStats:
+    """
+    Opt-in instrumentation of a Riveter (see Riveter.enable_stats()): the cumulative seconds spent in each stage,
+    counts of the documents, tokens, clusters, noun chunks and verbs processed, and the lexicon hit rate.
+    The callbacks are called as callback(event, stats) when extract(), rescore(), train(), update() or remove() return,
+    e.g. to export the stats to a metrics system. When one of these methods calls another, e.g. train() calls extract() and rescore(),
+    the inner call is timed as a sub-entry of the outer one (e.g. 'train.extract'), and only the outer one is reported.
+    """
+
+    def __init__(self, callbacks=None):
+        self.timers = defaultdict(float) # stage -> seconds
+        self.counters = defaultdict(int)
+        self.callbacks = list(callbacks) if callbacks else []
+        self.calls = [] # the instrumented methods in progress, outermost first
+
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[stage] += time.perf_counter() - start
+
+
+    def time_iterator(self, stage, iterable):
+        """
+        Yields the items of iterable, adding the time spent waiting for each of them to stage.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.timers[stage] += time.perf_counter() - start
+            yield item
+
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+
+    def get_lexicon_hit_rate(self):
+        """
+        The fraction of the extracted verb occurrences that were in the lexicon, or None if nothing has been scored.
+        """
+        if not self.counters['verb_occurrences']:
+            return None
+        return self.counters['scored_verb_occurrences'] / self.counters['verb_occurrences']
+
+
+    def to_dict(self):
+        return {'timers': dict(self.timers), 'counters': dict(self.counters), 'lexicon_hit_rate': self.get_lexicon_hit_rate()}
+
+
+    def reset(self):
+        self.timers.clear()
+        self.counters.clear()
+
+
+    def report(self, event):
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('%s: %s', event, ', '.join([f'{_stage} {_seconds:.3f}s' for _stage, _seconds in self.timers.items()] +
+                                                   [f'{_name} {_count}' for _name, _count in self.counters.items()]))
+        for _callback in self.callbacks:
+            _callback(event, self)
+
+
+    def __getstate__(self):
+        # The callbacks often can't be pickled, e.g. lambdas or methods of a metrics client
+        state = self.__dict__.copy()
+        state['callbacks'] = []
+        state['calls'] = []
+        return state
+
+
+    def __repr__(self):
+        return f'RiveterStats({self.to_dict()})'
+
+
+def instrumented(method):
+    """
+    Times a Riveter method under its name in the Riveter's stats, if they are enabled, and reports them when it returns.
+    Calls from another instrumented method are timed under both names, e.g. 'train.rescore', and aren't reported,
+    so the time of the outer call isn't counted twice and the callbacks are called once.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        stats = self.stats
+        if stats is None:
+            return method(self, *args, **kwargs)
+
+        stats.calls.append(method.__name__)
+        try:
+            with stats.timer('.'.join(stats.calls)):
+                result = method(self, *args, **kwargs)
+        finally:
+            stats.calls.pop()
+
+        if not stats.calls:
+            stats.report(method.__name__)
+        return result
+
+    return wrapper
+
+
+class Riveter:
+
+    def __init__(self, filename=None, model_name=DEFAULT_MODEL, coref_model_name=DEFAULT_COREF_MODEL):
+        self.model_name = model_name
+        self.coref_model_name = coref_model_name
+        self.coref_window_size = None
+        self.coref_window_overlap = DEFAULT_COREF_WINDOW_OVERLAP
+        self.phrasal_verbs = False
+        self.pipeline_components = None # the spaCy components run when parsing, if not the ones extraction needs
+        self.stats = None # RiveterStats, if enabled with enable_stats()
+        self.progress_bar = tqdm # wraps the documents as they are extracted, like tqdm(iterable, total=...); None for no progress bar
+        self.texts = None
+        self.text_ids = None
+        self.corpus_source = None # (path, text_column, id_column) when trained from a file without keeping the texts
+        self.verb_score_dict = None
+        self.persona_score_dict = None
+        self.persona_sd_dict = None
+        self.persona_ci_dict = None
+        self.persona_score_sum_dict = None # the unnormalized persona scores, kept so documents can be added and removed
+        self.id_persona_score_dict = None
+        self.id_persona_count_dict = None
+        self.id_nsubj_verb_count_dict = None
+        self.id_dobj_verb_count_dict = None
+        self.id_persona_scored_verb_dict = None # the number of scored verbs for each document and persona
+        self.id_entity_match_count_dict = None
+        self.verb_doc_index = None # lowercased verb -> positions of the documents it occurs in
+        self.persona_doc_index = None # lowercased persona -> positions of the documents it has scored verbs in
+        self.scored_dimensions = None # the lexicon dimensions that persona_dimension_score_sums has scores for
+        self.dimension_personas = None # the personas of the rows of persona_dimension_score_sums and persona_dimension_match_counts
+        self.persona_dimension_score_sums = None # (personas x dimensions) unnormalized scores in every lexicon dimension
+        self.persona_dimension_match_counts = None # (personas x dimensions) numbers of scored verbs
+        self.persona_patterns_dict = None
+        self.entity_match_count_dict = NestedCounter(2) # persona -> entity match -> count
+        self.persona_count_dict = defaultdict(int)
+        self.persona_match_count_dict = defaultdict(int)
+        self.people_words = None
+        self.persona_polarity_verb_count_dict = NestedCounter(3) # persona -> polarity -> verb -> count
+        self.__store = None # the RiveterStore that the per-document tables are read from, if loaded from one
+
+        # TODO: this should go into a load() function instead
+        if filename and os.path.isdir(filename):
+            self.__load_store(RiveterStore(filename))
+
+        elif filename:
+            with open(filename, 'rb') as f:
+                my_riveter = pickle.load(f)
+
+            for k in my_riveter.__dict__.keys():
+                if k in self.__dict__.keys():
+                    setattr(self, k, getattr(my_riveter, k))
+            self.__convert_dicts()
+
+
+    def __getattr__(self, name):
+        # Only called for missing attributes: the per-document tables and NestedCounters of a Riveter loaded from a RiveterStore
+        # are read the first time they are used
+        store = self.__dict__.get('_Riveter__store')
+        if store is None or name not in RiveterStore.LAZY_ATTRIBUTES:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        for _name, _value in store.load(name).items():
+            self.__dict__.setdefault(_name, _value)
+        return self.__dict__[name]
+
+
+    def __getstate__(self):
+        # save() reads all of the per-document tables before pickling, so the store itself is not needed
+        state = self.__dict__.copy()
+        state['_Riveter__store'] = None
+        # A custom progress bar might not be picklable
+        state['progress_bar'] = tqdm
+        return state
+
+
+    def enable_stats(self, callbacks=None):
+        """
+        Start collecting RiveterStats in self.stats: cumulative timers for each stage of extraction and scoring,
+        and counts of the documents, tokens, coref clusters, noun chunks and verbs processed.
+        callbacks: functions called as callback(event, stats) when extract(), rescore(), train(), update() or remove() return.
+        """
+        self.stats = RiveterStats(callbacks)
+        return self.stats
+
+
+    def __timer(self, stage):
+        return self.stats.timer(stage) if self.stats is not None else contextlib.nullcontext()
+
+
+    @classmethod
+    def open(cls, path, mmap=True):
+        """
+        Open a Riveter saved in the columnar format (see save()) read-only, for answering queries.
+        With mmap=True the stored columns are memory-mapped, so processes that open the same path share their memory,
+        and per-document methods like get_scores_for_doc() and count_nsubj_for_doc() read just that document's rows.
+        """
+        riveter = cls()
+        riveter.__load_store(RiveterStore(path, mmap=mmap, read_only=True))
+        return riveter
+
 
+    def __check_writable(self):
+        if self.__store is not None and self.__store.read_only:
+            raise ValueError('This Riveter was opened read-only with Riveter.open(), load it with Riveter(filename=...) to change it')
 
-def default_dict_int_2():
-        return defaultdict(default_dict_int)
 
+    def __get_doc_table(self, attribute, doc_id):
+        """
+        One document's entry of a per-document table, e.g. id_persona_score_dict[doc_id].
+        Riveters opened with Riveter.open() read it from the stored columns instead of loading the whole table.
+        """
+        store = self.__store
+        if store is not None and store.read_only and attribute not in self.__dict__ and store.has_table(attribute):
+            return store.get_doc(attribute, doc_id)
+        return getattr(self, attribute)[doc_id]
 
-class Riveter:
 
-    def __init__(self, filename=None):
-        self.texts = None
-        self.verb_score_dict = None
-        self.persona_score_dict = None
-        self.persona_sd_dict = None
-        self.id_persona_score_dict = None
-        self.id_persona_count_dict = None
-        self.id_nsubj_verb_count_dict = None
-        self.id_dobj_verb_count_dict = None
-        self.id_persona_scored_verb_dict = None # the number of scored verbs for each document and persona
-        self.entity_match_count_dict = defaultdict(default_dict_int)
-        self.persona_count_dict = defaultdict(int)
-        self.persona_match_count_dict = defaultdict(int)
-        self.people_words = None
-        self.persona_polarity_verb_count_dict = defaultdict(default_dict_int_2)
+    def __set_count_matrix(self, matrix):
+        self.id_nsubj_verb_count_dict = matrix.get_role_view(NSUBJ)
+        self.id_dobj_verb_count_dict = matrix.get_role_view(DOBJ)
 
-        # TODO: this should go into a load() function instead
-        if filename:
-            with open(filename, 'rb') as f:
-                my_riveter = pickle.load(f)
 
-            for k in my_riveter.__dict__.keys():
-                if k in self.__dict__.keys():
-                    setattr(self, k, getattr(my_riveter, k))
+    def __convert_dicts(self):
+        """
+        Riveters pickled by older versions have their per-document results in {doc_id: {...}} dicts rather than tables,
+        and their entity match and polarity verb counts in nested defaultdicts rather than NestedCounters.
+        """
+        if isinstance(self.id_nsubj_verb_count_dict, dict):
+            self.__set_count_matrix(CountMatrix.from_dicts(self.id_nsubj_verb_count_dict, self.id_dobj_verb_count_dict))
+        for _attribute, _, _table_class in RiveterStore.PERSONA_TABLES:
+            if isinstance(getattr(self, _attribute), dict):
+                setattr(self, _attribute, _table_class.from_dicts(getattr(self, _attribute)))
+        if isinstance(self.id_entity_match_count_dict, dict):
+            self.id_entity_match_count_dict = EntityTable.from_dicts(self.id_entity_match_count_dict)
+        for _attribute, _, _depth in RiveterStore.COUNTERS:
+            if isinstance(getattr(self, _attribute), dict):
+                setattr(self, _attribute, NestedCounter.from_dict(getattr(self, _attribute), _depth))
+
+
+    def __load_store(self, store):
+        for _name, _value in store.get_meta_attributes().items():
+            setattr(self, _name, _value)
+        for _name in RiveterStore.LAZY_ATTRIBUTES:
+            delattr(self, _name)
+        self.__store = store
+
+
+    def save(self, filename='riveter.pkl', keep_texts=True):
+        """
+        Paths ending in .pkl or .pickle are saved as a pickle of the whole object.
+        Any other path is saved as a RiveterStore directory, which loads faster and reads the per-document tables only when they are needed.
+        keep_texts: also save the texts (RiveterStore only).
+        """
 
+        # Read any per-document tables and NestedCounters that haven't been loaded yet
+        for _name in RiveterStore.LAZY_ATTRIBUTES:
+            getattr(self, _name)
+
+        if os.path.splitext(filename)[1] in ('.pkl', '.pickle'):
+            self.__store = None
+            with open(filename, 'wb') as file:
+                # for k, v in self.__dict__.items():
+                #     if isinstance(v, dict):
+                #         setattr(self, k, dict(v))
+                pickle.dump(self, file, pickle.HIGHEST_PROTOCOL)
+        else:
+            RiveterStore.write(filename, self, keep_texts=keep_texts)
 
-    def save(self, filename='riveter.pkl'):
-        with open(filename, 'wb') as file:
-            # for k, v in self.__dict__.items():
-            #     if isinstance(v, dict):
-            #         setattr(self, k, dict(v))
-            pickle.dump(self, file, pickle.HIGHEST_PROTOCOL)
-            print(f'Riveter successfully saved to "{filename}"')
+        logger.info('Riveter successfully saved to "%s"', filename)
 
 
     # def load_lexicon(self, label):
@@ -106,25 +2118,44 @@ class Riveter:
         Note: the persp
         """
 
-        from IPython import embed
-        lexicon_df = pd.read_csv(os.path.join(BASEPATH, 'data/rashkin-lexicon/full_frame_info.txt'), sep='\t')
+        self.verb_score_dict = self.__read_rashkin_lexicon(dimension)
+
+
+    def load_sap_lexicon(self, dimension='power'):
+        self.verb_score_dict = self.__read_sap_lexicon(dimension)
 
-        verb_score_dict = defaultdict(default_dict_int)
-        for i, _row in lexicon_df.iterrows():
 
-            _lemma  = _row['verb'].strip()
+    def load_lexicon_dimensions(self, dimensions):
+        """
+        Load several lexicon dimensions at once, to score all of them from a single extraction, e.g. ['power', 'agency', 'effect'].
+        dimensions: names of Sap (power, agency) and Rashkin dimensions, or Lexicon objects with named dimensions.
+        The first dimension is the primary one, which persona_score_dict, the bootstrap and the polarity counts are for.
+        get_score_totals(dimension=...) and get_score_matrix() give the scores in every dimension.
+        """
+
+        lexicons = []
+        for _dimension in dimensions:
+            if isinstance(_dimension, Lexicon):
+                lexicons.append(_dimension)
+            elif _dimension in SAP_DIMENSIONS:
+                lexicons.append(self.__read_sap_lexicon(_dimension))
+            elif _dimension in RASHKIN_DIMENSIONS:
+                lexicons.append(self.__read_rashkin_lexicon(_dimension))
+            else:
+                raise ValueError(f'Unknown lexicon dimension "{_dimension}", expected one of {SAP_DIMENSIONS + RASHKIN_DIMENSIONS}')
 
-            _score_dict = {'agent': 0, 'theme': 0}
+        self.verb_score_dict = Lexicon.combine(lexicons)
 
-            _score_dict['agent'] += _row.get(dimension + '(a)',0) # TODO: Should the Rashkin scores be converted to [-1, 0, 1]?
-            _score_dict['theme'] += _row.get(dimension + '(t)',0)
 
-            verb_score_dict[_lemma] = _score_dict
+    def __read_rashkin_lexicon(self, dimension):
 
-        self.verb_score_dict = verb_score_dict
+        lexicon_df = pd.read_csv(os.path.join(BASEPATH, 'data/rashkin-lexicon/full_frame_info.txt'), sep='\t')
 
+        # TODO: Should the Rashkin scores be converted to [-1, 0, 1]?
+        return Lexicon.from_dataframe(lexicon_df, 'verb', dimension + '(a)', dimension + '(t)', dimension=dimension)
 
-    def load_sap_lexicon(self, dimension='power'):
+
+    def __read_sap_lexicon(self, dimension):
 
         label_dict = {'power_agent':  {'agent': 1, 'theme': -1},
                       'power_theme':  {'agent': -1, 'theme': 1},
@@ -134,41 +2165,38 @@ class Riveter:
                       'agency_equal': {'agent': 0, 'theme': 0}}
 
         lexicon_df = pd.read_csv(os.path.join(BASEPATH, 'data/sap-lexicon/agency_power.csv'))
+        lexicon_df = lexicon_df[lexicon_df[dimension].notnull()]
 
-        verb_score_dict = defaultdict(default_dict_int)
-        for i, _row in lexicon_df.iterrows():
-            if not pd.isnull(_row[dimension]):
-                _lemma  = _row['verb'].strip()
-                verb_score_dict[_lemma] = label_dict[_row[dimension]]
-
-        self.verb_score_dict = verb_score_dict
+        return Lexicon(lexicon_df['verb'].str.strip().tolist(),
+                       lexicon_df[dimension].map({_label: _scores['agent'] for _label, _scores in label_dict.items()}).to_numpy(dtype=float),
+                       lexicon_df[dimension].map({_label: _scores['theme'] for _label, _scores in label_dict.items()}).to_numpy(dtype=float),
+                       dimensions=[dimension])
 
 
-    def load_custom_lexicon(self, lexicon_path, verb_column, agent_column, theme_column):
+    def load_custom_lexicon(self, lexicon_path, verb_column, agent_column, theme_column, cache_path=None):
         """
         Allows the user to load their own lexicon.
         Expects a TSV where one column contains the verb, one column contains the agent score, 
         and one column contains the theme score. Other columns can also exist but will not be used.
         The verb must be in the same form as Rashkin, e.g. "have" "say" "take".
         The scores must be postive and negative numbers.
+        cache_path: optional .npz file to cache the lexicon in, which is much faster to read for large lexicons.
         """
+        self.verb_score_dict = Lexicon.read_table(lexicon_path, verb_column, agent_column, theme_column, cache_path=cache_path)
 
-        from IPython import embed
-        lexicon_df = pd.read_csv(lexicon_path, sep='\t')
 
-        verb_score_dict = defaultdict(default_dict_int)
-        for i, _row in lexicon_df.iterrows():
-
-            _lemma  = _row[verb_column].strip()
-
-            _score_dict = {'agent': 0, 'theme': 0}
-
-            _score_dict['agent'] += _row.get(agent_column, 0) 
-            _score_dict['theme'] += _row.get(theme_column, 0)
+    def normalize_lexicon(self, cache_path=None):
+        """
+        Lemmatize the verbs of the loaded lexicon with the Riveter's spaCy model, so that inflected entries (e.g. "abandoned")
+        match the extracted verbs. Multiword entries (e.g. "agonize over") only match verbs extracted with phrasal_verbs=True.
+        cache_path: optional .npz file to cache the lemmas in, which are reused while the lexicon and model version stay the same.
+        """
 
-            verb_score_dict[_lemma] = _score_dict
+        if self.verb_score_dict is None:
+            raise ValueError('There is no lexicon to normalize, load one first')
 
-        self.verb_score_dict = verb_score_dict
+        lexicon = self.verb_score_dict if isinstance(self.verb_score_dict, Lexicon) else Lexicon.from_dict(self.verb_score_dict)
+        self.verb_score_dict = lexicon.normalize(load_pipeline(self.model_name), cache_path=cache_path, cache_key=get_package_version(self.model_name))
 
 
     def set_people_words(self, people_words=[], load_default=False):
@@ -183,38 +2211,413 @@ class Riveter:
         self.people_words.extend([people_word])
 
 
-    def train(self, texts, text_ids, num_bootstraps=None, persona_patterns_dict=None):
+    @instrumented
+    def train(self, texts, text_ids, num_bootstraps=None, persona_patterns_dict=None, batch_size=None, n_process=1, parse_cache=None, random_seed=None, confidence_level=None, n_jobs=1, bootstrap_memory_limit=DEFAULT_BOOTSTRAP_MEMORY_LIMIT, coref_window_size=None, coref_window_overlap=DEFAULT_COREF_WINDOW_OVERLAP, phrasal_verbs=False, pipeline_components=None):
+        """
+        Extract the persona-verb pairs from the texts and score them with the loaded lexicon.
+        Equivalent to calling extract() and then rescore().
+        """
+
+        self.extract(texts, text_ids, persona_patterns_dict, batch_size, n_process, parse_cache, coref_window_size, coref_window_overlap, phrasal_verbs=phrasal_verbs, pipeline_components=pipeline_components)
+        self.rescore(num_bootstraps=num_bootstraps,
+                     random_seed=random_seed,
+                     confidence_level=confidence_level,
+                     n_jobs=n_jobs,
+                     bootstrap_memory_limit=bootstrap_memory_limit)
+
+
+    def train_from_file(self, path, text_column, id_column, chunksize=DEFAULT_CHUNKSIZE, num_bootstraps=None, random_seed=None, confidence_level=None, n_jobs=1, bootstrap_memory_limit=DEFAULT_BOOTSTRAP_MEMORY_LIMIT, **kwargs):
+        """
+        Like train(), but streams the texts from a CSV, TSV, JSONL or Parquet file instead of holding them in memory.
+        Other keyword arguments are passed to extract().
+        """
+
+        self.extract_from_file(path, text_column, id_column, chunksize, **kwargs)
+        self.rescore(num_bootstraps=num_bootstraps,
+                     random_seed=random_seed,
+                     confidence_level=confidence_level,
+                     n_jobs=n_jobs,
+                     bootstrap_memory_limit=bootstrap_memory_limit)
+
+
+    def extract_from_file(self, path, text_column, id_column, chunksize=DEFAULT_CHUNKSIZE, **kwargs):
+        """
+        Like extract(), but streams the texts from a CSV, TSV, JSONL or Parquet file, chunksize rows at a time.
+        Only the document IDs are kept; get_documents_for_verb() and get_documents_for_persona() read the texts from the file again.
+        """
+
+        text_id_pairs, text_id_pairs_for_ids = itertools.tee(read_corpus(path, text_column, id_column, chunksize))
+
+        self.extract((_text for _text, _id in text_id_pairs),
+                     (_id for _text, _id in text_id_pairs_for_ids),
+                     keep_texts=False,
+                     **kwargs)
+        self.corpus_source = (path, text_column, id_column)
+
+
+    @instrumented
+    def extract(self, texts, text_ids, persona_patterns_dict=None, batch_size=None, n_process=1, parse_cache=None, coref_window_size=None, coref_window_overlap=DEFAULT_COREF_WINDOW_OVERLAP, keep_texts=True, phrasal_verbs=False, pipeline_components=None):
+        """
+        Parse the texts and store the persona-verb counts for each document, without scoring them.
+        texts and text_ids can be any iterables, e.g. generators, which are consumed as the texts are parsed.
+        batch_size: number of texts spaCy buffers per batch in nlp.pipe (defaults to spaCy's own setting).
+        n_process: number of processes spaCy uses to parse the texts.
+        parse_cache: a ParseCache or a directory path; documents found there are not parsed again.
+        coref_window_size: for book-length texts, resolve coreference in windows of this many tokens
+                           and merge the clusters that the windows share.
+        coref_window_overlap: number of tokens that consecutive coref windows share.
+        keep_texts: keep the texts (if they are a list or similar, not a generator) for get_documents_for_verb() and get_documents_for_persona().
+        phrasal_verbs: add the particle and first preposition of each verb, e.g. "give up" or "apologize to", to match multiword lexicon entries.
+                       Phrasal verbs that aren't in the lexicon are scored as their head verb.
+        pipeline_components: names of the spaCy components to run. By default only the ones extraction needs are run
+                             (EXTRACTION_COMPONENTS, and COREF_COMPONENTS without persona patterns); the others, e.g. ner, are skipped.
+        """
+
+        self.__check_writable()
+        if coref_window_size and coref_window_overlap >= coref_window_size:
+            raise ValueError('coref_window_overlap must be smaller than coref_window_size')
 
         # Hacky solution to force refresh when calling train() again
-        if self.texts:
+        if self.text_ids is not None:
+            self.__store = None
             self.texts = None
+            self.text_ids = None
+            self.corpus_source = None
             # self.verb_score_dict = None   # not this one, this is loaded on initalizing the Riveter object
             self.persona_score_dict = None
             self.persona_sd_dict = None
+            self.persona_ci_dict = None
+            self.persona_score_sum_dict = None
             self.id_persona_score_dict = None
             self.id_persona_count_dict = None
             self.id_nsubj_verb_count_dict = None
             self.id_dobj_verb_count_dict = None
             self.id_persona_scored_verb_dict = None # the number of scored verbs for each document and persona
-            self.entity_match_count_dict = defaultdict(default_dict_int)
+            self.id_entity_match_count_dict = None
+            self.verb_doc_index = None
+            self.persona_doc_index = None
+            self.scored_dimensions = None
+            self.dimension_personas = None
+            self.persona_dimension_score_sums = None
+            self.persona_dimension_match_counts = None
+            self.entity_match_count_dict = NestedCounter(2)
             self.persona_count_dict = defaultdict(int)
             self.persona_match_count_dict = defaultdict(int)
             self.people_words = None
-            self.persona_polarity_verb_count_dict = defaultdict(default_dict_int_2)
+            self.persona_polarity_verb_count_dict = NestedCounter(3)
+
+        self.texts = texts if keep_texts and hasattr(texts, '__len__') else None
+        self.persona_patterns_dict = persona_patterns_dict
+        self.coref_window_size = coref_window_size
+        self.coref_window_overlap = coref_window_overlap
+        self.phrasal_verbs = phrasal_verbs
+        self.pipeline_components = pipeline_components
+        self.text_ids, \
+            self.id_persona_count_dict, \
+            self.id_nsubj_verb_count_dict, \
+            self.id_dobj_verb_count_dict, \
+            self.id_entity_match_count_dict = self.__extract_dataset(texts, text_ids, persona_patterns_dict, batch_size, n_process, parse_cache)
+
+
+    @instrumented
+    def rescore(self, lexicon=None, num_bootstraps=None, random_seed=None, confidence_level=None, n_jobs=1, bootstrap_memory_limit=DEFAULT_BOOTSTRAP_MEMORY_LIMIT):
+        """
+        Recompute all of the scores from the stored persona-verb counts, without parsing the texts again.
+        lexicon: optional verb lexicon to score with instead of the loaded one, a Lexicon or a dict of {verb: {'agent': score, 'theme': score}}.
+        num_bootstraps: if set, the persona scores are the means over this many resamples of the documents,
+                        with standard deviations in persona_sd_dict.
+        random_seed: seed for the bootstrap resampling.
+        confidence_level: if set along with num_bootstraps, e.g. 0.95, percentile confidence intervals are stored in persona_ci_dict.
+                          This keeps every replicate's scores in memory.
+        n_jobs: number of processes that draw the bootstrap replicates (-1 for one per CPU).
+        bootstrap_memory_limit: approximate number of bytes each process uses for a chunk of replicates.
+        With the same random_seed, the bootstrapped scores are the same for any n_jobs and bootstrap_memory_limit.
+        """
+
+        self.__check_writable()
+        if self.id_nsubj_verb_count_dict is None:
+            raise ValueError('rescore() scores the extracted persona-verb pairs, call extract() or train() first')
 
-        self.texts = texts
-        self.text_ids = text_ids
+        if lexicon is not None:
+            self.verb_score_dict = lexicon if isinstance(lexicon, Lexicon) else Lexicon.from_dict(lexicon)
+
+        self.persona_match_count_dict = defaultdict(int)
+        self.persona_polarity_verb_count_dict = NestedCounter(3)
+
+        matrix = self.id_nsubj_verb_count_dict.matrix
         self.persona_score_dict, \
             self.persona_sd_dict, \
+            self.persona_ci_dict, \
+            self.persona_score_sum_dict, \
             self.id_persona_score_dict, \
-            self.id_persona_count_dict, \
-            self.id_nsubj_verb_count_dict, \
-            self.id_dobj_verb_count_dict, \
-            self.id_persona_scored_verb_dict = self.__score_dataset(self.texts, self.text_ids, num_bootstraps, persona_patterns_dict)
+            self.id_persona_scored_verb_dict, \
+            self.verb_doc_index, \
+            self.persona_doc_index = self.__score_dataset(matrix, num_bootstraps, random_seed, confidence_level, n_jobs, bootstrap_memory_limit)
+
+        with self.__timer('dimensions'):
+            self.__score_dimensions(matrix)
+
+
+    @instrumented
+    def update(self, texts, text_ids, batch_size=None, n_process=1, parse_cache=None, num_bootstraps=None, random_seed=None, confidence_level=None, n_jobs=1, bootstrap_memory_limit=DEFAULT_BOOTSTRAP_MEMORY_LIMIT):
+        """
+        Add new documents to an already trained Riveter, parsing only the new texts.
+        The new documents are extracted with the same persona patterns and coref settings as the last extract() or train(),
+        and scored with the loaded lexicon.
+        The persona scores are updated from running sums; if num_bootstraps is set, all of the documents are rescored instead,
+        with the bootstrap settings of rescore().
+        """
+
+        self.__check_writable()
+        if self.id_nsubj_verb_count_dict is None:
+            raise ValueError('update() adds documents to a trained Riveter, call train() or extract() first')
+        if self.persona_score_sum_dict is None:
+            self.rescore()
+
+        text_ids = list(text_ids)
+        self.__check_new_ids(text_ids)
+
+        if self.texts is not None:
+            texts = list(texts)
+            self.texts = list(self.texts) + texts
+        elif self.corpus_source is not None:
+            # The new texts aren't in the corpus file, so its texts no longer line up with the documents
+            logger.warning('The new texts are not kept, so get_documents_for_verb() and get_documents_for_persona() '
+                           'no longer read the texts from "%s"', self.corpus_source[0])
+            self.corpus_source = None
+
+        new_text_ids, \
+            id_persona_count_dict, \
+            id_nsubj_verb_count_dict, \
+            id_dobj_verb_count_dict, \
+            id_entity_match_count_dict = self.__extract_dataset(texts, text_ids, self.persona_patterns_dict, batch_size, n_process, parse_cache)
+
+        n_docs = len(self.id_nsubj_verb_count_dict)
+        matrix = id_nsubj_verb_count_dict.matrix
+        self.text_ids = list(self.text_ids) + new_text_ids
+        self.id_persona_count_dict = PersonaTable.concatenate([self.id_persona_count_dict, id_persona_count_dict])
+        self.__set_count_matrix(CountMatrix.concatenate([self.id_nsubj_verb_count_dict.matrix, matrix]))
+        self.id_entity_match_count_dict = EntityTable.concatenate([self.id_entity_match_count_dict, id_entity_match_count_dict])
+
+        if num_bootstraps:
+            self.rescore(num_bootstraps=num_bootstraps, random_seed=random_seed, confidence_level=confidence_level,
+                         n_jobs=n_jobs, bootstrap_memory_limit=bootstrap_memory_limit)
+            return
+
+        id_persona_score_dict, \
+            id_persona_scored_verb_dict, \
+            doc_persona_keys, \
+            doc_persona_scores, \
+            match_counts, \
+            polarity_counts = self.__score_documents(matrix)
+
+        self.__add_lexicon_matches(match_counts, polarity_counts)
+        self.__add_persona_score_sums(self.persona_score_sum_dict, matrix.personas, doc_persona_keys, doc_persona_scores)
+        self.id_persona_score_dict = PersonaScoreTable.concatenate([self.id_persona_score_dict, id_persona_score_dict])
+        self.id_persona_scored_verb_dict = PersonaTable.concatenate([self.id_persona_scored_verb_dict, id_persona_scored_verb_dict])
+
+        if self.persona_dimension_score_sums is not None:
+            self.__add_dimension_scores(matrix)
+
+        # Indexes that are missing are built when they are first used
+        if self.verb_doc_index is not None and self.persona_doc_index is not None:
+            verb_doc_index, persona_doc_index = self.__get_doc_indexes(matrix, doc_persona_keys)
+            self.verb_doc_index = InvertedIndex.concatenate([self.verb_doc_index, verb_doc_index], [0, n_docs])
+            self.persona_doc_index = InvertedIndex.concatenate([self.persona_doc_index, persona_doc_index], [0, n_docs])
+        else:
+            self.verb_doc_index = None
+            self.persona_doc_index = None
+
+        self.persona_score_dict = self.__get_persona_score_dict(self.persona_score_sum_dict, self.persona_count_dict)
+        self.persona_sd_dict = None
+        self.persona_ci_dict = None
+
+
+    @instrumented
+    def remove(self, text_ids, num_bootstraps=None, random_seed=None, confidence_level=None, n_jobs=1, bootstrap_memory_limit=DEFAULT_BOOTSTRAP_MEMORY_LIMIT):
+        """
+        Retract documents from a trained Riveter, subtracting their counts and scores.
+        Their verbs are matched against the loaded lexicon, so call rescore() first if the lexicon changed since training.
+        The persona scores are updated from running sums; if num_bootstraps is set, the remaining documents are rescored instead,
+        with the bootstrap settings of rescore().
+        """
+
+        self.__check_writable()
+        if self.id_entity_match_count_dict is None:
+            raise ValueError('remove() needs the per-document entity matches, which this Riveter does not have; train it again')
+        if self.persona_score_sum_dict is None:
+            self.rescore()
+
+        text_ids = list(dict.fromkeys(text_ids))
+        unknown_ids = [_id for _id in text_ids if _id not in self.id_nsubj_verb_count_dict]
+        if unknown_ids:
+            raise ValueError(f'{len(unknown_ids)} of the document IDs have not been added, e.g. {unknown_ids[0]!r}')
+
+        removed_ids = set(text_ids)
+        all_matrix = self.id_nsubj_verb_count_dict.matrix
+        positions = [all_matrix.get_doc_position(_id) for _id in text_ids]
+        is_removed = np.zeros(len(all_matrix), dtype=bool)
+        is_removed[positions] = True
+        kept_positions = np.flatnonzero(~is_removed)
+
+        matrix = all_matrix.take(positions)
+        _, _, _, _, match_counts, polarity_counts = self.__score_documents(matrix)
+        self.__add_lexicon_matches(match_counts, polarity_counts, sign=-1)
+        if self.persona_dimension_score_sums is not None:
+            self.__add_dimension_scores(matrix, sign=-1)
+
+        # The tables are aligned, so the documents are at the same positions in all of them
+        for i in positions:
+            for _persona, _score in self.id_persona_score_dict.get_doc_at(i).items():
+                self.persona_score_sum_dict[_persona] -= _score
+            self.__add_entity_matches(self.id_entity_match_count_dict.get_doc_at(i), sign=-1)
+
+        self.id_persona_count_dict = self.id_persona_count_dict.take(kept_positions)
+        self.__set_count_matrix(all_matrix.take(kept_positions))
+        self.id_entity_match_count_dict = self.id_entity_match_count_dict.take(kept_positions)
+        self.id_persona_score_dict = self.id_persona_score_dict.take(kept_positions)
+        self.id_persona_scored_verb_dict = self.id_persona_scored_verb_dict.take(kept_positions)
+
+        # Personas with no scored verbs left in any document no longer have a score
+        for _persona in list(self.persona_score_sum_dict.keys()):
+            if _persona not in self.persona_match_count_dict:
+                del self.persona_score_sum_dict[_persona]
+
+        if self.texts is not None:
+            self.texts = [_text for _text, _id in zip(self.texts, self.text_ids) if _id not in removed_ids]
+        self.text_ids = [_id for _id in self.text_ids if _id not in removed_ids]
+        if self.verb_doc_index is not None:
+            self.verb_doc_index = self.verb_doc_index.remove_docs(is_removed)
+        if self.persona_doc_index is not None:
+            self.persona_doc_index = self.persona_doc_index.remove_docs(is_removed)
+
+        if num_bootstraps:
+            self.rescore(num_bootstraps=num_bootstraps, random_seed=random_seed, confidence_level=confidence_level,
+                         n_jobs=n_jobs, bootstrap_memory_limit=bootstrap_memory_limit)
+            return
+
+        self.persona_score_dict = self.__get_persona_score_dict(self.persona_score_sum_dict, self.persona_count_dict)
+        self.persona_sd_dict = None
+        self.persona_ci_dict = None
+
+
+    @classmethod
+    def merge(cls, *riveters, num_bootstraps=None, random_seed=None, confidence_level=None, n_jobs=1, bootstrap_memory_limit=DEFAULT_BOOTSTRAP_MEMORY_LIMIT):
+        """
+        Combine Riveters trained on separate shards of a corpus, or the files they were saved to, into a new Riveter.
+        The shards must have distinct document IDs and the same lexicon. Their raw score sums and counts are added up,
+        so the scores are the same as training on all of the documents in one run, in the order of the shards.
+        If num_bootstraps is set, the merged documents are rescored with bootstrapping instead.
+        """
+
+        riveters = [cls(filename=_riveter) if isinstance(_riveter, str) else _riveter for _riveter in riveters]
+        if not riveters:
+            raise ValueError('merge() needs at least one Riveter')
+        for _riveter in riveters:
+            if _riveter.id_nsubj_verb_count_dict is None:
+                raise ValueError('All of the merged Riveters must be trained, call train() or extract() first')
+            if _riveter.verb_score_dict != riveters[0].verb_score_dict:
+                raise ValueError('All of the merged Riveters must use the same lexicon')
+
+        first = riveters[0]
+        merged = cls(model_name=first.model_name, coref_model_name=first.coref_model_name)
+        merged.verb_score_dict = first.verb_score_dict
+        merged.people_words = first.people_words
+        merged.persona_patterns_dict = first.persona_patterns_dict
+        merged.coref_window_size = first.coref_window_size
+        merged.coref_window_overlap = first.coref_window_overlap
+        merged.phrasal_verbs = first.phrasal_verbs
+        merged.pipeline_components = first.pipeline_components
+
+        merged.texts = [] if all(_riveter.texts is not None for _riveter in riveters) else None
+        merged.text_ids = []
+        merged.persona_score_sum_dict = defaultdict(float)
+
+        is_scored = all(_riveter.id_persona_score_dict is not None for _riveter in riveters)
+        merged_ids = set()
+
+        for _riveter in riveters:
+            text_ids = list(_riveter.text_ids)
+            merged.__check_new_ids(text_ids, merged_ids)
+            merged_ids.update(text_ids)
+
+            merged.text_ids.extend(text_ids)
+            if merged.texts is not None:
+                merged.texts.extend(_riveter.texts)
+            merged.__add_entity_matches(_riveter.entity_match_count_dict)
+
+            if is_scored:
+                merged.__add_lexicon_matches(list(_riveter.persona_match_count_dict.items()),
+                                             _riveter.persona_polarity_verb_count_dict.iter_counts())
+
+                # Add the per-document scores in document order, rather than the shards' sums,
+                # so the floating point sums are the same as in a single run
+                for _id in text_ids:
+                    for _persona, _score in _riveter.id_persona_score_dict[_id].items():
+                        merged.persona_score_sum_dict[_persona] += _score
+
+        merged.id_persona_count_dict = PersonaTable.concatenate([_riveter.id_persona_count_dict for _riveter in riveters])
+        merged.__set_count_matrix(CountMatrix.concatenate([_riveter.id_nsubj_verb_count_dict.matrix for _riveter in riveters]))
+        if all(_riveter.id_entity_match_count_dict is not None for _riveter in riveters):
+            merged.id_entity_match_count_dict = EntityTable.concatenate([_riveter.id_entity_match_count_dict for _riveter in riveters])
+        if is_scored:
+            merged.id_persona_score_dict = PersonaScoreTable.concatenate([_riveter.id_persona_score_dict for _riveter in riveters])
+            merged.id_persona_scored_verb_dict = PersonaTable.concatenate([_riveter.id_persona_scored_verb_dict for _riveter in riveters])
+
+        if num_bootstraps or not is_scored:
+            merged.rescore(num_bootstraps=num_bootstraps, random_seed=random_seed, confidence_level=confidence_level,
+                           n_jobs=n_jobs, bootstrap_memory_limit=bootstrap_memory_limit)
+        else:
+            merged.persona_score_dict = merged.__get_persona_score_dict(merged.persona_score_sum_dict, merged.persona_count_dict)
+            merged.__score_dimensions(merged.id_nsubj_verb_count_dict.matrix)
+            if all(_riveter.verb_doc_index is not None and _riveter.persona_doc_index is not None for _riveter in riveters):
+                doc_offsets = np.cumsum([0] + [len(_riveter.id_nsubj_verb_count_dict) for _riveter in riveters[:-1]]).tolist()
+                merged.verb_doc_index = InvertedIndex.concatenate([_riveter.verb_doc_index for _riveter in riveters], doc_offsets)
+                merged.persona_doc_index = InvertedIndex.concatenate([_riveter.persona_doc_index for _riveter in riveters], doc_offsets)
+
+        return merged
+
+
+    def __check_new_ids(self, text_ids, added_ids=None):
+        if added_ids is None:
+            added_ids = self.id_nsubj_verb_count_dict
+        existing_ids = [_id for _id in text_ids if _id in added_ids]
+        if existing_ids:
+            raise ValueError(f'{len(existing_ids)} of the document IDs have already been added, e.g. {existing_ids[0]!r}')
+        if len(set(text_ids)) < len(text_ids):
+            raise ValueError('The document IDs must be unique')
+
+
+    def get_score_totals(self, frequency_threshold=0, dimension=None):
+        """
+        dimension: with several lexicon dimensions loaded (see load_lexicon_dimensions()), return the scores in this dimension
+                   instead of the primary one. These are not bootstrapped.
+        """
+
+        if dimension is None:
+            return {p: s for p, s in self.persona_score_dict.items() if self.persona_match_count_dict[p] >= frequency_threshold}
+
+        d = self.__get_scored_dimension_idx(dimension)
+        scores = self.__get_dimension_scores()
+        return {p: float(scores[i, d]) for i, p in enumerate(self.dimension_personas)
+                if self.persona_dimension_match_counts[i, d] > 0 and self.persona_count_dict.get(p, 0) > 0
+                and self.persona_dimension_match_counts[i, d] >= frequency_threshold}
+
+
+    def get_score_matrix(self, frequency_threshold=0):
+        """
+        Returns a DataFrame of the scores of every persona (rows) in every lexicon dimension (columns), with NaN where a persona
+        has fewer than frequency_threshold (or no) scored verbs in a dimension.
+        """
 
+        if self.persona_dimension_score_sums is None:
+            raise ValueError('There are no scores by dimension, load a lexicon with load_lexicon_dimensions() and call train() or rescore()')
 
-    def get_score_totals(self, frequency_threshold=0):
-        return {p: s for p, s in self.persona_score_dict.items() if self.persona_match_count_dict[p] >= frequency_threshold}
+        scores = self.__get_dimension_scores()
+        is_scored = (self.persona_dimension_match_counts > 0) & (self.persona_dimension_match_counts >= frequency_threshold)
+        df = pd.DataFrame(np.where(is_scored, scores, np.nan), index=self.dimension_personas, columns=self.scored_dimensions)
+
+        return df.dropna(how='all')
     
 
     def plot_scores(self, title='Personas by Score', frequency_threshold=0, number_of_scores=10, target_personas=None, figsize=None, output_path=None):
@@ -261,8 +2664,9 @@ class Riveter:
 
 
     def get_scores_for_doc(self, doc_id, frequency_threshold=0):
-        return {p: s/float(self.id_persona_count_dict[doc_id][p]) 
-                for p, s in self.id_persona_score_dict[doc_id].items() 
+        persona_count_dict = self.__get_doc_table('id_persona_count_dict', doc_id)
+        return {p: s/float(persona_count_dict[p]) 
+                for p, s in self.__get_doc_table('id_persona_score_dict', doc_id).items() 
                 if self.persona_count_dict[p] >= frequency_threshold}
 
 
@@ -359,20 +2763,20 @@ class Riveter:
 
 
     def count_personas_for_doc(self, doc_id):
-        return dict(self.id_persona_count_dict[doc_id])
+        return dict(self.__get_doc_table('id_persona_count_dict', doc_id))
 
 
     def count_scored_verbs_for_doc(self, doc_id):
-        return dict(self.id_persona_scored_verb_dict[doc_id])
+        return dict(self.__get_doc_table('id_persona_scored_verb_dict', doc_id))
 
 
     def count_nsubj_for_doc(self, doc_id, matched_only=False):
         """Returns the set of persona-verb pairs (where persona is the subject of the verb)
         matched_only: only returns the verbs that are in the lexicon
         """
-        counts = dict(self.id_nsubj_verb_count_dict[doc_id])
+        counts = dict(self.__get_doc_table('id_nsubj_verb_count_dict', doc_id))
         if matched_only:
-            counts = {pair: cnt for pair,cnt in counts.items() if pair[1] in self.verb_score_dict}
+            counts = {pair: cnt for pair,cnt in counts.items() if self.__is_lexicon_verb(pair[1])}
         return counts
 
 
@@ -380,43 +2784,112 @@ class Riveter:
         """Returns the set of persona-verb pairs (where persona is the object of the verb)
         matched_only: only returns the verbs that are in the lexicon
         """
-        counts = dict(self.id_dobj_verb_count_dict[doc_id])
+        counts = dict(self.__get_doc_table('id_dobj_verb_count_dict', doc_id))
         if matched_only:
-            counts = {pair: cnt for pair,cnt in counts.items() if pair[1] in self.verb_score_dict}
+            counts = {pair: cnt for pair,cnt in counts.items() if self.__is_lexicon_verb(pair[1])}
         return counts
     
 
-    def get_documents_for_verb(self, target_verb):
-
-        id_text_dict = {_id: _text for _text, _id in zip(self.texts, self.text_ids)}
+    def __is_lexicon_verb(self, verb):
+        if isinstance(self.verb_score_dict, Lexicon):
+            # Only the primary dimension, which the scores and matched counts are computed in
+            i = self.verb_score_dict.get_verb_idx(verb)
+            return i >= 0 and bool(self.verb_score_dict.in_dimension[i, 0])
+        return verb in self.verb_score_dict
 
-        target_ids = [] 
-        for _id, _dobj_verb_count_dict in self.id_dobj_verb_count_dict.items():
-            for (_dobj, _verb), _count in _dobj_verb_count_dict.items():
-                if _verb.lower() == target_verb.lower():
-                    target_ids.append(_id)
-        for _id, _nsubj_verb_count_dict in self.id_nsubj_verb_count_dict.items():
-            for (_nsubj, _verb), _count in _nsubj_verb_count_dict.items():
-                if _verb.lower() == target_verb.lower():
-                    target_ids.append(_id)
-        target_ids = list(set(target_ids))
 
-        return target_ids, [_text for _id, _text in id_text_dict.items() if _id in target_ids]
+    def get_documents_for_verb(self, target_verb, offset=0, limit=None):
+        """Returns the IDs and texts of the documents in which the verb occurs (case-insensitive), in corpus order
+        offset, limit: only return the limit documents after the first offset, for paging through the results
+        """
+        return self.__get_documents('verb_doc_index', target_verb, offset, limit)
     
 
-    def get_documents_for_persona(self, target_persona):
+    def get_documents_for_persona(self, target_persona, offset=0, limit=None):
+        """Returns the IDs and texts of the documents in which the persona (case-insensitive) has scored verbs, in corpus order
+        offset, limit: only return the limit documents after the first offset, for paging through the results
+        """
+        return self.__get_documents('persona_doc_index', target_persona, offset, limit)
+
+
+    def __get_documents(self, index_name, key, offset, limit):
+
+        if getattr(self, index_name) is None:
+            self.verb_doc_index, self.persona_doc_index = self.__build_doc_indexes()
+        if getattr(self, index_name) is None:
+            raise ValueError('The documents have not been scored yet, call rescore() first')
+        positions = getattr(self, index_name).get_docs(key.lower(), offset, limit)
+
+        # Riveters loaded from a RiveterStore read the IDs and texts from the store, as long as the documents haven't changed since
+        store = self.__store
+        if store is not None and 'id_nsubj_verb_count_dict' not in self.__dict__:
+            target_ids, target_texts = store.get_docs_at(positions)
+            if target_texts is None:
+                target_texts = self.__get_texts_for_ids(target_ids)
+            return target_ids, target_texts
+
+        # The positions are in the order of the per-document dicts, which is the order of text_ids unless it has duplicates
+        is_aligned = len(self.text_ids) == len(self.id_nsubj_verb_count_dict)
+        doc_ids = self.text_ids if is_aligned else list(self.id_nsubj_verb_count_dict.keys())
+        target_ids = [doc_ids[_i] for _i in positions.tolist()]
+
+        if is_aligned and self.texts is not None:
+            return target_ids, [self.texts[_i] for _i in positions.tolist()]
+        return target_ids, self.__get_texts_for_ids(target_ids)
+
+
+    def __get_doc_indexes(self, matrix, doc_persona_keys):
+        """
+        The verb and persona inverted indexes of the documents in a count matrix, from its (document, persona) keys with scored verbs.
+        """
+        n_personas = max(len(matrix.personas), 1)
+        verb_doc_index = InvertedIndex.from_pairs(matrix.verbs, matrix.verb_idx, matrix.get_doc_idx())
+        persona_doc_index = InvertedIndex.from_pairs(matrix.personas, doc_persona_keys % n_personas, doc_persona_keys // n_personas)
+        return verb_doc_index, persona_doc_index
+
+
+    def __build_doc_indexes(self):
+        """
+        Builds the inverted indexes of a Riveter that doesn't have them, e.g. one that was saved by an older version.
+        Documents that were only extracted, not scored, have no persona index.
+        """
+
+        matrix = self.id_nsubj_verb_count_dict.matrix
+        if self.id_persona_scored_verb_dict is None:
+            return InvertedIndex.from_pairs(matrix.verbs, matrix.verb_idx, matrix.get_doc_idx()), None
+
+        table = self.id_persona_scored_verb_dict
+        persona_ids = get_vocabulary_ids(table.personas, {_persona: i for i, _persona in enumerate(matrix.personas)})
+        doc_persona_keys = table.get_doc_idx() * len(matrix.personas) + persona_ids[table.persona_idx]
+
+        return self.__get_doc_indexes(matrix, doc_persona_keys)
+
+
+
+    def __get_texts_for_ids(self, target_ids):
+        """
+        Returns the texts of the target documents in corpus order, reading them from the corpus file if they weren't kept,
+        or None if the texts are not available.
+        """
 
-        id_text_dict = {_id: _text for _text, _id in zip(self.texts, self.text_ids)}
+        target_ids = set(target_ids)
 
-        target_ids = [] 
-        for _id, _persona_verb_dict in self.id_persona_scored_verb_dict.items():
-            for _persona, _count in _persona_verb_dict.items():
-                if _persona.lower() == target_persona.lower():
-                    target_ids.append(_id)
-        target_ids = list(set(target_ids))
+        if self.texts is not None:
+            text_id_pairs = zip(self.texts, self.text_ids)
+        elif self.corpus_source is not None:
+            text_id_pairs = read_corpus(*self.corpus_source)
+        else:
+            return None
 
-        return target_ids, [_text for _id, _text in id_text_dict.items() if _id in target_ids]
+        id_text_dict = {}
+        for _text, _id in text_id_pairs:
+            if _id in target_ids:
+                id_text_dict[_id] = _text
 
+        # Never return texts that don't line up with the IDs
+        if len(id_text_dict) != len(target_ids):
+            return None
+        return list(id_text_dict.values())
 
 
     def get_persona_cluster(self, persona):
@@ -454,23 +2927,14 @@ class Riveter:
 
     def __get_cluster_name(self, cluster):
 
-        PRONOUN_MAP = {
-            "i": ["me", "my", "mine", "i"],
-            "we": ["us", "ours", "our", "we"],
-            "you": ["yours", "you", "your"],
-            "he": ['he', 'him', 'himself', 'his'],
-            'she': ['she', 'her', 'herself', 'hers'],
-            'they': ['they', 'them', 'themselves', 'their', 'theirs']
-        }
-
-        REVERSE_PRONOUN_MAP = {_pronoun: _label for _label, _pronouns in PRONOUN_MAP.items() for _pronoun in _pronouns}
-
         # If every span contains the same pronoun, return this pronoun
         pronoun_count_dict = defaultdict(int)
         for _span in cluster:
             for _token in _span:
-                if _token.pos_ == 'PRON' and _token.text.lower() in REVERSE_PRONOUN_MAP:
-                    pronoun_count_dict[REVERSE_PRONOUN_MAP[_token.text.lower()]] += 1
+                if _token.pos_ == 'PRON':
+                    _pronoun = REVERSE_PRONOUN_MAP.get(_token.lower_)
+                    if _pronoun is not None:
+                        pronoun_count_dict[_pronoun] += 1
         for _pronoun, _count in pronoun_count_dict.items():
             if _count == len(cluster):
                 return _pronoun
@@ -478,225 +2942,664 @@ class Riveter:
         # Otherwise return the first mention (either whole phrase for just nsubj)
         first_mention = cluster[0]
         for _noun_chunk in first_mention.noun_chunks:
-            _text_to_return = _noun_chunk.text.lower().strip('.,!?\'"-')
-            return re.sub(r'^(my|his|her|their|our|your|the|a|an) ', '', _text_to_return)
+            return get_persona_name(_noun_chunk.text, CLUSTER_STRIP_CHARACTERS)
         
-        text_to_return = first_mention.text.lower().strip('.,!?\'"-')
-        return re.sub(r'^(my|his|her|their|our|your|the|a|an) ', '', text_to_return)
+        return get_persona_name(first_mention.text, CLUSTER_STRIP_CHARACTERS)
+
+
+    def __get_cluster_coverage(self, clusters, n_tokens):
+        """
+        Returns a prefix count of the token boundaries covered by any cluster span, so that
+        a noun chunk overlaps a cluster exactly when coverage[chunk.end + 1] - coverage[chunk.start] > 0.
+        Boundaries are inclusive, so a chunk that only touches a span, e.g. ends where the span starts, counts as overlapping.
+        """
+
+        # Difference array: +1 where a span starts, -1 just past where it ends
+        boundary_deltas = np.zeros(n_tokens + 2, dtype=np.int64)
+        for _cluster in clusters:
+            for _span in _cluster:
+                boundary_deltas[_span.start] += 1
+                boundary_deltas[_span.end + 1] -= 1
+
+        is_covered = np.cumsum(boundary_deltas[:-1]) > 0
+
+        return [0] + np.cumsum(is_covered).tolist()
+
+    def __get_nlp(self, persona_patterns_dict=None):
+        """
+        Pattern mode only needs the base pipeline, so the coref transformer is never loaded for it.
+        """
+        if persona_patterns_dict:
+            return load_pipeline(self.model_name)
+        return load_pipeline(self.model_name, self.coref_model_name)
+
+
+    def __parse_texts(self, texts, persona_patterns_dict, batch_size, n_process):
+        """
+        Stream the texts through nlp.pipe and yield one Doc per text, in order.
+        The pipeline is only loaded once the first Doc is requested.
+        """
+        nlp = self.__get_nlp(persona_patterns_dict)
+        disable = self.__get_disabled_components(nlp, persona_patterns_dict)
+
+        if self.stats is None:
+            yield from nlp.pipe(texts, batch_size=batch_size, n_process=n_process, disable=disable)
+        elif n_process != 1:
+            yield from self.stats.time_iterator('parse', nlp.pipe(texts, batch_size=batch_size, n_process=n_process, disable=disable))
+        else:
+            yield from self.__pipe_timed(nlp, texts, batch_size, disable)
+
+
+    def __pipe_timed(self, nlp, texts, batch_size, disable):
+        """
+        Like nlp.pipe, but runs the tokenizer and each component as a separate stage, to time them in stats.
+        Each stage is timed including the stages before it, which pull the docs it processes, so those are subtracted afterwards.
+        """
+
+        stats = self.stats
+        batch_size = batch_size or nlp.batch_size
+
+        stages = ['parse.tokenizer']
+        docs = stats.time_iterator('parse.tokenizer', (nlp.make_doc(_text) for _text in texts))
+        for _name, _component in nlp.pipeline:
+            if _name in disable:
+                continue
+            _stage = 'parse.' + _name
+            docs = stats.time_iterator(_stage, _component.pipe(docs, batch_size=batch_size) if hasattr(_component, 'pipe') else map(_component, docs))
+            stages.append(_stage)
+
+        start_timers = [stats.timers[_stage] for _stage in stages]
+        try:
+            yield from docs
+        finally:
+            inclusive = [stats.timers[_stage] - _start for _stage, _start in zip(stages, start_timers)]
+            for _stage, _upstream in zip(stages[1:], inclusive):
+                stats.timers[_stage] -= _upstream
+            stats.timers['parse'] += inclusive[-1]
+
+
+    def __get_disabled_components(self, nlp, persona_patterns_dict):
+        """
+        The components of the pipeline that aren't run when parsing: those that the mode doesn't need, or that aren't in pipeline_components.
+        """
+
+        if self.pipeline_components is not None:
+            components = self.pipeline_components
+        elif persona_patterns_dict:
+            components = EXTRACTION_COMPONENTS
+        else:
+            components = EXTRACTION_COMPONENTS + COREF_COMPONENTS
+
+        # In long document mode, coreference is resolved afterwards, one window at a time
+        if self.coref_window_size and not persona_patterns_dict:
+            components = [_name for _name in components if _name not in COREF_COMPONENTS]
+
+        return [_name for _name in nlp.pipe_names if _name not in components]
+
+
+    def __extract(self, doc, persona_matcher):
+        if self.stats is not None and doc is not None:
+            self.stats.count('tokens', len(doc))
+        if persona_matcher is None:
+            if doc is not None and self.coref_window_size:
+                with self.__timer('coref_windows'):
+                    clusters = self.__get_windowed_coref_clusters(doc)
+                return self.__parse_and_extract_coref(doc, clusters)
+            return self.__parse_and_extract_coref(doc)
+        with self.__timer('pattern_matching'):
+            return self.__parse_and_extract(doc, persona_matcher)
+
+
+    def __get_coref_windows(self, doc):
+        """
+        Split the doc into windows of at most coref_window_size tokens that overlap by about coref_window_overlap tokens.
+        Windows start and end on sentence boundaries, unless a single sentence is longer than a window.
+        """
+
+        sentence_starts = [_sentence.start for _sentence in doc.sents]
+
+        windows = []
+        start = 0
+        while True:
+
+            end = min(start + self.coref_window_size, len(doc))
+            if end < len(doc):
+                # End the window at the last sentence boundary inside it
+                i = bisect.bisect_right(sentence_starts, end) - 1
+                if sentence_starts[i] > start:
+                    end = sentence_starts[i]
+
+            windows.append((start, end))
+            if end >= len(doc):
+                return windows
+
+            # Start the next window at the first sentence boundary within the overlap
+            i = bisect.bisect_left(sentence_starts, end - self.coref_window_overlap)
+            if i < len(sentence_starts) and start < sentence_starts[i] < end:
+                start = sentence_starts[i]
+            else:
+                start = max(end - self.coref_window_overlap, start + 1)
+
+
+    def __get_windowed_coref_clusters(self, doc):
+        """
+        Run the coref components on each window of the doc separately, so memory doesn't grow with the length of the text.
+        Clusters from different windows that share a mention (in the overlap between the windows) are merged.
+        Returns a list of clusters, each a list of spans in doc, in the same form as the doc.spans coref clusters.
+        """
+
+        nlp = self.__get_nlp()
+        coref_components = [_component for _name, _component in nlp.pipeline if _name in COREF_COMPONENTS]
+
+        window_clusters = []
+        for _start, _end in self.__get_coref_windows(doc):
+
+            _window_doc = doc[_start:_end].as_doc()
+            for _component in coref_components:
+                _window_doc = _component(_window_doc)
+
+            for _key, _cluster in _window_doc.spans.items():
+                if _key.startswith('coref_cluster'):
+                    window_clusters.append([(_span.start + _start, _span.end + _start) for _span in _cluster])
+
+        # Union-find over the window clusters, joining clusters that contain the same mention
+        parents = list(range(len(window_clusters)))
+
+        def _find(i):
+            while parents[i] != i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+            return i
+
+        mention_cluster_dict = {}
+        for i, _mentions in enumerate(window_clusters):
+            for _mention in _mentions:
+                if _mention in mention_cluster_dict:
+                    parents[_find(i)] = _find(mention_cluster_dict[_mention])
+                else:
+                    mention_cluster_dict[_mention] = i
+
+        merged_mentions = defaultdict(set)
+        for i, _mentions in enumerate(window_clusters):
+            merged_mentions[_find(i)].update(_mentions)
 
+        clusters = [[doc[_start:_end] for _start, _end in sorted(_mentions)] for _mentions in merged_mentions.values()]
+        clusters.sort(key=lambda _cluster: (_cluster[0].start, _cluster[0].end))
 
-    def __is_overlapping(self, x1, x2, y1, y2):
-        return max(x1,y1) <= min(x2,y2)
+        return clusters
 
-    def __parse_and_extract_coref(self, text):
+
+    def __get_cache_settings(self, persona_patterns_dict):
+        """
+        Everything besides the text that determines what extraction returns for a document.
+        """
+        if persona_patterns_dict:
+            settings = [get_package_version(self.model_name), list(persona_patterns_dict.items())]
+        elif self.coref_window_size:
+            settings = [get_package_version(self.model_name), get_package_version(self.coref_model_name), self.coref_window_size, self.coref_window_overlap]
+        else:
+            settings = [get_package_version(self.model_name), get_package_version(self.coref_model_name)]
+        if self.phrasal_verbs:
+            settings.append('phrasal_verbs')
+        if self.pipeline_components is not None:
+            settings.append(sorted(self.pipeline_components))
+        return settings
+
+
+    def __extract_documents(self, texts, persona_patterns_dict, batch_size, n_process, parse_cache):
+        """
+        Yield the (nsubj, dobj, entity match) count dicts for each text, in order.
+        Empty texts and texts found in the parse cache are not sent to spaCy.
+        """
+
+        if parse_cache is not None and not isinstance(parse_cache, ParseCache):
+            parse_cache = ParseCache(parse_cache)
+
+        if parse_cache is not None:
+            cache_settings = self.__get_cache_settings(persona_patterns_dict)
+
+        # Compile the persona patterns once for the whole dataset
+        persona_matcher = PersonaMatcher(persona_patterns_dict) if persona_patterns_dict else None
+
+        def _lookup(text):
+            if not text.strip():
+                return text, None, self.__extract(None, persona_matcher)
+            if parse_cache is None:
+                return text, None, None
+            _key = parse_cache.get_key(text, cache_settings)
+            return text, _key, parse_cache.get(_key)
+
+        items_to_parse, items = itertools.tee(map(_lookup, texts))
+        docs = self.__parse_texts((_text for _text, _key, _extraction in items_to_parse if _extraction is None),
+                                  persona_patterns_dict,
+                                  batch_size,
+                                  n_process)
+
+        stats = self.stats
+        for _text, _key, _extraction in items:
+            if _extraction is None:
+                _extraction = self.__extract(next(docs), persona_matcher)
+                if _key is not None:
+                    parse_cache.put(_key, _extraction)
+                if stats is not None:
+                    stats.count('parsed_documents')
+            elif stats is not None:
+                stats.count('cached_documents' if _key is not None else 'empty_documents')
+            if stats is not None:
+                stats.count('documents')
+            yield _extraction
+
+        # Finishes the parse timers, if stats are enabled
+        docs.close()
+
+
+    def __get_verb(self, token):
+        """
+        The lowercased lemma of a verb token, looked up by its lemma hash so the string is only built once per verb.
+        With phrasal_verbs, its particles and first preposition are added, e.g. "give up" or "apologize to".
+        """
+
+        if self.phrasal_verbs:
+            tokens = [token] + [_child for _child in token.children if _child.dep_ == 'prt']
+            tokens += itertools.islice((_child for _child in token.rights if _child.dep_ == 'prep'), 1)
+            key = tuple(_token.lemma for _token in tokens)
+        else:
+            tokens = [token]
+            key = token.lemma
+
+        verb = VERB_STRINGS.get(key)
+        if verb is None:
+            verb = VERB_STRINGS.setdefault(key, ' '.join(_token.lemma_.lower() for _token in tokens))
+        return verb
+
+
+    def __parse_and_extract_coref(self, doc, clusters=None):
 
         nsubj_verb_count_dict = defaultdict(int)
         dobj_verb_count_dict = defaultdict(int)
+        entity_match_count_dict = defaultdict(default_dict_int)
 
-        if text.strip():
-
-            doc = nlp(text)
+        if doc is not None:
 
             # Look for coreference clusters
-            clusters = [val for key, val in doc.spans.items() if key.startswith('coref_cluster')]
+            if clusters is None:
+                clusters = [val for key, val in doc.spans.items() if key.startswith('coref_cluster')]
 
-            for _cluster in clusters:
+            with self.__timer('cluster_naming'):
+                cluster_names = [self.__get_cluster_name(_cluster) for _cluster in clusters]
 
-                _text = self.__get_cluster_name(_cluster)
+            with self.__timer('cluster_mentions'):
+                for _cluster, _text in zip(clusters, cluster_names):
 
-                if _text not in ['that', 'which', 'who', 'what']:
+                    if _text not in RELATIVE_PRONOUNS:
 
-                    for _span in _cluster:
+                        for _span in _cluster:
 
-                        self.persona_count_dict[_text] += 1
-                        self.entity_match_count_dict[_text][str(_span).lower()] += 1
+                            entity_match_count_dict[_text][str(_span).lower()] += 1
 
-                        if _span.root.dep_ == 'ROOT':
-                            _verb = _span.root.lemma_.lower()
-                            nsubj_verb_count_dict[(_text, _verb)] += 1
+                            if _span.root.dep_ == 'ROOT':
+                                _verb = self.__get_verb(_span.root)
+                                nsubj_verb_count_dict[(_text, _verb)] += 1
 
-                        elif _span.root.dep_ == 'dobj':
-                            _verb = _span.root.head.lemma_.lower()
-                            dobj_verb_count_dict[(_text, _verb)] += 1
+                            elif _span.root.dep_ == 'dobj':
+                                _verb = self.__get_verb(_span.root.head)
+                                dobj_verb_count_dict[(_text, _verb)] += 1
 
             # Check for single noun phrases that do not appear in coreference clusters
-            for _noun_chunk in doc.noun_chunks:
+            with self.__timer('noun_chunks'):
+                n_noun_chunks = 0
+                cluster_coverage = self.__get_cluster_coverage(clusters, len(doc))
+                for _noun_chunk in doc.noun_chunks:
 
-                in_coref_cluster = False
-                for _cluster in clusters:
-                    for _span in _cluster:
-                        if self.__is_overlapping(_noun_chunk.start, _noun_chunk.end, _span.start, _span.end):
-                            in_coref_cluster = True
+                    n_noun_chunks += 1
+                    in_coref_cluster = cluster_coverage[_noun_chunk.end + 1] - cluster_coverage[_noun_chunk.start] > 0
 
-                if not in_coref_cluster:
+                    if not in_coref_cluster:
 
-                    _text = _noun_chunk.text.lower().strip(',.!?\'"')
-                    _text = re.sub(r'^(my|his|her|their|our|your|the|a|an) ', '', _text)
+                        _text = get_persona_name(_noun_chunk.text)
 
-                    if _text not in ['that', 'which', 'who', 'what']:
+                        if _text not in RELATIVE_PRONOUNS:
 
-                        self.persona_count_dict[_text] += 1
-                        self.entity_match_count_dict[_text][str(_noun_chunk).lower()] += 1
+                            entity_match_count_dict[_text][str(_noun_chunk).lower()] += 1
 
-                        if _noun_chunk.root.dep_ == 'nsubj':
-                            _verb = _noun_chunk.root.head.lemma_.lower()
-                            nsubj_verb_count_dict[(_text, _verb)] += 1
+                            if _noun_chunk.root.dep_ == 'nsubj':
+                                _verb = self.__get_verb(_noun_chunk.root.head)
+                                nsubj_verb_count_dict[(_text, _verb)] += 1
 
-                        elif _noun_chunk.root.dep_ == 'dobj':
-                            _verb = _noun_chunk.root.head.lemma_.lower()
-                            dobj_verb_count_dict[(_text, _verb)] += 1
+                            elif _noun_chunk.root.dep_ == 'dobj':
+                                _verb = self.__get_verb(_noun_chunk.root.head)
+                                dobj_verb_count_dict[(_text, _verb)] += 1
 
+            if self.stats is not None:
+                self.stats.count('clusters', len(clusters))
+                self.stats.count('noun_chunks', n_noun_chunks)
 
-        return nsubj_verb_count_dict, dobj_verb_count_dict
+        return nsubj_verb_count_dict, dobj_verb_count_dict, entity_match_count_dict
 
 
-    def __parse_and_extract(self, text, persona_patterns_dict):
+    def __parse_and_extract(self, doc, persona_matcher):
 
         nsubj_verb_count_dict = defaultdict(int)
         dobj_verb_count_dict = defaultdict(int)
+        entity_match_count_dict = defaultdict(default_dict_int)
 
-        if text.strip():
-
-            doc = nlp(text)
+        if doc is not None:
 
             for _parsed_sentence in doc.sents:
                 for _noun_chunk in _parsed_sentence.noun_chunks:
 
                     if _noun_chunk.root.dep_ == 'nsubj':
 
-                        for _persona, _pattern in persona_patterns_dict.items():
+                        _noun_chunk_text = _noun_chunk.text.lower()
+                        for _persona in persona_matcher.match(_noun_chunk_text):
 
-                            if re.findall(_pattern, _noun_chunk.text.lower()):
+                            entity_match_count_dict[_persona][_noun_chunk_text] += 1
 
-                                self.persona_count_dict[_persona] += 1
-                                self.entity_match_count_dict[_persona][_noun_chunk.text.lower()] += 1
-
-                                _nusbj = _persona
-                                _verb = _noun_chunk.root.head.lemma_.lower()
-                                nsubj_verb_count_dict[(_nusbj, _verb)] += 1
+                            _nusbj = _persona
+                            _verb = self.__get_verb(_noun_chunk.root.head)
+                            nsubj_verb_count_dict[(_nusbj, _verb)] += 1
 
                     elif _noun_chunk.root.dep_ == 'dobj':
 
-                        for _persona, _pattern in persona_patterns_dict.items():
+                        _noun_chunk_text = _noun_chunk.text.lower()
+                        for _persona in persona_matcher.match(_noun_chunk_text):
 
-                            if re.findall(_pattern, _noun_chunk.text.lower()):
+                            entity_match_count_dict[_persona][_noun_chunk_text] += 1
 
-                                self.persona_count_dict[_persona] += 1
-                                self.entity_match_count_dict[_persona][_noun_chunk.text.lower()] += 1
+                            _dobj = _persona
+                            _verb = self.__get_verb(_noun_chunk.root.head)
+                            dobj_verb_count_dict[(_dobj, _verb)] += 1
 
-                                _dobj = _persona
-                                _verb = _noun_chunk.root.head.lemma_.lower()
-                                dobj_verb_count_dict[(_dobj, _verb)] += 1
+        return nsubj_verb_count_dict, dobj_verb_count_dict, entity_match_count_dict
 
-        return nsubj_verb_count_dict, dobj_verb_count_dict
 
+    def __score_documents(self, matrix):
+        """
+        Score every document from the count matrix at once.
+        Returns the per-document score and scored verb dicts, along with the (document, persona) keys and their scores.
+        """
 
-    def __score_document(self,
-                         nsubj_verb_count_dict,
-                         dobj_verb_count_dict):
+        entry_scores, scored = matrix.get_entry_scores(self.verb_score_dict)
+        if self.stats is not None:
+            self.stats.count('verb_occurrences', int(matrix.count.sum()))
+            self.stats.count('scored_verb_occurrences', int(matrix.count[scored].sum()))
+
+        n_personas = len(matrix.personas)
+        doc_idx = matrix.get_doc_idx()[scored]
+        persona_idx = matrix.persona_idx[scored]
+        verb_idx = matrix.verb_idx[scored]
+        role = matrix.role[scored]
+        entry_scores = entry_scores[scored]
+
+        doc_persona_keys, \
+            doc_persona_scored_verbs, \
+            doc_persona_scores = sum_by_key(doc_idx * n_personas + persona_idx, matrix.count[scored] * entry_scores)
+
+        # The keys are grouped by document, since the matrix entries are
+        _doc_idx, _persona_idx = np.divmod(doc_persona_keys, max(n_personas, 1))
+        id_persona_score_dict = PersonaScoreTable.from_sorted_rows(matrix.doc_ids, _doc_idx, {'personas': matrix.personas},
+                                                                   {'persona_idx': _persona_idx, 'value': doc_persona_scores})
+        id_persona_scored_verb_dict = PersonaTable.from_sorted_rows(matrix.doc_ids, _doc_idx, {'personas': matrix.personas},
+                                                                    {'persona_idx': _persona_idx, 'value': doc_persona_scored_verbs})
+
+        _persona_keys, _match_counts = sum_by_key(persona_idx)
+        match_counts = [(matrix.personas[_persona_i], _count) for _persona_i, _count in zip(_persona_keys.tolist(), _match_counts.tolist())]
+
+        # Count the documents in which each verb contributed positively or negatively to a persona
+        is_negative = entry_scores < 0
+        is_polar = is_negative | (entry_scores > 0)
+        _polarity_keys, _polarity_counts = sum_by_key(((persona_idx[is_polar] * 2 + is_negative[is_polar]) * len(matrix.verbs) + verb_idx[is_polar]) * 2 + role[is_polar])
+        polarity_counts = []
+        for _key, _count in zip(_polarity_keys.tolist(), _polarity_counts.tolist()):
+            _key, _role = divmod(_key, 2)
+            _key, _verb_i = divmod(_key, len(matrix.verbs))
+            _persona_i, _is_negative = divmod(_key, 2)
+            _polarity = 'negative' if _is_negative else 'positive'
+            polarity_counts.append((matrix.personas[_persona_i], _polarity, matrix.verbs[_verb_i] + '_' + ROLE_NAMES[_role], _count))
+
+        return id_persona_score_dict, id_persona_scored_verb_dict, doc_persona_keys, doc_persona_scores, match_counts, polarity_counts
+
+
+    def __add_lexicon_matches(self, match_counts, polarity_counts, sign=1):
+        """
+        Add (or with sign=-1, subtract) lexicon matches to persona_match_count_dict and persona_polarity_verb_count_dict,
+        dropping the entries whose counts fall to zero.
+        """
 
-        persona_score_dict = defaultdict(float)
-        persona_scored_verbs_dict = defaultdict(int)
+        for _persona, _count in match_counts:
+            self.persona_match_count_dict[_persona] += sign * _count
+            if self.persona_match_count_dict[_persona] == 0:
+                del self.persona_match_count_dict[_persona]
 
-        for (_persona, _verb), _count in nsubj_verb_count_dict.items():
-            if _verb in self.verb_score_dict:
-                persona_scored_verbs_dict[_persona] += 1
-                _agent_score = self.verb_score_dict[_verb]['agent']
-                persona_score_dict[_persona] += (_count*_agent_score)
-                self.persona_match_count_dict[_persona] += 1
-                if _agent_score < 0:
-                    self.persona_polarity_verb_count_dict[_persona]['negative'][_verb + '_nsubj'] += 1
-                elif _agent_score > 0:
-                    self.persona_polarity_verb_count_dict[_persona]['positive'][_verb + '_nsubj'] += 1
+        for _persona, _polarity, _verb, _count in polarity_counts:
+            self.persona_polarity_verb_count_dict.add((_persona, _polarity, _verb), sign * _count)
 
-        for (_persona, _verb), _count in dobj_verb_count_dict.items():
-            if _verb in self.verb_score_dict:
-                persona_scored_verbs_dict[_persona] += 1
-                _theme_score = self.verb_score_dict[_verb]['theme']
-                persona_score_dict[_persona] += (_count*_theme_score)
-                self.persona_match_count_dict[_persona] += 1
-                if _theme_score < 0:
-                    self.persona_polarity_verb_count_dict[_persona]['negative'][_verb + '_dobj'] += 1
-                elif _theme_score > 0:
-                    self.persona_polarity_verb_count_dict[_persona]['positive'][_verb + '_dobj'] += 1
-
-        return persona_score_dict, persona_scored_verbs_dict
-    
 
-    def __get_persona_score_dict(self, persona_score_dicts, persona_count_dict):
+    def __add_entity_matches(self, entity_match_count_dict, sign=1):
+        """
+        Add (or with sign=-1, subtract) a document's entity matches to persona_count_dict and entity_match_count_dict.
+        """
+
+        for _persona, _match_count_dict in entity_match_count_dict.items():
+            for _match, _count in _match_count_dict.items():
+                self.persona_count_dict[_persona] += sign * _count
+                self.entity_match_count_dict.add((_persona, _match), sign * _count)
+            if self.persona_count_dict[_persona] == 0:
+                del self.persona_count_dict[_persona]
+
+
+    def __add_persona_score_sums(self, persona_score_sum_dict, personas, doc_persona_keys, doc_persona_scores):
+        """
+        Add the (document, persona) scores to the running sums one document at a time, in order,
+        so the sums are the same as if the documents had all been scored together.
+        """
+        for _key, _score in zip(doc_persona_keys.tolist(), doc_persona_scores.tolist()):
+            persona_score_sum_dict[personas[_key % len(personas)]] += _score
+
+
+    def __score_dimensions(self, matrix):
+        """
+        Scores every document in every dimension of the lexicon, if it has named dimensions.
+        """
+
+        if not isinstance(self.verb_score_dict, Lexicon) or None in self.verb_score_dict.dimensions:
+            self.scored_dimensions = None
+            self.dimension_personas = None
+            self.persona_dimension_score_sums = None
+            self.persona_dimension_match_counts = None
+            return
+
+        self.scored_dimensions = list(self.verb_score_dict.dimensions)
+        self.dimension_personas = []
+        self.persona_dimension_score_sums = np.zeros((0, len(self.scored_dimensions)))
+        self.persona_dimension_match_counts = np.zeros((0, len(self.scored_dimensions)), dtype=np.int64)
+        self.__add_dimension_scores(matrix)
+
+
+    def __add_dimension_scores(self, matrix, sign=1):
+        """
+        Add (or with sign=-1, subtract) the scores of the documents in a count matrix in every lexicon dimension.
+        The (document, persona) scores are added in document order, so the sums are the same as for persona_score_sum_dict.
+        """
+
+        in_lexicon, agent_scores, theme_scores = self.verb_score_dict.get_score_matrices(matrix.verbs)
+        scored = in_lexicon[matrix.verb_idx]
+        entry_scores = np.where((matrix.role == NSUBJ)[:, None], agent_scores[matrix.verb_idx], theme_scores[matrix.verb_idx])
+        entry_scores = np.where(scored, matrix.count[:, None] * entry_scores, 0.0)
+
+        n_personas = max(len(matrix.personas), 1)
+        doc_persona_keys, doc_persona_idx = np.unique(matrix.get_doc_idx() * n_personas + matrix.persona_idx, return_inverse=True)
+        doc_persona_scores = np.zeros((len(doc_persona_keys), len(self.scored_dimensions)))
+        np.add.at(doc_persona_scores, doc_persona_idx, entry_scores)
+
+        # Rows for the personas of the matrix, adding new ones
+        persona_index = {_persona: i for i, _persona in enumerate(self.dimension_personas)}
+        rows = np.array([persona_index.setdefault(_persona, len(persona_index)) for _persona in matrix.personas], dtype=np.int64)
+        n_new_personas = len(persona_index) - len(self.dimension_personas)
+        if n_new_personas:
+            self.dimension_personas = list(persona_index.keys())
+            self.persona_dimension_score_sums = np.vstack([self.persona_dimension_score_sums, np.zeros((n_new_personas, len(self.scored_dimensions)))])
+            self.persona_dimension_match_counts = np.vstack([self.persona_dimension_match_counts, np.zeros((n_new_personas, len(self.scored_dimensions)), dtype=np.int64)])
+
+        np.add.at(self.persona_dimension_score_sums, rows[doc_persona_keys % n_personas], sign * doc_persona_scores)
+        np.add.at(self.persona_dimension_match_counts, rows[matrix.persona_idx], sign * scored.astype(np.int64))
+
 
-        persona_score_dict = defaultdict(float)
-        for _persona_score_dict in persona_score_dicts:
-            for _persona, _score in _persona_score_dict.items():
-                persona_score_dict[_persona] += _score
+    def __get_scored_dimension_idx(self, dimension):
+        if self.persona_dimension_score_sums is None:
+            raise ValueError('There are no scores by dimension, load a lexicon with load_lexicon_dimensions() and call train() or rescore()')
+        if dimension not in self.scored_dimensions:
+            raise ValueError(f'There are no scores for the "{dimension}" dimension, only for {self.scored_dimensions}')
+        return self.scored_dimensions.index(dimension)
+
+
+    def __get_dimension_scores(self):
+        # Normalized over the total number of nsubj and dobj occurrences of each persona, like persona_score_dict
+        persona_counts = np.array([self.persona_count_dict.get(_persona, 0) for _persona in self.dimension_personas], dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.persona_dimension_score_sums / persona_counts[:, None]
+
+
+    def __get_persona_score_dict(self, persona_score_sum_dict, persona_count_dict):
 
         # Normalize the scores over the total number of nsubj and dobj occurrences in the dataset for this persona
-        persona_score_dict = {p: s/float(persona_count_dict[p]) for p, s in persona_score_dict.items() if persona_count_dict[p] > 0}
+        persona_score_dict = {}
+        for _persona, _score in persona_score_sum_dict.items():
+            if persona_count_dict.get(_persona, 0) > 0:
+                persona_score_dict[_persona] = _score/float(persona_count_dict[_persona])
 
         return persona_score_dict
 
 
-    def __score_dataset(self, texts, text_ids, num_bootstraps, persona_patterns_dict):
+    def __extract_dataset(self, texts, text_ids, persona_patterns_dict, batch_size=None, n_process=1, parse_cache=None):
 
-        id_nsubj_verb_count_dict = {}
-        id_dobj_verb_count_dict = {}
-        id_persona_score_dict = {}
-        id_persona_count_dict = {}
-        id_persona_scored_verb_dict = {}
+        text_id_list = []
+        persona_counts = DocumentTableBuilder(PersonaTable)
+        verb_counts = DocumentTableBuilder(CountMatrix)
+        entity_matches = DocumentTableBuilder(EntityTable)
 
-        for _text, _id in tqdm(zip(texts, text_ids), total=len(texts)):
+        extractions = self.__extract_documents(texts, persona_patterns_dict, batch_size, n_process, parse_cache)
 
-            if not persona_patterns_dict:
-                _nsubj_verb_count_dict, _dobj_verb_count_dict = self.__parse_and_extract_coref(_text)
-            else:
-                _nsubj_verb_count_dict, _dobj_verb_count_dict = self.__parse_and_extract(_text, persona_patterns_dict)
+        documents = zip(extractions, text_ids)
+        if self.progress_bar is not None:
+            documents = self.progress_bar(documents, total=(len(texts) if hasattr(texts, '__len__') else None))
+
+        for (_nsubj_verb_count_dict, _dobj_verb_count_dict, _entity_match_count_dict), _id in documents:
+
+            text_id_list.append(_id)
+            self.__add_entity_matches(_entity_match_count_dict)
+
+            persona_counts.add(_id, self.__get_persona_counts_per_document(_nsubj_verb_count_dict, _dobj_verb_count_dict))
+            verb_counts.add(_id, _nsubj_verb_count_dict, _dobj_verb_count_dict)
+            entity_matches.add(_id, _entity_match_count_dict)
 
-            _persona_score_dict, _persona_scored_verb_dict = self.__score_document(_nsubj_verb_count_dict, _dobj_verb_count_dict)
-            _persona_count_dict = self.__get_persona_counts_per_document(_nsubj_verb_count_dict, _dobj_verb_count_dict)
+        matrix = verb_counts.build()
 
-            id_persona_score_dict[_id] = _persona_score_dict
-            id_persona_count_dict[_id] = _persona_count_dict
-            id_nsubj_verb_count_dict[_id] = _nsubj_verb_count_dict
-            id_dobj_verb_count_dict[_id] = _dobj_verb_count_dict
-            id_persona_scored_verb_dict[_id] = _persona_scored_verb_dict
+        return text_id_list, persona_counts.build(), matrix.get_role_view(NSUBJ), matrix.get_role_view(DOBJ), entity_matches.build()
+
+
+    def __score_dataset(self, matrix, num_bootstraps, random_seed=None, confidence_level=None, n_jobs=1, bootstrap_memory_limit=DEFAULT_BOOTSTRAP_MEMORY_LIMIT):
+
+        with self.__timer('score'):
+            id_persona_score_dict, \
+                id_persona_scored_verb_dict, \
+                doc_persona_keys, \
+                doc_persona_scores, \
+                match_counts, \
+                polarity_counts = self.__score_documents(matrix)
+
+            self.__add_lexicon_matches(match_counts, polarity_counts)
+
+            persona_score_sum_dict = defaultdict(float)
+            self.__add_persona_score_sums(persona_score_sum_dict, matrix.personas, doc_persona_keys, doc_persona_scores)
 
         persona_score_dict = None
         persona_sd_dict = None
+        persona_ci_dict = None
         
         if not num_bootstraps:
-            # persona_score_dict = self.__get_persona_score_dict(list(id_persona_score_dict.keys()), self.persona_count_dict)
-            persona_score_dict = self.__get_persona_score_dict(id_persona_score_dict.values(), self.persona_count_dict)
+            persona_score_dict = self.__get_persona_score_dict(persona_score_sum_dict, self.persona_count_dict)
 
         # If requested, resample multiple times and calculate means and standard deviations
         else:
+            with self.__timer('bootstrap'):
+                persona_score_dict, \
+                    persona_sd_dict, \
+                    persona_ci_dict = self.__bootstrap(matrix, doc_persona_keys, doc_persona_scores, num_bootstraps, random_seed, confidence_level, n_jobs, bootstrap_memory_limit)
+
+        logger.info('Scoring complete')
 
-            _id_list = list(id_nsubj_verb_count_dict.keys())
-            _persona_scores_dict = defaultdict(list)
+        with self.__timer('doc_indexes'):
+            verb_doc_index, persona_doc_index = self.__get_doc_indexes(matrix, doc_persona_keys)
 
-            for i in range(num_bootstraps):
+        return persona_score_dict, persona_sd_dict, persona_ci_dict, persona_score_sum_dict, id_persona_score_dict, id_persona_scored_verb_dict, verb_doc_index, persona_doc_index
 
-                _sampled_ids = random.choices(_id_list, k=len(_id_list))
 
-                _sampled_persona_count_dict = defaultdict(int)
-                for _id in _sampled_ids:
-                    for _persona, _count in id_persona_count_dict[_id].items():
-                        _sampled_persona_count_dict[_persona] += _count
+    def __bootstrap(self, matrix, doc_persona_keys, doc_persona_scores, num_bootstraps, random_seed, confidence_level, n_jobs, bootstrap_memory_limit):
 
-                _sampled_persona_score_dicts = [id_persona_score_dict[_id] for _id in _sampled_ids]
+        persona_score_dict = {}
+        persona_sd_dict = {}
+        persona_ci_dict = {} if confidence_level else None
 
-                _persona_score_dict = self.__get_persona_score_dict(_sampled_persona_score_dicts, _sampled_persona_count_dict)
-                for _persona, _score in _persona_score_dict.items():
-                    _persona_scores_dict[_persona].append(_score)
+        n_docs = len(matrix.doc_ids)
+        n_personas = len(matrix.personas)
+        if n_docs == 0 or n_personas == 0:
+            return persona_score_dict, persona_sd_dict, persona_ci_dict
 
-            persona_score_dict = {}
-            persona_sd_dict = {}
-            for _persona, _scores in _persona_scores_dict.items():
-                persona_score_dict[_persona] = np.mean(_scores)
-                persona_sd_dict[_persona] = np.std(_scores)
+        # The number of nsubj and dobj occurrences of each persona in each document, as in id_persona_count_dict
+        count_keys, _, count_values = sum_by_key(matrix.get_doc_idx() * n_personas + matrix.persona_idx, matrix.count)
 
-        print(str(datetime.now())[:-7] + ' Complete!')
+        sampler = BootstrapSampler(n_docs,
+                                   n_personas,
+                                   doc_persona_keys // n_personas,
+                                   doc_persona_keys % n_personas,
+                                   doc_persona_scores,
+                                   count_keys // n_personas,
+                                   count_keys % n_personas,
+                                   count_values)
 
-        return persona_score_dict, persona_sd_dict, id_persona_score_dict, id_persona_count_dict, id_nsubj_verb_count_dict, id_dobj_verb_count_dict, id_persona_scored_verb_dict
+        # Replicates are drawn in fixed blocks of BOOTSTRAP_BLOCK_SIZE, each from its own RNG stream spawned from random_seed,
+        # and the blocks' statistics are merged in order. The memory limit only sets how many replicates of a block are
+        # drawn at once, so the results depend on random_seed alone, and not on n_jobs or bootstrap_memory_limit
+        block_sizes = [min(BOOTSTRAP_BLOCK_SIZE, num_bootstraps - i) for i in range(0, num_bootstraps, BOOTSTRAP_BLOCK_SIZE)]
+        seeds = np.random.SeedSequence(random_seed).spawn(len(block_sizes))
+        chunk_size = sampler.get_chunk_size(bootstrap_memory_limit)
+        keep_scores = bool(confidence_level)
+
+        if n_jobs == 1:
+            block_results = (sampler.sample_statistics(_size, _seed, keep_scores, chunk_size) for _size, _seed in zip(block_sizes, seeds))
+        else:
+            with ProcessPoolExecutor(max_workers=(None if n_jobs == -1 else n_jobs),
+                                     initializer=_init_bootstrap_worker,
+                                     initargs=(sampler,)) as executor:
+                block_results = list(executor.map(_sample_bootstrap_block, block_sizes, seeds,
+                                                  [keep_scores] * len(block_sizes), [chunk_size] * len(block_sizes)))
+
+        statistics = (np.zeros(n_personas, dtype=np.int64), np.zeros(n_personas), np.zeros(n_personas))
+        block_scores = []
+        for _n, _means, _m2, _scores in block_results:
+            statistics = BootstrapSampler.merge_statistics(statistics, (_n, _means, _m2))
+            if keep_scores:
+                block_scores.append(_scores)
+
+        # Personas that never have a scored verb in any replicate are left out, as they would be without bootstrapping
+        n, means, m2 = statistics
+        sampled = n > 0
+        means = means[sampled]
+        sds = np.sqrt(m2[sampled] / n[sampled])
+        if confidence_level:
+            lower_bounds, upper_bounds = np.nanpercentile(np.concatenate(block_scores)[:, sampled],
+                                                          [50 * (1 - confidence_level), 50 * (1 + confidence_level)],
+                                                          axis=0)
+
+        for i, _persona_i in enumerate(np.flatnonzero(sampled).tolist()):
+            _persona = matrix.personas[_persona_i]
+            persona_score_dict[_persona] = float(means[i])
+            persona_sd_dict[_persona] = float(sds[i])
+            if confidence_level:
+                persona_ci_dict[_persona] = (float(lower_bounds[i]), float(upper_bounds[i]))
+
+        return persona_score_dict, persona_sd_dict, persona_ci_dict
 
 
     def __get_persona_counts_per_document(self,
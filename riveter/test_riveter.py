@@ -0,0 +1,525 @@
+# Can run with:
+# "pip install pytest"
+# "pytest test_riveter.py"
+#
+# These tests use the rule-based stub pipeline from benchmark.py instead of the spaCy models, so they run anywhere.
+# They check that the different ways of building a Riveter give the same results, not the quality of the parses.
+
+import os
+import re
+
+import pandas as pd
+import pytest
+
+from riveter import Riveter, Lexicon, PersonaMatcher, ParseCache, read_corpus
+from riveter.riveter import PIPELINES
+from riveter.benchmark import STUB_MODEL, STUB_COREF_MODEL, PERSONA_PATTERNS, load_benchmark_corpus, register_stub_pipelines
+
+
+@pytest.fixture(scope='module', autouse=True)
+def stub_pipelines():
+    register_stub_pipelines()
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    fake_texts, fake_ids = load_benchmark_corpus('fake_stories', 0, 0)
+    synthetic_texts, synthetic_ids = load_benchmark_corpus('synthetic', 40, 0)
+    # RiveterStore needs the IDs to be all strings or all integers
+    return fake_texts + synthetic_texts, [f'fake_{_id}' for _id in fake_ids] + synthetic_ids
+
+
+def train_stub(texts, text_ids, persona_patterns_dict=None):
+    riveter = Riveter(model_name=STUB_MODEL, coref_model_name=STUB_COREF_MODEL)
+    riveter.progress_bar = None
+    riveter.load_sap_lexicon('power')
+    riveter.train(texts, text_ids, persona_patterns_dict=persona_patterns_dict)
+    return riveter
+
+
+def get_results(riveter, text_ids):
+    """
+    Everything the query methods return for the documents and every verb and persona, to compare Riveters by.
+    """
+
+    verbs = sorted({_verb for _id in text_ids for _persona, _verb in list(riveter.count_nsubj_for_doc(_id)) + list(riveter.count_dobj_for_doc(_id))})
+    personas = sorted(riveter.get_score_totals())
+
+    return {'score_totals': riveter.get_score_totals(),
+            'persona_counts': dict(riveter.get_persona_counts()),
+            'polarity_verb_counts': riveter.get_persona_polarity_verb_count_dict(),
+            'docs': {_id: {'scores': riveter.get_scores_for_doc(_id),
+                           'personas': riveter.count_personas_for_doc(_id),
+                           'scored_verbs': riveter.count_scored_verbs_for_doc(_id),
+                           'nsubj': riveter.count_nsubj_for_doc(_id),
+                           'dobj': riveter.count_dobj_for_doc(_id)}
+                     for _id in text_ids},
+            'documents_for_verb': {_verb: riveter.get_documents_for_verb(_verb) for _verb in verbs},
+            'documents_for_persona': {_persona: riveter.get_documents_for_persona(_persona) for _persona in personas}}
+
+
+def assert_same_results(riveter, expected_riveter, text_ids):
+    # Scores built up from running sums can differ from a fresh train() in the last bits
+    results, expected = get_results(riveter, text_ids), get_results(expected_riveter, text_ids)
+    assert expected['score_totals']
+    assert results.pop('score_totals') == pytest.approx(expected.pop('score_totals'))
+    for _id in text_ids:
+        assert results['docs'][_id].pop('scores') == pytest.approx(expected['docs'][_id].pop('scores'))
+    assert results == expected
+
+
+def test_persona_matcher(corpus):
+    # Literal patterns (found with the KeywordTrie), overlapping ones, regexes, a compiled pattern and a backreference
+    persona_patterns_dict = dict(PERSONA_PATTERNS,
+                                 eliza='eliza',
+                                 her='her',
+                                 mother='mother',
+                                 the_mother='the mother',
+                                 sisters=r'sisters?',
+                                 mr=re.compile(r'\bmr\.? \w+', flags=re.IGNORECASE),
+                                 repeated=r'\b(\w+) \1\b')
+    matcher = PersonaMatcher(persona_patterns_dict)
+
+    texts, _ = corpus
+    noun_chunks = [_chunk.lower() for _text in texts for _chunk in re.split(r'[.,;!?"]', _text)]
+    noun_chunks += ['', 'her', 'mother', 'the mother', 'grandmother', 'Mr. Darcy', 'mr bingley', 'very very', 'herself']
+    for _text in noun_chunks:
+        expected = [_persona for _persona, _pattern in persona_patterns_dict.items() if re.findall(_pattern, _text)]
+        assert matcher.match(_text) == expected, _text
+
+
+@pytest.mark.parametrize('persona_patterns_dict', [None, PERSONA_PATTERNS])
+def test_update_and_remove(corpus, persona_patterns_dict):
+    texts, text_ids = corpus
+    removed_ids = set(text_ids[::5])
+    kept = [(_text, _id) for _text, _id in zip(texts, text_ids) if _id not in removed_ids]
+    kept_texts, kept_ids = [_text for _text, _id in kept], [_id for _text, _id in kept]
+
+    riveter = train_stub(texts[:20], text_ids[:20], persona_patterns_dict)
+    riveter.update(texts[20:], text_ids[20:])
+    assert_same_results(riveter, train_stub(texts, text_ids, persona_patterns_dict), text_ids)
+
+    riveter.remove(sorted(removed_ids, key=text_ids.index))
+    assert_same_results(riveter, train_stub(kept_texts, kept_ids, persona_patterns_dict), kept_ids)
+
+    with pytest.raises(ValueError):
+        riveter.update(texts[1:2], text_ids[1:2])
+
+
+@pytest.mark.parametrize('persona_patterns_dict', [None, PERSONA_PATTERNS])
+def test_merge(corpus, tmp_path, persona_patterns_dict):
+    texts, text_ids = corpus
+    shards = [train_stub(texts[_start:_end], text_ids[_start:_end], persona_patterns_dict) for _start, _end in [(0, 15), (15, 30), (30, None)]]
+    shard_path = str(tmp_path / 'shard.pkl')
+    shards[1].save(shard_path)
+
+    merged = Riveter.merge(shards[0], shard_path, shards[2])
+    assert_same_results(merged, train_stub(texts, text_ids, persona_patterns_dict), text_ids)
+
+
+def test_merge_bootstrap(corpus):
+    texts, text_ids = corpus
+    shards = [train_stub(texts[:20], text_ids[:20]), train_stub(texts[20:], text_ids[20:])]
+
+    merged = Riveter.merge(*shards, num_bootstraps=20, random_seed=3)
+    riveter = train_stub(texts, text_ids)
+    riveter.rescore(num_bootstraps=20, random_seed=3)
+    assert merged.persona_score_dict == pytest.approx(riveter.persona_score_dict)
+    assert merged.persona_sd_dict == pytest.approx(riveter.persona_sd_dict)
+
+
+@pytest.mark.parametrize('persona_patterns_dict', [None, PERSONA_PATTERNS])
+def test_save_and_open(corpus, tmp_path, persona_patterns_dict):
+    texts, text_ids = corpus
+    riveter = train_stub(texts, text_ids, persona_patterns_dict)
+
+    store_path = str(tmp_path / 'riveter')
+    pickle_path = str(tmp_path / 'riveter.pkl')
+    riveter.save(store_path)
+    riveter.save(pickle_path)
+
+    assert_same_results(Riveter.open(store_path), riveter, text_ids)
+    assert_same_results(Riveter(filename=store_path), riveter, text_ids)
+    assert_same_results(Riveter(filename=pickle_path), riveter, text_ids)
+
+
+def test_save_and_open_compiled_patterns(corpus, tmp_path):
+    texts, text_ids = corpus
+    persona_patterns_dict = dict(PERSONA_PATTERNS, mr=re.compile(r'\bmr\.? \w+', flags=re.IGNORECASE))
+    riveter = train_stub(texts, text_ids, persona_patterns_dict)
+
+    store_path = str(tmp_path / 'riveter')
+    riveter.save(store_path)
+
+    opened = Riveter.open(store_path)
+    assert opened.persona_patterns_dict == persona_patterns_dict
+    assert_same_results(opened, riveter, text_ids)
+
+
+def test_open_reads_counters_lazily(corpus, tmp_path):
+    texts, text_ids = corpus
+    riveter = Riveter(model_name=STUB_MODEL, coref_model_name=STUB_COREF_MODEL)
+    riveter.progress_bar = None
+    riveter.load_lexicon_dimensions(['power', 'agency'])
+    riveter.train(texts, text_ids, persona_patterns_dict=PERSONA_PATTERNS)
+
+    store_path = str(tmp_path / 'riveter')
+    riveter.save(store_path)
+
+    opened = Riveter.open(store_path, mmap=True)
+    assert opened.get_score_totals() == riveter.get_score_totals()
+    assert opened.get_score_matrix().equals(riveter.get_score_matrix())
+    assert 'entity_match_count_dict' not in vars(opened)
+    assert 'persona_polarity_verb_count_dict' not in vars(opened)
+
+    assert opened.get_persona_polarity_verb_count_dict() == riveter.get_persona_polarity_verb_count_dict()
+    assert 'persona_polarity_verb_count_dict' in vars(opened)
+    assert 'entity_match_count_dict' not in vars(opened)
+    persona = next(iter(riveter.entity_match_count_dict))
+    assert opened.get_persona_cluster(persona) == riveter.get_persona_cluster(persona)
+
+
+def train_cached(texts, text_ids, parse_cache, model_name=STUB_MODEL, **kwargs):
+    riveter = Riveter(model_name=model_name, coref_model_name=STUB_COREF_MODEL)
+    riveter.progress_bar = None
+    riveter.load_sap_lexicon('power')
+    riveter.enable_stats()
+    riveter.train(texts, text_ids, parse_cache=parse_cache, **kwargs)
+    return riveter
+
+
+def test_parse_cache_hits(corpus, tmp_path):
+    texts, text_ids = corpus
+    parse_cache = ParseCache(str(tmp_path / 'cache'))
+
+    riveter = train_cached(texts, text_ids, parse_cache)
+    assert riveter.stats.counters['parsed_documents'] == len(texts)
+    assert riveter.stats.counters['cached_documents'] == 0
+
+    # A cache directory can also be given as a path
+    cached = train_cached(texts, text_ids, str(tmp_path / 'cache'))
+    assert cached.stats.counters['parsed_documents'] == 0
+    assert cached.stats.counters['cached_documents'] == len(texts)
+    assert_same_results(cached, riveter, text_ids)
+
+
+@pytest.mark.parametrize('base_settings, settings', [({}, {'model_name': 'riveter-stub-copy'}),
+                                                      ({}, {'persona_patterns_dict': PERSONA_PATTERNS}),
+                                                      ({}, {'coref_window_size': 200}),
+                                                      ({'coref_window_size': 200}, {'coref_window_size': 300}),
+                                                      ({}, {'pipeline_components': ['parser', 'coref']})])
+def test_parse_cache_settings(corpus, tmp_path, base_settings, settings):
+    texts, text_ids = corpus
+    PIPELINES[('riveter-stub-copy', STUB_COREF_MODEL)] = PIPELINES[(STUB_MODEL, STUB_COREF_MODEL)]
+    parse_cache = ParseCache(str(tmp_path / 'cache'))
+    train_cached(texts, text_ids, parse_cache, **base_settings)
+
+    # Extractions with other settings aren't read from the cache, but are added to it
+    riveter = train_cached(texts, text_ids, parse_cache, **settings)
+    assert riveter.stats.counters['parsed_documents'] == len(texts)
+    assert riveter.stats.counters['cached_documents'] == 0
+
+    cached = train_cached(texts, text_ids, parse_cache, **settings)
+    assert cached.stats.counters['cached_documents'] == len(texts)
+    assert_same_results(cached, riveter, text_ids)
+
+
+def test_parse_cache_eviction(tmp_path):
+    parse_cache = ParseCache(str(tmp_path / 'cache'))
+    extraction = ({('i', 'help'): 1}, {('mother', 'call'): 2}, {'i': {'i': 1}})
+    keys = [parse_cache.get_key(f'text {i}', ['settings']) for i in range(4)]
+
+    parse_cache.put(keys[0], extraction)
+    entry_size = parse_cache.size
+    for _key in keys[1:3]:
+        parse_cache.put(_key, extraction)
+
+    # Give the entries distinct ages, oldest first, then use the oldest one again
+    paths = {_path.stem: _path for _path in (tmp_path / 'cache').rglob('*.pkl')}
+    for i, _key in enumerate(keys[:3]):
+        os.utime(paths[_key], (i, i))
+    assert parse_cache.get(keys[0]) == extraction
+
+    # A fourth entry goes over max_size, which evicts the least recently used one
+    parse_cache.max_size = 4 * entry_size - 1
+    parse_cache.put(keys[3], extraction)
+    assert parse_cache.get(keys[1]) is None
+    assert all(parse_cache.get(_key) == extraction for _key in [keys[0], keys[2], keys[3]])
+    assert parse_cache.size == 3 * entry_size
+
+    # A cache that is reopened with a smaller max_size is evicted down to it
+    parse_cache = ParseCache(str(tmp_path / 'cache'), max_size=2 * entry_size)
+    assert parse_cache.size <= 0.9 * 2 * entry_size
+
+
+@pytest.mark.parametrize('n_jobs, bootstrap_memory_limit', [(1, 1), (2, 2**28), (2, 1)])
+def test_bootstrap_settings(corpus, n_jobs, bootstrap_memory_limit):
+    # The bootstrapped scores depend on random_seed alone, for rescore() and for update() and remove() that rescore
+    texts, text_ids = corpus
+    settings = dict(num_bootstraps=150, random_seed=3, confidence_level=0.9)
+
+    expected = train_stub(texts, text_ids)
+    expected.rescore(**settings)
+    riveter = train_stub(texts, text_ids)
+    riveter.rescore(**settings, n_jobs=n_jobs, bootstrap_memory_limit=bootstrap_memory_limit)
+    assert riveter.get_score_totals() == expected.get_score_totals()
+    assert riveter.persona_sd_dict == expected.persona_sd_dict
+    assert riveter.persona_ci_dict == expected.persona_ci_dict
+
+    riveter = train_stub(texts[:20], text_ids[:20])
+    riveter.update(texts[20:], text_ids[20:], **settings, n_jobs=n_jobs, bootstrap_memory_limit=bootstrap_memory_limit)
+    assert riveter.get_score_totals() == pytest.approx(expected.get_score_totals())
+    assert riveter.persona_sd_dict == pytest.approx(expected.persona_sd_dict)
+
+    expected = train_stub(texts[:30], text_ids[:30])
+    expected.rescore(**settings)
+    riveter.remove(text_ids[30:], **settings, n_jobs=n_jobs, bootstrap_memory_limit=bootstrap_memory_limit)
+    assert riveter.get_score_totals() == pytest.approx(expected.get_score_totals())
+    assert riveter.persona_sd_dict == pytest.approx(expected.persona_sd_dict)
+
+
+def test_coref_windows(corpus):
+    # The stub coref clusters the mentions with the same root word, so jones and the nurse each have a cluster
+    # that spans the ~190 tokens of the text, across several 40 token windows
+    text = 'Doctor Jones helped the nurse. ' + ' '.join(['Jones called the nurse. The nurse thanked Jones.'] * 15)
+    unwindowed = train_cached([text], ['doc'], None)
+    assert unwindowed.stats.counters['clusters'] == 2
+
+    # The windows' clusters share the mentions in the overlaps, so they are merged into the clusters of the whole text
+    windowed = train_cached([text], ['doc'], None, coref_window_size=40, coref_window_overlap=16)
+    assert windowed.stats.counters['clusters'] == 2
+    assert_same_results(windowed, unwindowed, ['doc'])
+
+    # Without an overlap, each window has clusters of its own, but every mention is still counted once
+    no_overlap = train_cached([text], ['doc'], None, coref_window_size=40, coref_window_overlap=0)
+    assert no_overlap.stats.counters['clusters'] > 2
+    assert dict(no_overlap.get_persona_counts()) == dict(unwindowed.get_persona_counts()) == {'jones': 31, 'nurse': 31}
+
+    # A window larger than the document is the same as not using windows
+    texts, text_ids = corpus
+    assert_same_results(train_cached(texts, text_ids, None, coref_window_size=10**6), train_cached(texts, text_ids, None), text_ids)
+
+
+def write_corpus(path, texts, text_ids):
+    df = pd.DataFrame({'id': text_ids, 'text': texts, 'other': 0})
+    if path.suffix == '.jsonl':
+        df.to_json(path, orient='records', lines=True)
+    elif path.suffix == '.parquet':
+        df.to_parquet(path)
+    else:
+        df.to_csv(path, sep=('\t' if path.suffix == '.tsv' else ','), index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize('extension', ['.csv', '.tsv', '.jsonl', '.parquet'])
+def test_read_corpus(corpus, tmp_path, extension):
+    if extension == '.parquet':
+        pytest.importorskip('pyarrow')
+    texts, text_ids = corpus
+    path = write_corpus(tmp_path / ('corpus' + extension), texts + [None], text_ids + ['missing'])
+
+    # Missing texts are read as empty strings
+    assert list(read_corpus(path, 'text', 'id', chunksize=7)) == list(zip(texts + [''], text_ids + ['missing']))
+
+    with pytest.raises(ValueError):
+        list(read_corpus(str(tmp_path / 'corpus.txt'), 'text', 'id'))
+
+
+def test_train_from_file(corpus, tmp_path):
+    texts, text_ids = corpus
+    path = write_corpus(tmp_path / 'corpus.csv', texts, text_ids)
+    expected = train_stub(texts, text_ids)
+
+    riveter = Riveter(model_name=STUB_MODEL, coref_model_name=STUB_COREF_MODEL)
+    riveter.progress_bar = None
+    riveter.load_sap_lexicon('power')
+    riveter.train_from_file(path, 'text', 'id', chunksize=7)
+    assert riveter.texts is None
+    assert riveter.corpus_source == (path, 'text', 'id')
+    # The texts of get_documents_for_verb() and get_documents_for_persona() are read from the file
+    assert_same_results(riveter, expected, text_ids)
+
+    # Saved without the texts, the corpus file is still where they are read from
+    store_path = str(tmp_path / 'riveter')
+    riveter.save(store_path, keep_texts=False)
+    opened = Riveter.open(store_path)
+    assert opened.corpus_source == (path, 'text', 'id')
+    assert_same_results(opened, expected, text_ids)
+    assert_same_results(Riveter(filename=store_path), expected, text_ids)
+
+    # A Riveter trained on a list of texts and saved without them has no texts to return
+    expected.save(store_path, keep_texts=False)
+    opened = Riveter.open(store_path)
+    verb = next(_verb for _persona, _verb in opened.count_nsubj_for_doc(text_ids[0]))
+    ids, texts_for_verb = opened.get_documents_for_verb(verb)
+    assert ids == expected.get_documents_for_verb(verb)[0]
+    assert texts_for_verb is None
+
+
+def test_pagination(corpus, tmp_path):
+    texts, text_ids = corpus
+    riveter = train_stub(texts, text_ids)
+    store_path = str(tmp_path / 'riveter')
+    riveter.save(store_path)
+
+    # The verb and persona that are in the most documents
+    verbs = {_verb for _id in text_ids for _persona, _verb in riveter.count_nsubj_for_doc(_id)}
+    verb = max(sorted(verbs), key=lambda _verb: len(riveter.get_documents_for_verb(_verb)[0]))
+    persona = max(sorted(riveter.get_score_totals()), key=lambda _persona: len(riveter.get_documents_for_persona(_persona)[0]))
+    for _riveter in [riveter, Riveter.open(store_path)]:
+        for _get_documents, _key in [(_riveter.get_documents_for_verb, verb), (_riveter.get_documents_for_persona, persona)]:
+            ids, texts_for_key = _get_documents(_key)
+            n_docs = len(ids)
+            assert n_docs > 3
+
+            pages = [_get_documents(_key, offset=_offset, limit=3) for _offset in range(0, n_docs, 3)]
+            assert [_id for _ids, _ in pages for _id in _ids] == ids
+            assert [_text for _, _texts in pages for _text in _texts] == texts_for_key
+
+            assert _get_documents(_key, offset=2, limit=None) == (ids[2:], texts_for_key[2:])
+            assert _get_documents(_key, offset=n_docs - 1, limit=3) == (ids[-1:], texts_for_key[-1:])
+            assert _get_documents(_key, offset=n_docs) == ([], [])
+            assert _get_documents(_key, offset=n_docs + 10, limit=3) == ([], [])
+            assert _get_documents(_key, limit=0) == ([], [])
+            assert _get_documents('not-a-' + _key) == ([], [])
+
+
+def test_lexicon_cache(tmp_path):
+    path = str(tmp_path / 'lexicon.csv')
+    cache_path = str(tmp_path / 'lexicon.npz')
+    pd.DataFrame({'verb': ['help', 'call'], 'agent': [1, -1], 'theme': [-1, 0], 'agent2': [0.5, 0.5], 'theme2': [0, 1]}).to_csv(path, index=False)
+
+    lexicon = Lexicon.read_table(path, 'verb', 'agent', 'theme', sep=',', cache_path=cache_path)
+    assert lexicon['help'] == {'agent': 1, 'theme': -1}
+    assert lexicon['not-a-verb'] == {'agent': 0, 'theme': 0}
+
+    # The cache is read instead of the file while it is newer than the file
+    pd.DataFrame({'verb': ['help'], 'agent': [0], 'theme': [0], 'agent2': [2], 'theme2': [-2]}).to_csv(path, index=False)
+    os.utime(path, (0, 0))
+    assert Lexicon.read_table(path, 'verb', 'agent', 'theme', sep=',', cache_path=cache_path)['call'] == {'agent': -1, 'theme': 0}
+
+    # A newer file, other columns or another separator aren't read from the cache
+    os.utime(path)
+    os.utime(cache_path, (0, 0))
+    assert Lexicon.read_table(path, 'verb', 'agent', 'theme', sep=',', cache_path=cache_path)['call'] == {'agent': 0, 'theme': 0}
+    assert Lexicon.read_table(path, 'verb', 'agent2', 'theme2', sep=',', cache_path=cache_path)['help'] == {'agent': 2, 'theme': -2}
+    with pytest.raises(KeyError):
+        Lexicon.read_table(path, 'verb', 'agent2', 'theme2', sep='\t', cache_path=cache_path)
+
+
+def train_dimensions(texts, text_ids, dimensions):
+    riveter = Riveter(model_name=STUB_MODEL, coref_model_name=STUB_COREF_MODEL)
+    riveter.progress_bar = None
+    riveter.load_lexicon_dimensions(dimensions)
+    riveter.train(texts, text_ids)
+    return riveter
+
+
+def test_lexicon_dimensions(corpus):
+    # Scoring several dimensions from one extraction gives the same scores as scoring each of them on its own
+    texts, text_ids = corpus
+    dimensions = ['power', 'agency', 'effect']
+    riveter = train_dimensions(texts, text_ids, dimensions)
+    score_matrix = riveter.get_score_matrix()
+    assert list(score_matrix.columns) == dimensions
+
+    for _dimension in dimensions:
+        _single = train_dimensions(texts, text_ids, [_dimension])
+        for _frequency_threshold in [0, 2]:
+            _expected = _single.get_score_totals(_frequency_threshold, dimension=_dimension)
+            assert _expected
+            assert riveter.get_score_totals(_frequency_threshold, dimension=_dimension) == pytest.approx(_expected)
+        _column = score_matrix[_dimension].dropna()
+        assert _column.to_dict() == pytest.approx(_single.get_score_matrix()[_dimension].to_dict())
+
+    assert riveter.get_score_totals() == pytest.approx(train_dimensions(texts, text_ids, ['power']).get_score_totals())
+
+
+def train_custom_lexicon(tmp_path, texts, text_ids, lexicon_rows, **kwargs):
+    path = str(tmp_path / 'lexicon.tsv')
+    pd.DataFrame(lexicon_rows, columns=['verb', 'agent', 'theme']).to_csv(path, sep='\t', index=False)
+    riveter = Riveter(model_name=STUB_MODEL, coref_model_name=STUB_COREF_MODEL)
+    riveter.progress_bar = None
+    riveter.load_custom_lexicon(path, 'verb', 'agent', 'theme')
+    riveter.train(texts, text_ids, **kwargs)
+    return riveter
+
+
+def test_phrasal_verbs(tmp_path):
+    text = 'The soldier gave up the fight. The nurse apologized to the doctor. Mary called out to the doctor.'
+    persona_patterns_dict = {_persona: _persona for _persona in ['soldier', 'nurse', 'doctor', 'mary']}
+    lexicon_rows = [('give up', -1, 1), ('give', 1, 0), ('apologize to', 1, -1), ('call', 0, 0.5)]
+
+    riveter = train_custom_lexicon(tmp_path, [text], ['doc'], lexicon_rows, persona_patterns_dict=persona_patterns_dict, phrasal_verbs=True)
+    assert riveter.count_nsubj_for_doc('doc') == {('soldier', 'give up'): 1, ('nurse', 'apologize to'): 1, ('mary', 'call out to'): 1}
+    assert riveter.count_dobj_for_doc('doc') == {('doctor', 'apologize to'): 1, ('doctor', 'call out to'): 1}
+    # "call out to" isn't in the lexicon, so it is scored as its head verb "call"; the doctor scores (-1 + 0.5) / 2
+    assert riveter.get_scores_for_doc('doc') == pytest.approx({'soldier': -1, 'nurse': 1, 'doctor': -0.25, 'mary': 0})
+    assert riveter.count_scored_verbs_for_doc('doc') == {'soldier': 1, 'nurse': 1, 'doctor': 2, 'mary': 1}
+
+    # Without phrasal verbs, only the head verbs are extracted, and "apologize" isn't in the lexicon
+    riveter = train_custom_lexicon(tmp_path, [text], ['doc'], lexicon_rows, persona_patterns_dict=persona_patterns_dict)
+    assert riveter.count_nsubj_for_doc('doc') == {('soldier', 'give'): 1, ('nurse', 'apologize'): 1, ('mary', 'call'): 1}
+    assert riveter.get_scores_for_doc('doc') == pytest.approx({'soldier': 1, 'doctor': 0.25, 'mary': 0})
+
+
+def test_normalize_lexicon(tmp_path):
+    text = 'Mary abandoned the plan. The soldier gave up the fight. The nurse agonized over the letter.'
+    persona_patterns_dict = {_persona: _persona for _persona in ['mary', 'soldier', 'nurse']}
+    # "abandon" is already in lemma form, so it keeps its scores over "abandoned"
+    lexicon_rows = [('abandoned', 5, 5), ('abandon', 1, -1), ('gave up', -1, 1), ('Agonized over', 0.5, 0)]
+
+    riveter = train_custom_lexicon(tmp_path, [text], ['doc'], lexicon_rows, persona_patterns_dict=persona_patterns_dict, phrasal_verbs=True)
+    riveter.normalize_lexicon(cache_path=str(tmp_path / 'lemmas.npz'))
+    assert sorted(riveter.verb_score_dict) == ['abandon', 'agonize over', 'give up']
+    assert riveter.verb_score_dict['abandon'] == {'agent': 1, 'theme': -1}
+
+    riveter.rescore()
+    assert riveter.get_scores_for_doc('doc') == pytest.approx({'mary': 1, 'soldier': -1, 'nurse': 0.5})
+
+    # The lemmas are read from the cache the second time
+    riveter = train_custom_lexicon(tmp_path, [text], ['doc'], lexicon_rows, persona_patterns_dict=persona_patterns_dict, phrasal_verbs=True)
+    riveter.normalize_lexicon(cache_path=str(tmp_path / 'lemmas.npz'))
+    assert sorted(riveter.verb_score_dict) == ['abandon', 'agonize over', 'give up']
+
+
+def test_stats(corpus, tmp_path):
+    texts, text_ids = corpus
+    events = []
+    riveter = Riveter(model_name=STUB_MODEL, coref_model_name=STUB_COREF_MODEL)
+    riveter.progress_bar = None
+    riveter.load_sap_lexicon('power')
+    stats = riveter.enable_stats(callbacks=[lambda _event, _stats: events.append((_event, _stats.to_dict()))])
+    assert riveter.stats is stats
+
+    # train() is reported once, with extract() and rescore() timed as its sub-entries
+    riveter.train(texts[:30], text_ids[:30])
+    assert [_event for _event, _ in events] == ['train']
+    timers = events[0][1]['timers']
+    assert 'extract' not in timers and 'rescore' not in timers
+    assert timers['train'] >= timers['train.extract'] + timers['train.rescore']
+    assert timers['train.extract'] >= timers['parse']
+    assert stats.counters['documents'] == stats.counters['parsed_documents'] == 30
+    assert stats.counters['tokens'] > 0
+    assert 0 < stats.get_lexicon_hit_rate() <= 1
+
+    riveter.update(texts[30:], text_ids[30:], num_bootstraps=10, random_seed=0)
+    riveter.remove(text_ids[:5])
+    riveter.rescore()
+    assert [_event for _event, _ in events] == ['train', 'update', 'remove', 'rescore']
+    assert {'update', 'update.rescore', 'remove', 'rescore'} <= set(stats.timers)
+    assert stats.counters['documents'] == len(texts)
+
+    # A method that raises isn't reported, and doesn't leave its name on the stack
+    with pytest.raises(ValueError):
+        riveter.update(texts[10:11], text_ids[10:11])
+    assert stats.calls == []
+    assert len(events) == 4
+
+    stats.reset()
+    assert stats.to_dict() == {'timers': {}, 'counters': {}, 'lexicon_hit_rate': None}
+
+    # The callbacks aren't pickled
+    path = str(tmp_path / 'riveter.pkl')
+    riveter.save(path)
+    assert Riveter(filename=path).stats.callbacks == []
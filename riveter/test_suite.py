@@ -1,67 +1,60 @@
 # Can run with:
 # "pip install pytest"
 # "pytest test_suite.py"
+#
+# The tests that parse texts need the en_core_web_sm and en_coreference_web_trf models (see the README),
+# and are skipped if they aren't installed.
 
-from main2 import ConnoFramer
-import pandas
-import os
+import spacy
+import pytest
+
+from riveter import Riveter, DEFAULT_MODEL, DEFAULT_COREF_MODEL
+
+requires_models = pytest.mark.skipif(not (spacy.util.is_package(DEFAULT_MODEL) and spacy.util.is_package(DEFAULT_COREF_MODEL)),
+                                     reason=f'needs the {DEFAULT_MODEL} and {DEFAULT_COREF_MODEL} models')
+
+
+def train_one(text, lexicon='power'):
+    riveter = Riveter()
+    riveter.load_sap_lexicon(lexicon)
+    riveter.train([text], [0])
+    return riveter
 
-def test_get_lemma():
-    framer = ConnoFramer()
-    assert framer._ConnoFramer__get_lemma_spacy("accompanies") == "accompany"
-    assert framer._ConnoFramer__get_lemma_spacy("trying") == "try"
 
 def test_load_power():
-    framer = ConnoFramer()
-    framer.load_lexicon('power')
+    riveter = Riveter()
+    riveter.load_sap_lexicon('power')
 
-    assert len(framer.verb_score_dict) == 1716
-    assert framer.verb_score_dict["abolish"]["agent"] == 1
-    assert framer.verb_score_dict["abolish"]["theme"] == -1
-    assert framer.verb_score_dict["accompany"]["agent"] == -1
-    assert framer.verb_score_dict["address"]["agent"] == 0
-    assert framer.verb_score_dict["address"]["theme"] == 0
+    assert len(riveter.verb_score_dict) == 1736
+    assert riveter.verb_score_dict["abolish"]["agent"] == 1
+    assert riveter.verb_score_dict["abolish"]["theme"] == -1
+    assert riveter.verb_score_dict["accompany"]["agent"] == -1
+    assert riveter.verb_score_dict["address"]["agent"] == 0
+    assert riveter.verb_score_dict["address"]["theme"] == 0
+    # Verbs that aren't in the lexicon score 0
+    assert riveter.verb_score_dict["not-a-verb"] == {"agent": 0, "theme": 0}
 
 
 def test_load_agency():
-    framer = ConnoFramer()
-    framer.load_lexicon('agency')
-
-    assert len(framer.verb_score_dict) == 2109
-    assert framer.verb_score_dict["abolish"]["agent"] == 1
-    assert framer.verb_score_dict["abolish"]["theme"] == 0
-    assert framer.verb_score_dict["accompany"]["agent"] == 0
-    assert framer.verb_score_dict["accompany"]["theme"] == 0
-    assert framer.verb_score_dict["address"]["agent"] == -1
-    assert framer.verb_score_dict["address"]["theme"] == 0
-
-def test_getPeopleClusters():
-    import spacy
-    nlp = spacy.load('en_core_web_sm')
-    import neuralcoref
-    nlp.add_pipe(neuralcoref.NeuralCoref(nlp.vocab,blacklist=False),name="neuralcoref")
-
-    text = "I accompanied my friend Brian Smith to the store, because he had abandoned his bike there."
-    doc = nlp(text)
-    
-    framer = ConnoFramer()
-    people = framer._ConnoFramer__getPeopleClusters(doc, peopleWords=["i"])
-
-    assert len(people) == 2
-    if people[0].main.text == "Brian Smith":
-        assert people[1].main.text == "I"
-    else:
-        assert people[1].main.text == "Brian Smith"
-        assert people[0].main.text == "I"
+    riveter = Riveter()
+    riveter.load_sap_lexicon('agency')
 
+    assert len(riveter.verb_score_dict) == 2145
+    assert riveter.verb_score_dict["abolish"]["agent"] == 1
+    assert riveter.verb_score_dict["abolish"]["theme"] == 0
+    assert riveter.verb_score_dict["accompany"]["agent"] == 0
+    assert riveter.verb_score_dict["accompany"]["theme"] == 0
+    assert riveter.verb_score_dict["address"]["agent"] == -1
+    assert riveter.verb_score_dict["address"]["theme"] == 0
 
 
+@requires_models
 def test_parseAndExtractFrames():
-    framer = ConnoFramer()
-
     text = "I accompanied Brian Smith to the store, because he had abandoned his bike there. Brian also absorbs lots of complaints, \
     so I address him as doctor. I also have a friend named Brian Jones. Brian Jones abuses free food."
-    nsubj_verb_count_dict, dobj_verb_count_dict = framer._ConnoFramer__parseAndExtractFrames(text)
+    riveter = train_one(text)
+    nsubj_verb_count_dict = riveter.count_nsubj_for_doc(0)
+    dobj_verb_count_dict = riveter.count_dobj_for_doc(0)
     assert len(nsubj_verb_count_dict) == 6
     assert len(dobj_verb_count_dict) == 2
     assert ("brian smith", "abandon") in nsubj_verb_count_dict
@@ -73,28 +66,23 @@ def test_parseAndExtractFrames():
     # assert ("have", "brian jones") in dobj_verb_count_dict
 
 # Make sure it doesn't crash with empty text
+@requires_models
 def test_noChains():
-    framer = ConnoFramer()
-
-    text = "There's no tags here."
-    nsubj_verb_count_dict, dobj_verb_count_dict = framer._ConnoFramer__parseAndExtractFrames(text)
-    assert len(nsubj_verb_count_dict) == 0
-    assert len(dobj_verb_count_dict) == 0
+    riveter = train_one("There's no tags here.")
+    assert len(riveter.count_nsubj_for_doc(0)) == 0
+    assert len(riveter.count_dobj_for_doc(0)) == 0
 
-    text = ""
-    nsubj_verb_count_dict, dobj_verb_count_dict = framer._ConnoFramer__parseAndExtractFrames(text)
-    assert len(nsubj_verb_count_dict) == 0
-    assert len(dobj_verb_count_dict) == 0
+    riveter = train_one("")
+    assert len(riveter.count_nsubj_for_doc(0)) == 0
+    assert len(riveter.count_dobj_for_doc(0)) == 0
 
+@requires_models
 def test_score_document():
-    framer = ConnoFramer()
-    framer.load_lexicon('power')
-
     text = "I accompanied Brian Smith to the store, because he had abandoned his bike there. Brian also absorbs lots of complaints, \
     so I address him as doctor. I also unearthed a friend named Brian Jones. Brian Jones abuses free food."
-
-    _nsubj_verb_count_dict, _dobj_verb_count_dict = framer._ConnoFramer__parseAndExtractFrames(text)
-    persona_score_dict, persona_scored_verbs_dict  = framer._ConnoFramer__score_document(_nsubj_verb_count_dict, _dobj_verb_count_dict)
+    riveter = train_one(text)
+    persona_score_dict = riveter.id_persona_score_dict[0]
+    persona_scored_verbs_dict = riveter.count_scored_verbs_for_doc(0)
 
     # I: accompany, address, have
     # unearthed is not in the lexicon, address is power_equal, accompany is power_theme
@@ -111,15 +99,11 @@ def test_score_document():
     assert persona_score_dict["brian jones"] == 1
     assert persona_scored_verbs_dict["brian jones"] == 1
 
+@requires_models
 def test_get_persona_counts_per_document():
-    framer = ConnoFramer()
-    framer.load_lexicon('power')
-
     text = "I accompanied Brian Smith to the store, because he had abandoned his bike there. Brian also absorbs lots of complaints, \
     so I address him as doctor. I also have a friend named Brian Jones. Brian Jones abuses free food."
-
-    _nsubj_verb_count_dict, _dobj_verb_count_dict = framer._ConnoFramer__parseAndExtractFrames(text)
-    persona_count_dict = framer._ConnoFramer__get_persona_counts_per_document(_nsubj_verb_count_dict, _dobj_verb_count_dict)
+    persona_count_dict = train_one(text).count_personas_for_doc(0)
 
     # I: accompany, address, have
     assert persona_count_dict["i"] == 3
@@ -131,48 +115,50 @@ def test_get_persona_counts_per_document():
 
 # Other components test parts of the train pipeline, this one tests it in full
 # It also inadverntly tests having pronoun direct objects (e.g. me)
+@requires_models
 def test_train():
-    framer = ConnoFramer()
-    framer.load_lexicon('power')
+    riveter = Riveter()
+    riveter.load_sap_lexicon('power')
 
     texts = ["I accompanied Brian Smith to the store, because he had abandoned his bike there. Brian also absorbs lots of complaints, \
     so I address him as doctor. I also have a friend named Brian Jones. Brian Jones abuses free food.",
     "Brian Smith accompanies me"]
 
-    framer.train(texts, [0,1])
-    persona_score_dict = framer.get_score_totals()
+    riveter.train(texts, [0,1])
+    # get_score_totals() is normalized by the persona counts, so compare the sums it is computed from
+    persona_score_dict = riveter.persona_score_sum_dict
 
     # These are same values as previous test with the added sentence: Brian Smith accompanies me, which is +1 i and -1 brian smith
     assert persona_score_dict["i"] == 0
     assert persona_score_dict["brian smith"] == 2
     assert persona_score_dict["brian jones"] == 1
 
-    persona_count_dict_1 = framer.count_personas_for_doc(0)
+    persona_count_dict_1 = riveter.count_personas_for_doc(0)
     assert persona_count_dict_1["i"] == 3
     assert persona_count_dict_1["brian smith"] == 4
     assert persona_count_dict_1["brian jones"] == 1
-        
-    persona_count_dict_1 = framer.count_scored_verbs_for_doc(0)
+
+    persona_count_dict_1 = riveter.count_scored_verbs_for_doc(0)
     assert persona_count_dict_1["i"] == 2 # have is not in lex
 
-    persona_count_dict_2 = framer.count_personas_for_doc(1)
+    persona_count_dict_2 = riveter.count_personas_for_doc(1)
     assert persona_count_dict_2["i"] == 1
     assert persona_count_dict_2["brian smith"] == 1
     assert "brian jones" not in persona_count_dict_2
-    
 
-    persona_score_dict_1 = framer.get_scores_for_doc(0)
+
+    persona_score_dict_1 = riveter.id_persona_score_dict[0]
     assert persona_score_dict_1["i"] == -1
     assert persona_score_dict_1["brian smith"] == 3
     assert persona_score_dict_1["brian jones"] == 1
 
-    persona_score_dict_2 = framer.get_scores_for_doc(1)
+    persona_score_dict_2 = riveter.id_persona_score_dict[1]
     assert persona_score_dict_2["i"]== 1
     assert persona_score_dict_2["brian smith"] == -1
     assert "brian jones" not in persona_score_dict_2
 
-    nsubj_doc1 = framer.count_nsubj_for_doc(0)
-    dobj_doc1 = framer.count_dobj_for_doc(0)
+    nsubj_doc1 = riveter.count_nsubj_for_doc(0)
+    dobj_doc1 = riveter.count_dobj_for_doc(0)
     assert len(nsubj_doc1) == 6
     assert len(dobj_doc1) == 2
     assert ("brian smith", "abandon") in nsubj_doc1
@@ -180,8 +166,8 @@ def test_train():
     assert ("brian smith", "accompany") in dobj_doc1
     assert ("brian smith", "address") in dobj_doc1
 
-    nsubj_doc2 = framer.count_nsubj_for_doc(1)
-    dobj_doc2 = framer.count_dobj_for_doc(1)
+    nsubj_doc2 = riveter.count_nsubj_for_doc(1)
+    dobj_doc2 = riveter.count_dobj_for_doc(1)
     assert len(nsubj_doc2) == 1
     assert len(dobj_doc2) == 1
     assert ("brian smith", "accompany") in nsubj_doc2
@@ -191,41 +177,38 @@ def test_evaluate_verb_coverage():
     # TODO
     pass
 
+@requires_models
 def test_people_noun_chunk():
     # This is the example that was causing a crash, noun chunk is the last value in string
-    text = "Hassan worked hard and quickly rose through the ranks. Hassan"
-    framer = ConnoFramer()
-    framer._ConnoFramer__parseAndExtractFrames(text)
+    train_one("Hassan worked hard and quickly rose through the ranks. Hassan")
 
 # Check that "I" is getting considered as a person (even though it is capitalized)
+@requires_models
 def test_find_people():
     text = "My name is Francis and I am originally from Vietnam. I came to America when I was just a young man."
-
-    framer = ConnoFramer()
-    subj_verb_count_dict, dobj_verb_count_dict = framer._ConnoFramer__parseAndExtractFrames(text)
-    assert len(subj_verb_count_dict) == 2
+    assert len(train_one(text).count_nsubj_for_doc(0)) == 2
 
 
 # This uses the same example as the demo. Use it to make sure demo isn't broken
+@requires_models
 def test_demo():
     example_stories = ["I was just thinking about walking down the street, when my shoelace snapped. I had to call my doctor to pick me up. I felt so bad I also called my friend Katie, who came in her car. She was a lifesaver. My friend Jack is nice.",
                    "My doctor fixed my shoe. I thanked him. Then Susan arrived. Now she is calling the doctor too."]
     text_ids = [0, 1]
-    framer = ConnoFramer()
-    framer.load_sap_lexicon('power')
-    framer.train(example_stories, text_ids)
+    riveter = Riveter()
+    riveter.load_sap_lexicon('power')
+    riveter.train(example_stories, text_ids)
 
     # In the second document, "I" should get mapped to "i" instead of "my"
-    assert ('i', 'thank') in framer.id_nsubj_verb_count_dict[1]
-    assert ('my', 'thank') not in framer.id_nsubj_verb_count_dict[1]
+    assert ('i', 'thank') in riveter.id_nsubj_verb_count_dict[1]
+    assert ('my', 'thank') not in riveter.id_nsubj_verb_count_dict[1]
 
     # I think (0), I have (+1), I feel (0), I call (-1), pick me (-1), but "have" doesn't lemmatize
-    assert framer.id_persona_score_dict[0]["i"] == -2
-    assert framer.id_persona_scored_verb_dict[0]["i"] == 4
+    assert riveter.id_persona_score_dict[0]["i"] == -2
+    assert riveter.id_persona_scored_verb_dict[0]["i"] == 4
 
     # I thank (-1)
-    assert framer.id_persona_score_dict[1]["i"] == -1
-    # print(framer.id_persona_scored_verb_dict[0]["i"])
-    # print(framer.id_persona_scored_verb_dict[1]["i"])
-    score_totals = framer.get_score_totals()
-    assert score_totals["i"] == -3
\ No newline at end of file
+    assert riveter.id_persona_score_dict[1]["i"] == -1
+    # print(riveter.id_persona_scored_verb_dict[0]["i"])
+    # print(riveter.id_persona_scored_verb_dict[1]["i"])
+    assert riveter.persona_score_sum_dict["i"] == -3